@@ -0,0 +1,258 @@
+## Gravação em lote dos logs de empréstimo, devolução e exclusão
+#
+# Por padrão (AUDITORIA_MODO=banco) os logs são gravados pelos triggers de
+# `borrowals`, dentro da mesma transação da operação: cada empréstimo paga
+# a montagem do texto e um INSERT a mais em `logs` (e seus índices) com a
+# trava de escrita do SQLite presa.
+#
+# Nos outros modos, a API desliga essa parte dos triggers (audit_config,
+# ver app/migracoes.py) e o router de empréstimos enfileira os eventos após
+# o commit. Uma tarefa de fundo grava a fila em lotes, em uma transação por
+# lote:
+#   - rapido:  a requisição segue assim que o evento entra na fila, que é
+#              gravada quando junta AUDITORIA_LOTE eventos ou a cada
+#              AUDITORIA_INTERVALO_MS;
+#   - duravel: a requisição só responde depois que o log foi gravado; cada
+#              lote leva os eventos que chegaram durante a gravação anterior.
+# A fila é limitada (AUDITORIA_FILA): cheia, a requisição espera por espaço
+# em vez de descartar eventos, e as esperas entram nas estatísticas. No
+# shutdown a fila é gravada antes de o pool ser fechado.
+#
+# O modo vale para o banco inteiro: todos os workers devem usar o mesmo, e
+# escritas feitas fora da API enquanto ela roda em rapido/duravel não geram
+# log.
+
+import asyncio
+import os
+import time
+from datetime import date, datetime, timezone
+
+from sqlalchemy import text
+
+from app.database import logger
+from app.escrita import transacao_de_escrita
+
+AUDITORIA_MODO = os.environ.get("AUDITORIA_MODO", "banco")
+AUDITORIA_LOTE = int(os.environ.get("AUDITORIA_LOTE", 500))
+AUDITORIA_INTERVALO_MS = float(os.environ.get("AUDITORIA_INTERVALO_MS", 200))
+AUDITORIA_FILA = int(os.environ.get("AUDITORIA_FILA", 10_000))
+
+MODOS = ("banco", "rapido", "duravel")
+
+# Tempo máximo para gravar o que restou na fila durante o shutdown
+TIMEOUT_ENCERRAMENTO_S = 10
+
+_INSERIR_LOGS = text(
+    "INSERT INTO logs (action, description, timestamp)"
+    " VALUES (:action, :description, :timestamp)"
+)
+_LOGS_PELA_APLICACAO = text(
+    "UPDATE audit_config SET value = :valor WHERE name = 'logs_by_app'"
+)
+
+
+class Auditoria:
+    """Fila de logs de empréstimo gravada em lote por uma tarefa de fundo"""
+
+    def __init__(self, modo: str, tamanho_lote: int, intervalo_s: float, capacidade):
+        if modo not in MODOS:
+            raise ValueError(f"AUDITORIA_MODO deve ser um de {MODOS}, não '{modo}'")
+        self.modo = modo
+        self._tamanho_lote = tamanho_lote
+        self._intervalo_s = intervalo_s
+        self._capacidade = capacidade
+        self._fila = None
+        self._lote_pronto = None
+        self._tarefa = None
+        self._contadores = {
+            "enfileirados": 0,
+            "gravados": 0,
+            "lotes": 0,
+            "falhas": 0,
+            "perdidos": 0,
+            "esperas_fila_cheia": 0,
+            "espera_total_ms": 0.0,
+            "profundidade_max": 0,
+            "ultimo_lote_ms": None,
+        }
+
+    async def iniciar(self):
+        """Liga ou desliga os logs dos triggers conforme o modo e sobe a tarefa"""
+        async with transacao_de_escrita() as conn:
+            await conn.execute(
+                _LOGS_PELA_APLICACAO, {"valor": int(self.modo != "banco")}
+            )
+        if self.modo == "banco":
+            return
+        self._fila = asyncio.Queue(self._capacidade)
+        self._lote_pronto = asyncio.Event()
+        self._tarefa = asyncio.create_task(self._gravar_continuamente())
+        logger.info(f"📝 Logs de empréstimo gravados em lote (modo {self.modo})")
+
+    async def encerrar(self):
+        """Grava os eventos ainda na fila e para a tarefa"""
+        if self._tarefa is None:
+            return
+        tarefa, self._tarefa = self._tarefa, None
+        await self._fila.put(None)  # marca o fim da fila
+        self._lote_pronto.set()
+        try:
+            await asyncio.wait_for(tarefa, TIMEOUT_ENCERRAMENTO_S)
+        except asyncio.TimeoutError:
+            self._contadores["perdidos"] += self._fila.qsize()
+            logger.error(
+                f"❌ {self._fila.qsize()} logs de empréstimo não gravados no shutdown"
+            )
+
+    @property
+    def pela_aplicacao(self):
+        """Se a API (e não os triggers) grava os logs de empréstimo"""
+        return self.modo != "banco"
+
+    # Eventos (mesmos textos dos triggers de borrowals)
+
+    async def emprestimo(self, book_id, borrower_id, return_date=None):
+        devolucao = return_date.isoformat() if return_date else "Pendente"
+        await self._registrar(
+            "BORROW",
+            f"Livro ID {book_id} | Usuário ID {borrower_id} | Devolução: {devolucao}",
+        )
+
+    async def devolucao(self, book_id, borrower_id, borrow_date: date, return_date):
+        atraso = max((return_date - borrow_date).days - 30, 0)
+        await self._registrar(
+            "RETURN",
+            f"Livro ID {book_id} | Usuário ID {borrower_id} | Atraso: {atraso} dias",
+        )
+
+    async def exclusao(self, emprestimo_id):
+        await self._registrar(
+            "DELETE",
+            f"Empréstimo ID {emprestimo_id} excluído | Estoque ajustado (+1)",
+        )
+
+    def estatisticas(self):
+        lotes = self._contadores["lotes"]
+        return {
+            "modo": self.modo,
+            "profundidade": self._fila.qsize() if self._fila else 0,
+            "capacidade": self._capacidade,
+            "tamanho_lote": self._tamanho_lote,
+            "intervalo_ms": self._intervalo_s * 1000,
+            **self._contadores,
+            "espera_total_ms": round(self._contadores["espera_total_ms"], 3),
+            "tamanho_medio_lote": (
+                round(self._contadores["gravados"] / lotes, 1) if lotes else None
+            ),
+        }
+
+    async def _registrar(self, action, description):
+        if self.modo == "banco":
+            return  # os triggers já gravaram o log
+        if self._tarefa is None:
+            self._contadores["perdidos"] += 1
+            logger.error(f"❌ Log {action} descartado: gravação em lote parada")
+            return
+
+        gravado = (
+            asyncio.get_running_loop().create_future()
+            if self.modo == "duravel"
+            else None
+        )
+        evento = {
+            "action": action,
+            "description": description,
+            # Mesmo formato do CURRENT_TIMESTAMP usado pelos triggers
+            "timestamp": datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S"),
+        }
+
+        try:
+            self._fila.put_nowait((evento, gravado))
+        except asyncio.QueueFull:
+            inicio = time.perf_counter()
+            self._contadores["esperas_fila_cheia"] += 1
+            await self._fila.put((evento, gravado))
+            self._contadores["espera_total_ms"] += (time.perf_counter() - inicio) * 1000
+
+        self._contadores["enfileirados"] += 1
+        profundidade = self._fila.qsize()
+        self._contadores["profundidade_max"] = max(
+            self._contadores["profundidade_max"], profundidade
+        )
+        if profundidade >= self._tamanho_lote:
+            self._lote_pronto.set()
+        if gravado is not None:
+            await gravado
+
+    async def _gravar_continuamente(self):
+        fim = False
+        while not fim:
+            item = await self._fila.get()
+            lote = [] if item is None else [item]
+            fim = item is None
+
+            # No modo rapido espera o lote encher ou o intervalo passar. No
+            # duravel há requisições esperando: grava o que já chegou, e os
+            # eventos que chegarem durante a gravação formam o próximo lote
+            if (
+                not fim
+                and self.modo == "rapido"
+                and self._fila.qsize() < self._tamanho_lote - 1
+            ):
+                try:
+                    await asyncio.wait_for(self._lote_pronto.wait(), self._intervalo_s)
+                except asyncio.TimeoutError:
+                    pass
+            self._lote_pronto.clear()
+
+            while not fim and len(lote) < self._tamanho_lote and not self._fila.empty():
+                item = self._fila.get_nowait()
+                if item is None:
+                    fim = True
+                else:
+                    lote.append(item)
+
+            if fim:
+                # Shutdown: tudo o que ainda está na fila vai junto
+                while not self._fila.empty():
+                    item = self._fila.get_nowait()
+                    if item is not None:
+                        lote.append(item)
+            if lote:
+                await self._gravar(lote, tentativas=3 if fim else None)
+
+    async def _gravar(self, lote, tentativas=None):
+        """Grava o lote em uma transação, repetindo em caso de falha"""
+        tentativa = 0
+        while True:
+            inicio = time.perf_counter()
+            try:
+                async with transacao_de_escrita() as conn:
+                    await conn.execute(_INSERIR_LOGS, [evento for evento, _ in lote])
+                break
+            except Exception as e:
+                tentativa += 1
+                self._contadores["falhas"] += 1
+                logger.error(f"❌ Falha ao gravar {len(lote)} logs de empréstimo: {e}")
+                if tentativas is not None and tentativa >= tentativas:
+                    self._contadores["perdidos"] += len(lote)
+                    for _, gravado in lote:
+                        if gravado is not None and not gravado.done():
+                            gravado.set_exception(e)
+                    return
+                # A fila continua recebendo (até encher) enquanto o banco falha
+                await asyncio.sleep(self._intervalo_s)
+
+        self._contadores["ultimo_lote_ms"] = round(
+            (time.perf_counter() - inicio) * 1000, 3
+        )
+        self._contadores["lotes"] += 1
+        self._contadores["gravados"] += len(lote)
+        for _, gravado in lote:
+            if gravado is not None and not gravado.done():
+                gravado.set_result(None)
+
+
+auditoria = Auditoria(
+    AUDITORIA_MODO, AUDITORIA_LOTE, AUDITORIA_INTERVALO_MS / 1000, AUDITORIA_FILA
+)
@@ -0,0 +1,56 @@
+## Busca textual (FTS5) sobre o catálogo de livros
+#
+# A tabela virtual books_fts guarda título, nome do autor e nome do gênero de
+# cada livro (rowid = books.id) e é mantida pelos triggers trg_*_fts_* criados
+# em app/migracoes.py.
+
+import re
+from typing import Optional
+
+from sqlalchemy import column, func, literal_column, table, text
+
+books_fts = table("books_fts", column("rowid"))
+
+# Pesos do BM25 por coluna do índice: título, autor, gênero
+PESOS_BM25 = (10.0, 5.0, 1.0)
+
+
+def montar_consulta_fts(termos: str, coluna: Optional[str] = None) -> Optional[str]:
+    """
+    Converte o texto digitado em uma expressão MATCH segura.
+
+    Cada palavra vira um prefixo entre aspas ("dom"* "casm"*), de modo que
+    operadores e caracteres especiais do FTS5 nunca são interpretados.
+    Retorna None quando não há nenhuma palavra pesquisável.
+    """
+    palavras = re.findall(r"\w+", termos)
+    if not palavras:
+        return None
+
+    expressao = " ".join(f'"{palavra}"*' for palavra in palavras)
+    if coluna:
+        expressao = f"{coluna} : ({expressao})"
+    return expressao
+
+
+def filtro_fts(consulta: str):
+    return text("books_fts MATCH :consulta").bindparams(consulta=consulta)
+
+
+def relevancia():
+    """Pontuação BM25 (menor é mais relevante)"""
+    return func.bm25(literal_column("books_fts"), *PESOS_BM25)
+
+
+def reconstruir_indice_busca(conexao):
+    """Recria todo o conteúdo de books_fts a partir das tabelas do catálogo"""
+    conexao.exec_driver_sql("DELETE FROM books_fts")
+    resultado = conexao.exec_driver_sql("""
+        INSERT INTO books_fts (rowid, title, author, genre)
+        SELECT books.id, books.title, authors.name, genres.name
+        FROM books
+        LEFT JOIN authors ON authors.id = books.author_id
+        LEFT JOIN genres ON genres.id = books.genre_id
+        """)
+    conexao.exec_driver_sql("INSERT INTO books_fts (books_fts) VALUES ('optimize')")
+    return resultado.rowcount
@@ -0,0 +1,315 @@
+## Busca aproximada (tolerante a erros de digitação) em memória
+#
+# Cada texto indexado (título de livro ou nome de autor) é quebrado em
+# palavras normalizadas (minúsculas, sem acentos). O índice guarda:
+#   - palavra -> chaves dos textos que a contêm (array compacto)
+#   - trigrama -> palavras do vocabulário que o contêm, separadas pela
+#     quantidade de trigramas de cada palavra
+# Uma consulta expande cada palavra digitada para as palavras do vocabulário
+# com trigramas parecidos (similaridade de Jaccard) e pontua os textos pela
+# média da melhor similaridade de cada palavra da consulta.
+#
+# Por padrão a busca examina todos os textos que podem alcançar o limiar.
+# BUSCA_MAX_CANDIDATOS limita os textos examinados por busca, trocando
+# precisão por latência: eles são tomados na ordem em que foram indexados,
+# não por relevância, então com palavras comuns na consulta o resultado
+# exato pode ficar de fora.
+#
+# O índice vive no processo: com vários workers do uvicorn, cada um mantém o
+# seu, carregado na inicialização e atualizado pelas escritas que ele recebe.
+
+import heapq
+import math
+from collections import Counter
+from itertools import repeat
+import os
+import re
+import sys
+import unicodedata
+from array import array
+from typing import Optional
+
+from sqlalchemy import select
+
+from app.models.models import Autor, Livro
+
+# Permite desligar a carga dos índices na inicialização (BUSCA_APROXIMADA=0)
+HABILITADA = os.environ.get("BUSCA_APROXIMADA", "1") == "1"
+
+# Expansões de palavras da consulta guardadas entre buscas
+TAMANHO_CACHE_EXPANSOES = 4096
+
+# Textos examinados, no máximo, por busca (None: sem limite)
+MAX_CANDIDATOS = (
+    int(os.environ["BUSCA_MAX_CANDIDATOS"])
+    if os.environ.get("BUSCA_MAX_CANDIDATOS")
+    else None
+)
+
+# Listas de trigramas contadas além do mínimo na expansão: cada uma a mais
+# custa uma lista, mas descarta pela contagem candidatas que, sem ela,
+# precisariam ter os trigramas comparados um a um
+FOLGA_EXPANSAO = 2
+
+
+def normalizar(texto: str) -> list[str]:
+    """Palavras do texto em minúsculas e sem acentos"""
+    texto = texto.lower()
+    if not texto.isascii():
+        decomposto = unicodedata.normalize("NFKD", texto)
+        texto = "".join(c for c in decomposto if not unicodedata.combining(c))
+    return re.findall(r"\w+", texto)
+
+
+def trigramas(palavra: str) -> set[str]:
+    """Trigramas da palavra com bordas marcadas ("  ro", " ro", ..., "ng ")"""
+    marcada = f"  {palavra} "
+    return {marcada[i : i + 3] for i in range(len(marcada) - 2)}
+
+
+class IndiceTrigramas:
+    """Índice invertido de palavras com expansão aproximada por trigramas"""
+
+    def __init__(self, limiar_compactacao: float = 0.25):
+        self._textos: dict[int, str] = {}
+        self._palavras: dict[int, tuple[str, ...]] = {}
+        self._chaves_por_palavra: dict[str, array] = {}
+        # trigrama -> {quantidade de trigramas da palavra: palavras}
+        self._palavras_por_trigrama: dict[str, dict[int, list[str]]] = {}
+        self._frequencia_trigramas: dict[str, int] = {}
+        self._maior_palavra = 0
+        self._expansoes: dict[tuple[str, float], dict[str, float]] = {}
+        self._limiar_compactacao = limiar_compactacao
+        self._entradas = 0
+        self._obsoletas = 0
+
+    def __len__(self):
+        return len(self._textos)
+
+    @property
+    def vocabulario(self) -> int:
+        return len(self._chaves_por_palavra)
+
+    def adicionar(self, chave: int, texto: str):
+        """Indexa (ou reindexa) o texto associado à chave"""
+        if chave in self._textos:
+            self.remover(chave)
+
+        palavras = tuple(dict.fromkeys(sys.intern(p) for p in normalizar(texto)))
+        self._textos[chave] = texto
+        self._palavras[chave] = palavras
+
+        for palavra in palavras:
+            chaves = self._chaves_por_palavra.get(palavra)
+            if chaves is None:
+                chaves = self._chaves_por_palavra[palavra] = array("q")
+                self._registrar_palavra(palavra)
+            chaves.append(chave)
+        self._entradas += len(palavras)
+
+    def remover(self, chave: int):
+        """
+        Remove o texto da chave. As listas de chaves por palavra são limpas de
+        forma preguiçosa: entradas obsoletas são ignoradas nas buscas e o índice
+        é compactado quando passam de uma fração do total.
+        """
+        palavras = self._palavras.pop(chave, None)
+        self._textos.pop(chave, None)
+        if not palavras:
+            return
+
+        self._obsoletas += len(palavras)
+        if self._obsoletas > self._limiar_compactacao * max(self._entradas, 1):
+            self._compactar()
+
+    def buscar(
+        self,
+        consulta: str,
+        limiar: float = 0.4,
+        limite: int = 10,
+        max_candidatos: Optional[int] = MAX_CANDIDATOS,
+    ):
+        """
+        Retorna até `limite` tuplas (chave, texto, pontuação) com pontuação
+        >= `limiar`, da mais para a menos parecida com a consulta, entre no
+        máximo `max_candidatos` textos examinados (None: sem limite).
+        """
+        if max_candidatos is None:
+            max_candidatos = math.inf
+        palavras = list(dict.fromkeys(normalizar(consulta)))
+        if not palavras:
+            return []
+
+        expansoes = [self._expandir(palavra, limiar) for palavra in palavras]
+
+        # Cada palavra da consulta sem correspondência custa 1/n da pontuação,
+        # então um texto pode "faltar" em no máximo n * (1 - limiar) palavras.
+        # Descontadas as palavras sem nenhuma expansão, todo texto válido
+        # contém alguma das `faltas + 1` palavras de menor frequência, e só
+        # elas precisam gerar candidatos
+        tamanhos = sorted(
+            (sum(len(self._chaves_por_palavra[p]) for p in expansao), i)
+            for i, expansao in enumerate(expansoes)
+            if expansao
+        )
+        faltas = math.floor(len(palavras) * (1 - limiar) + 1e-9)
+        faltas -= len(palavras) - len(tamanhos)
+        if faltas < 0:
+            return []
+
+        # Fontes de candidatos: grupo a grupo (do mais raro ao mais comum) e,
+        # dentro do grupo, da palavra mais parecida para a menos parecida.
+        # Um texto ainda não visto só pode conter palavras de fontes ainda não
+        # percorridas, então sua pontuação não passa da soma das maiores
+        # similaridades restantes de cada grupo (mais 1 por palavra da
+        # consulta que não gera candidatos). Quando os `limite` melhores já
+        # alcançam esse teto (ou se ele fica abaixo do limiar), a busca para
+        # sem percorrer o resto das listas
+        n = len(palavras)
+        grupos = [i for _, i in tamanhos[: faltas + 1]]
+        fora = len(tamanhos) - len(grupos)
+        restante = {i: max(expansoes[i].values()) for i in grupos}
+        fontes = []
+        for i in grupos:
+            ordenadas = sorted(expansoes[i].items(), key=lambda par: -par[1])
+            for palavra_fonte, similaridade in ordenadas:
+                restante[i] = similaridade
+                teto = (sum(restante.values()) + fora) / n
+                fontes.append((teto, palavra_fonte))
+            restante[i] = 0.0
+
+        # Melhor similaridade de cada palavra da consulta no texto, sem laço
+        # em Python: max(map(expansao.get, palavras, repeat(0.0)))
+        similaridades = [expansao.get for expansao in expansoes]
+        zeros = repeat(0.0)
+        vistos = set()
+        melhores = []
+        for teto, palavra_fonte in fontes:
+            if teto < limiar or (len(melhores) == limite and melhores[0][0] >= teto):
+                break
+            if len(vistos) >= max_candidatos:
+                break
+            for chave in self._chaves_por_palavra[palavra_fonte]:
+                if chave in vistos:
+                    continue
+                if len(vistos) >= max_candidatos:
+                    break
+                vistos.add(chave)
+                palavras_texto = self._palavras.get(chave)
+                if palavras_texto is None:
+                    continue
+
+                soma = 0.0
+                for similaridade in similaridades:
+                    soma += max(map(similaridade, palavras_texto, zeros))
+                pontuacao = soma / n
+                if pontuacao < limiar:
+                    continue
+
+                item = (pontuacao, -len(palavras_texto), chave)
+                if len(melhores) < limite:
+                    heapq.heappush(melhores, item)
+                elif item > melhores[0]:
+                    heapq.heapreplace(melhores, item)
+                if len(melhores) == limite and melhores[0][0] >= teto:
+                    break
+
+        return [
+            (chave, self._textos[chave], round(pontuacao, 4))
+            for pontuacao, _, chave in sorted(melhores, reverse=True)
+        ]
+
+    def _registrar_palavra(self, palavra: str):
+        grupo = trigramas(palavra)
+        tamanho = len(grupo)
+        for trigrama in grupo:
+            self._palavras_por_trigrama.setdefault(trigrama, {}).setdefault(
+                tamanho, []
+            ).append(palavra)
+            self._frequencia_trigramas[trigrama] = (
+                self._frequencia_trigramas.get(trigrama, 0) + 1
+            )
+        self._maior_palavra = max(self._maior_palavra, tamanho)
+        # Uma palavra nova no vocabulário pode mudar expansões já calculadas
+        self._expansoes.clear()
+
+    def _expandir(self, palavra: str, limiar: float) -> dict[str, float]:
+        """Palavras do vocabulário com similaridade de trigramas >= limiar"""
+        cache = self._expansoes.get((palavra, limiar))
+        if cache is not None:
+            return cache
+
+        alvo = trigramas(palavra)
+        a = len(alvo)
+        raros = sorted(alvo, key=lambda t: self._frequencia_trigramas.get(t, 0))
+
+        # Uma palavra com b trigramas tem Jaccard >= limiar com a consulta só
+        # se limiar * a <= b <= a / limiar e se as duas compartilham pelo
+        # menos `necessario` trigramas. Logo ela contém ao menos
+        # `necessario - (a - k)` dos k trigramas mais raros da consulta:
+        # contando só essas k listas (e só as palavras com b trigramas), as
+        # candidatas com menos ocorrências já ficam de fora
+        expansao = {}
+        menor = math.ceil(limiar * a - 1e-9)
+        maior = min(math.floor(a / limiar + 1e-9), self._maior_palavra)
+        for b in range(menor, maior + 1):
+            necessario = math.ceil(limiar * (a + b) / (1 + limiar) - 1e-9)
+            k = min(a, a - necessario + 1 + FOLGA_EXPANSAO)
+            minimo = necessario - (a - k)
+            contagem = Counter()
+            for trigrama in raros[:k]:
+                palavras = self._palavras_por_trigrama.get(trigrama, {}).get(b)
+                if palavras:
+                    contagem.update(palavras)
+            if minimo > 1:
+                candidatas = [c for c, n in contagem.items() if n >= minimo]
+            else:
+                candidatas = contagem
+            for candidata in candidatas:
+                comuns = len(alvo & trigramas(candidata))
+                similaridade = comuns / (a + b - comuns)
+                if similaridade >= limiar:
+                    expansao[candidata] = similaridade
+
+        if len(self._expansoes) >= TAMANHO_CACHE_EXPANSOES:
+            self._expansoes.clear()
+        self._expansoes[(palavra, limiar)] = expansao
+        return expansao
+
+    def _compactar(self):
+        """Reconstrói as listas invertidas sem as entradas obsoletas"""
+        self._chaves_por_palavra = {}
+        self._palavras_por_trigrama = {}
+        self._frequencia_trigramas = {}
+        self._maior_palavra = 0
+        self._expansoes.clear()
+        self._entradas = 0
+        self._obsoletas = 0
+
+        for chave, palavras in self._palavras.items():
+            for palavra in palavras:
+                chaves = self._chaves_por_palavra.get(palavra)
+                if chaves is None:
+                    chaves = self._chaves_por_palavra[palavra] = array("q")
+                    self._registrar_palavra(palavra)
+                chaves.append(chave)
+            self._entradas += len(palavras)
+
+
+indice_livros = IndiceTrigramas()
+indice_autores = IndiceTrigramas()
+
+
+async def carregar_indices(sessao_factory, lote: int = 10_000):
+    """Carrega títulos e nomes de autores do banco nos índices em memória"""
+    async with sessao_factory() as db:
+        for indice, colunas in (
+            (indice_livros, (Livro.id, Livro.title)),
+            (indice_autores, (Autor.id, Autor.name)),
+        ):
+            resultado = await db.stream(
+                select(*colunas).execution_options(yield_per=lote)
+            )
+            async for chave, texto in resultado:
+                if texto:
+                    indice.adicionar(chave, texto)
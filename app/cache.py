@@ -0,0 +1,249 @@
+## Cache de leitura (LRU com TTL) para dados de referência
+#
+# Gêneros, autores e livros são lidos muito mais do que escritos. As
+# respostas desses GETs ficam em memória, cada entrada registrando de quais
+# linhas depende (("books", 5)) ou de qual tabela inteira ("books", None).
+#
+# Invalidação:
+#   - os handlers de escrita chamam `cache.invalidar(tabela, id)` após o commit;
+#   - escritas de outros workers (ou processos) são percebidas pelo
+#     `PRAGMA data_version` de uma conexão aiosqlite dedicada: quando ele
+#     muda, as linhas novas de `cache_changes` (preenchida por triggers)
+#     dizem exatamente quais entradas descartar.
+# O TTL limita por quanto tempo uma entrada vive mesmo sem escritas.
+#
+# A mesma verificação mantém em memória as versões de `table_versions`
+# (usadas nos ETags), relidas apenas quando o data_version muda.
+#
+# A verificação roda no máximo uma vez a cada CACHE_SINCRONIZACAO_MS, e não
+# a cada leitura: escritas de outros workers aparecem com até esse atraso.
+# As do próprio worker forçam a verificação na leitura seguinte, quando a
+# conexão volta ao pool de escrita (ou, com ESCRITA_COORDENADA=1, após o
+# COMMIT do grupo), então ele nunca serve dados anteriores a elas.
+
+import asyncio
+import os
+import time
+from collections import OrderedDict
+
+import aiosqlite
+from sqlalchemy import event
+
+from app.database import DATABASE_PATH, engine_escrita
+
+CACHE_MAX_ENTRADAS = int(os.environ.get("CACHE_MAX_ENTRADAS", 10_000))
+CACHE_TTL_S = float(os.environ.get("CACHE_TTL_S", 300))
+CACHE_SINCRONIZACAO_S = float(os.environ.get("CACHE_SINCRONIZACAO_MS", 10)) / 1000
+
+# Acima disso, alterações pendentes de outros workers limpam o cache inteiro
+MAX_ALTERACOES_SINCRONIZADAS = 1000
+
+
+class CacheLeitura:
+    """Cache LRU com TTL e invalidação por linha ou por tabela"""
+
+    def __init__(
+        self, caminho_banco: str, max_entradas: int, ttl: float, intervalo: float
+    ):
+        self._caminho_banco = caminho_banco
+        self._max_entradas = max_entradas
+        self._ttl = ttl
+        self._intervalo = intervalo
+        # chave -> (valor, expira_em, dependências)
+        self._entradas: OrderedDict = OrderedDict()
+        # (tabela, id ou None) -> chaves que dependem dela
+        self._dependentes: dict[tuple, set] = {}
+        # Incrementada a cada invalidação: um valor carregado do banco durante
+        # uma invalidação pode estar desatualizado e não é guardado
+        self._geracao = 0
+        self._conexao = None
+        self._trava = None
+        # Próxima verificação do data_version; 0 força a da próxima leitura
+        self._proxima_sincronizacao = 0.0
+        self._data_version = None
+        self._ultima_alteracao = 0
+        self._versoes = None
+        self._contadores = {
+            "acertos": 0,
+            "faltas": 0,
+            "despejos": 0,
+            "expiracoes": 0,
+            "invalidacoes": 0,
+        }
+
+    async def obter(self, chave, carregar, dependencias):
+        """
+        Retorna o valor da chave, chamando `carregar()` (corrotina) em caso de
+        falta. Valores None (não encontrado) não são guardados.
+        """
+        await self._sincronizar()
+
+        entrada = self._entradas.get(chave)
+        if entrada is not None:
+            if entrada[1] > time.monotonic():
+                self._entradas.move_to_end(chave)
+                self._contadores["acertos"] += 1
+                return entrada[0]
+            self._remover(chave)
+            self._contadores["expiracoes"] += 1
+
+        self._contadores["faltas"] += 1
+        geracao = self._geracao
+        valor = await carregar()
+        if valor is not None and geracao == self._geracao:
+            self._guardar(chave, valor, dependencias)
+        return valor
+
+    def invalidar(self, tabela: str, id=None):
+        """
+        Descarta as entradas que dependem da linha `id` da tabela (e as que
+        dependem da tabela inteira). Sem `id`, descarta tudo da tabela.
+        """
+        if id is None:
+            chaves = [
+                chave
+                for chave, (_, _, dependencias) in self._entradas.items()
+                if any(t == tabela for t, _ in dependencias)
+            ]
+        else:
+            chaves = self._dependentes.get((tabela, id), set()) | (
+                self._dependentes.get((tabela, None), set())
+            )
+
+        for chave in list(chaves):
+            self._remover(chave)
+        self._contadores["invalidacoes"] += len(chaves)
+        self._geracao += 1
+
+    async def versoes(self, tabelas) -> dict[str, int]:
+        """Versões atuais das tabelas (e do banco, em '_epoch')"""
+        await self._sincronizar()
+        return {tabela: self._versoes.get(tabela, 0) for tabela in ("_epoch", *tabelas)}
+
+    def escrita_confirmada(self):
+        """Uma escrita deste processo terminou: a próxima leitura verifica"""
+        self._proxima_sincronizacao = 0.0
+
+    def limpar(self):
+        self._contadores["invalidacoes"] += len(self._entradas)
+        self._entradas.clear()
+        self._dependentes.clear()
+        self._geracao += 1
+
+    def estatisticas(self):
+        consultas = self._contadores["acertos"] + self._contadores["faltas"]
+        return {
+            "entradas": len(self._entradas),
+            "max_entradas": self._max_entradas,
+            "ttl_s": self._ttl,
+            **self._contadores,
+            "taxa_acerto": (
+                round(self._contadores["acertos"] / consultas, 4) if consultas else None
+            ),
+        }
+
+    async def fechar(self):
+        if self._conexao is not None:
+            conexao, self._conexao = self._conexao, None
+            await conexao.close()
+
+    def _guardar(self, chave, valor, dependencias):
+        if chave in self._entradas:
+            self._remover(chave)
+        while len(self._entradas) >= self._max_entradas > 0:
+            self._remover(next(iter(self._entradas)))
+            self._contadores["despejos"] += 1
+        if self._max_entradas <= 0:
+            return
+
+        dependencias = tuple(dependencias)
+        self._entradas[chave] = (valor, time.monotonic() + self._ttl, dependencias)
+        for dependencia in dependencias:
+            self._dependentes.setdefault(dependencia, set()).add(chave)
+
+    def _remover(self, chave):
+        _, _, dependencias = self._entradas.pop(chave)
+        for dependencia in dependencias:
+            chaves = self._dependentes.get(dependencia)
+            if chaves is not None:
+                chaves.discard(chave)
+                if not chaves:
+                    del self._dependentes[dependencia]
+
+    async def _sincronizar(self):
+        """Aplica as alterações confirmadas por outras conexões desde a última leitura"""
+        if time.monotonic() < self._proxima_sincronizacao:
+            return
+        if self._trava is None:
+            self._trava = asyncio.Lock()
+        async with self._trava:
+            # Quem esperou a trava encontra a verificação recém-feita
+            if time.monotonic() < self._proxima_sincronizacao:
+                return
+            # Antes das consultas: um commit durante elas força outra
+            self._proxima_sincronizacao = time.monotonic() + self._intervalo
+            await self._aplicar_alteracoes()
+
+    async def _consultar(self, sql, parametros=()):
+        return await self._conexao.execute_fetchall(sql, parametros)
+
+    async def _aplicar_alteracoes(self):
+        if self._conexao is None:
+            self._conexao = await aiosqlite.connect(
+                self._caminho_banco, isolation_level=None
+            )
+            await self._conexao.execute("PRAGMA query_only=ON")
+            self._data_version = await self._consultar("PRAGMA data_version")
+            self._ultima_alteracao = (
+                await self._consultar("SELECT COALESCE(MAX(seq), 0) FROM cache_changes")
+            )[0][0]
+            await self._ler_versoes()
+            return
+
+        # data_version só muda quando outra conexão confirma uma escrita;
+        # no caso comum (nenhuma escrita) o custo é esta única leitura
+        versao = await self._consultar("PRAGMA data_version")
+        if versao == self._data_version:
+            return
+        self._data_version = versao
+        await self._ler_versoes()
+
+        alteracoes = await self._consultar(
+            "SELECT seq, table_name, row_id FROM cache_changes"
+            " WHERE seq > ? ORDER BY seq LIMIT ?",
+            (self._ultima_alteracao, MAX_ALTERACOES_SINCRONIZADAS + 1),
+        )
+        if not alteracoes:
+            return
+
+        # Alterações já removidas do log (ou em excesso) impedem a invalidação
+        # precisa: o cache inteiro é descartado
+        if (
+            alteracoes[0][0] != self._ultima_alteracao + 1
+            or len(alteracoes) > MAX_ALTERACOES_SINCRONIZADAS
+        ):
+            self.limpar()
+            self._ultima_alteracao = (
+                await self._consultar("SELECT MAX(seq) FROM cache_changes")
+            )[0][0]
+            return
+
+        for _, tabela, id in alteracoes:
+            self.invalidar(tabela, id)
+        self._ultima_alteracao = alteracoes[-1][0]
+
+    async def _ler_versoes(self):
+        self._versoes = dict(
+            await self._consultar("SELECT table_name, version FROM table_versions")
+        )
+
+
+cache = CacheLeitura(
+    DATABASE_PATH, CACHE_MAX_ENTRADAS, CACHE_TTL_S, CACHE_SINCRONIZACAO_S
+)
+
+
+# O evento "commit" dispara antes do COMMIT; a devolução ao pool, depois
+@event.listens_for(engine_escrita.sync_engine, "checkin")
+def _escrita_confirmada(dbapi_connection, connection_record):
+    cache.escrita_confirmada()
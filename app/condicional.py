@@ -0,0 +1,54 @@
+## GETs condicionais (ETag / If-None-Match) para o catálogo
+#
+# O ETag de uma rota é derivado das versões das tabelas de que ela depende
+# (table_versions, incrementada por triggers a cada escrita), sem serializar
+# nem ler o corpo da resposta. Como as versões são lidas antes das linhas,
+# uma escrita concorrente pode no máximo gerar um ETag mais antigo que o
+# corpo, o que só custa um download a mais na próxima requisição.
+#
+# Uso:
+#   @router.get("/", dependencies=[condicional("books")])
+
+from fastapi import Depends, Request, Response
+
+from app.cache import cache
+
+
+class NaoModificado(Exception):
+    """Interrompe a rota quando o ETag enviado pelo cliente ainda é válido"""
+
+    def __init__(self, etag: str):
+        self.etag = etag
+
+
+async def calcular_etag(tabelas) -> str:
+    versoes = await cache.versoes(tabelas)
+    return '"' + "-".join(str(versoes[tabela]) for tabela in versoes) + '"'
+
+
+def _corresponde(if_none_match: str, etag: str) -> bool:
+    # If-None-Match usa comparação fraca: o prefixo W/ é ignorado
+    candidatos = [
+        valor.strip().removeprefix("W/") for valor in if_none_match.split(",")
+    ]
+    return "*" in candidatos or etag in candidatos
+
+
+def condicional(*tabelas: str):
+    """Dependência que responde 304 (ou anota o ETag) antes de carregar as linhas"""
+
+    async def verificar(request: Request, response: Response):
+        etag = await calcular_etag(tabelas)
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and _corresponde(if_none_match, etag):
+            raise NaoModificado(etag)
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = "no-cache"
+
+    return Depends(verificar)
+
+
+async def tratar_nao_modificado(request: Request, exc: NaoModificado):
+    return Response(
+        status_code=304, headers={"ETag": exc.etag, "Cache-Control": "no-cache"}
+    )
@@ -1,42 +1,208 @@
 ## Tem por objetivo configurar a conexão com o banco de dados
 
-from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy import text
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy import event, text
+from sqlalchemy.engine import URL
+from starlette.requests import Request
 import logging
 import os.path
+import pathlib
+from app.migracoes import aplicar_migracoes
 
 # Configurar logging (opcional)
 logging.basicConfig()
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
-# SQLALCHEMY_DATABASE_URL = "sqlite:///../database/biblioteca_amostra.db"
+# SQLALCHEMY_DATABASE_URL = "sqlite+aiosqlite:///../database/biblioteca_amostra.db"
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DATABASE_DIR = os.path.join(
     BASE_DIR, "..", "database"
 )  # Sobe um nível e entra em "database"
-SQLALCHEMY_DATABASE_URL = (
-    f"sqlite:///{os.path.join(DATABASE_DIR, 'biblioteca_amostra.db')}"
+DATABASE_PATH = os.environ.get(
+    "BIBLIOTECA_DB_PATH", os.path.join(DATABASE_DIR, "biblioteca_amostra.db")
 )
+SQLALCHEMY_DATABASE_URL = f"sqlite+aiosqlite:///{DATABASE_PATH}"
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+# Pool de leitura: tamanho fixo + conexões extras sob pico. Quando todas
+# estão em uso, a requisição espera até DB_POOL_TIMEOUT segundos
+POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 10))
+POOL_MAX_OVERFLOW = int(os.environ.get("DB_POOL_MAX_OVERFLOW", 20))
+POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 30))
+# Pool de escrita: o SQLite tem um escritor por vez, então poucas conexões
+# bastam; as demais escritas esperam a vez no pool em vez de no busy_timeout
+ESCRITA_POOL_SIZE = int(os.environ.get("DB_ESCRITA_POOL_SIZE", 4))
+
+# PRAGMAs aplicados em cada conexão nova. Com WAL, leitores e escritor não
+# se bloqueiam; synchronous=NORMAL é seguro em WAL e evita um fsync por
+# commit. foreign_keys=ON faz o banco recusar referências inválidas (ver
+# app/erros.py). O modo WAL fica gravado no arquivo: só as conexões de
+# escrita o definem
+SQLITE_PRAGMAS = [
+    "PRAGMA foreign_keys=ON",
+    f"PRAGMA busy_timeout={int(os.environ.get('DB_BUSY_TIMEOUT_MS', 5000))}",
+    f"PRAGMA cache_size=-{int(os.environ.get('DB_CACHE_SIZE_KB', 64000))}",
+    f"PRAGMA mmap_size={int(os.environ.get('DB_MMAP_SIZE', 268435456))}",
+    "PRAGMA temp_store=MEMORY",
+]
+PRAGMAS_ESCRITA = ["PRAGMA journal_mode=WAL", "PRAGMA synchronous=NORMAL"]
+
+# Escritor único (app/escrita.py): com ESCRITA_COORDENADA=1, todas as
+# escritas passam por uma só conexão de engine_escrita. O escritor controla
+# as próprias transações (isolation_level=None no driver): abre cada grupo
+# com BEGIN IMMEDIATE e isola as requisições em SAVEPOINTs. Como um COMMIT
+# confirma o grupo inteiro, o fsync de synchronous=FULL sai barato
+ESCRITA_COORDENADA = os.environ.get("ESCRITA_COORDENADA", "0") == "1"
+ESCRITA_SYNCHRONOUS = os.environ.get("ESCRITA_SYNCHRONOUS", "FULL")
+
+# Engines assíncronas (aiosqlite): os handlers rodam no event loop em vez de
+# ocupar o threadpool do Starlette enquanto esperam o banco.
+# As leituras usam conexões abertas só para leitura (mode=ro na URI, além de
+# query_only): em WAL, cada uma lê o próprio retrato do banco e nunca espera
+# o escritor, nem uma escrita entra por engano pelo pool de leitura
+engine_leitura = create_async_engine(
+    URL.create(
+        "sqlite+aiosqlite",
+        database=pathlib.Path(DATABASE_PATH).resolve().as_uri(),
+        query={"mode": "ro", "uri": "true"},
+    ),
+    poolclass=AsyncAdaptedQueuePool,
+    pool_size=POOL_SIZE,
+    max_overflow=POOL_MAX_OVERFLOW,
+    pool_timeout=POOL_TIMEOUT,
+)
+engine_escrita = create_async_engine(
+    SQLALCHEMY_DATABASE_URL,
+    poolclass=AsyncAdaptedQueuePool,
+    pool_size=1 if ESCRITA_COORDENADA else ESCRITA_POOL_SIZE,
+    max_overflow=0,
+    pool_timeout=POOL_TIMEOUT,
+)
+ENGINES = (engine_leitura, engine_escrita)
+
+SessionLeitura = async_sessionmaker(
+    bind=engine_leitura, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+SessionEscrita = async_sessionmaker(
+    bind=engine_escrita, class_=AsyncSession, autoflush=False, expire_on_commit=False
 )
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
+# Contadores acumulados de cada pool (os valores instantâneos vêm do pool)
+_contadores_pool = {
+    engine_leitura: {"conexoes_criadas": 0, "checkouts": 0},
+    engine_escrita: {"conexoes_criadas": 0, "checkouts": 0},
+}
+
+
+@event.listens_for(engine_leitura.sync_engine, "connect")
+def configurar_leitor(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for pragma in SQLITE_PRAGMAS:
+        cursor.execute(pragma)
+    cursor.execute("PRAGMA query_only=ON")
+    cursor.close()
+    _contadores_pool[engine_leitura]["conexoes_criadas"] += 1
+
+
+@event.listens_for(engine_escrita.sync_engine, "connect")
+def configurar_escritor(dbapi_connection, connection_record):
+    if ESCRITA_COORDENADA:
+        dbapi_connection.isolation_level = None
+    cursor = dbapi_connection.cursor()
+    for pragma in SQLITE_PRAGMAS + PRAGMAS_ESCRITA:
+        cursor.execute(pragma)
+    if ESCRITA_COORDENADA:
+        cursor.execute(f"PRAGMA synchronous={ESCRITA_SYNCHRONOUS}")
+    cursor.close()
+    _contadores_pool[engine_escrita]["conexoes_criadas"] += 1
+
+
+if ESCRITA_COORDENADA:
+
+    @event.listens_for(engine_escrita.sync_engine, "begin")
+    def iniciar_transacao(conn):
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+
+def _contar_checkouts(motor):
+    contadores = _contadores_pool[motor]
+
+    @event.listens_for(motor.sync_engine, "checkout")
+    def contar_checkout(dbapi_connection, connection_record, connection_proxy):
+        contadores["checkouts"] += 1
 
-def verificar_conexao():
+
+for motor in ENGINES:
+    _contar_checkouts(motor)
+
+
+def _ocupacao(motor, max_overflow):
+    pool = motor.sync_engine.pool
+    return {
+        "tamanho": pool.size(),
+        "max_overflow": max_overflow,
+        "em_uso": pool.checkedout(),
+        "ociosas": pool.checkedin(),
+        "overflow": max(pool.overflow(), 0),
+        **_contadores_pool[motor],
+    }
+
+
+def estatisticas_pool():
+    """Retorna a ocupação atual dos pools de leitura e de escrita"""
+    return {
+        "leitura": _ocupacao(engine_leitura, POOL_MAX_OVERFLOW),
+        "escrita": _ocupacao(engine_escrita, 0),
+    }
+
+
+# Requisições que só leem e usam o pool de leitura; as demais usam o de
+# escrita (ou, com ESCRITA_COORDENADA=1, a sessão do escritor único)
+METODOS_DE_LEITURA = ("GET", "HEAD", "OPTIONS")
+
+
+# Dependency
+async def get_db(request: Request):
+    if request.method in METODOS_DE_LEITURA:
+        async with SessionLeitura() as db:
+            yield db
+    elif ESCRITA_COORDENADA:
+        # Importado aqui: app.escrita importa este módulo
+        from app.escrita import coordenador
+
+        async with coordenador.sessao() as db:
+            yield db
+    else:
+        async with SessionEscrita() as db:
+            yield db
+
+
+async def verificar_conexao():
     """Testa a conexão com o banco de dados"""
     try:
-        with engine.connect() as conn:
-            conn.execute(text("SELECT 1"))  # Consulta simples
+        # Pela escrita: cria o arquivo, se preciso, e o deixa em WAL antes que
+        # as conexões só de leitura o abram
+        async with engine_escrita.connect() as conn:
+            await conn.execute(text("SELECT 1"))  # Consulta simples
             logger.info("✅ Conexão com o banco de dados bem-sucedida!")
             return True
 
     except Exception as e:
         logger.error(f"❌ Falha na conexão com o banco: {str(e)}")
         return False
+
+
+async def preparar_banco():
+    """Atualiza o esquema de bancos existentes com as migrações pendentes"""
+    async with engine_escrita.begin() as conn:
+        await conn.run_sync(aplicar_migracoes)
+
+
+async def fechar_banco():
+    """Fecha as conexões dos pools (as threads do aiosqlite não são daemon)"""
+    for motor in ENGINES:
+        await motor.dispose()
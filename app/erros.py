@@ -0,0 +1,77 @@
+## Tradução das violações de integridade do SQLite em respostas HTTP
+#
+# Com PRAGMA foreign_keys=ON (app/database.py), as escritas vão direto ao
+# INSERT/UPDATE/DELETE: é o banco que recusa um livro de autor inexistente
+# ou a exclusão de um autor que ainda tem livros, sem um SELECT antes da
+# escrita (e sem a janela entre a verificação e a escrita).
+#
+# O SQLite não diz qual chave estrangeira falhou ("FOREIGN KEY constraint
+# failed"). Por isso, só no caminho de erro, traduzir_violacao consulta
+# quais das referências da escrita não existem (404 com a mesma mensagem
+# das antigas verificações). Isso vale para qualquer violação, porque um
+# trigger BEFORE (ex.: estoque zerado) recusa a linha antes da checagem da
+# chave. Sem referência faltando, uma falha de chave estrangeira veio de um
+# registro ainda referenciado por outros (409, ou a resposta `restrito`).
+# UNIQUE vira 400 com as mensagens de `unicos`; CHECK e RAISE dos triggers,
+# 409 com o texto do SQLite.
+
+from typing import NamedTuple, Optional
+
+from fastapi import HTTPException, Request, status
+from fastapi.responses import JSONResponse
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+class Referencia(NamedTuple):
+    """Registro referenciado pela escrita (modelo, id, nome na mensagem)"""
+
+    modelo: type
+    id: Optional[int]
+    nome: str
+
+
+def _mensagem(erro: IntegrityError) -> str:
+    return str(erro.orig)
+
+
+async def traduzir_violacao(
+    db: AsyncSession,
+    erro: IntegrityError,
+    *referencias: Referencia,
+    unicos: Optional[dict] = None,
+    restrito: Optional[HTTPException] = None,
+) -> HTTPException:
+    """Desfaz a transação e devolve a HTTPException equivalente à violação"""
+    await db.rollback()
+    for referencia in referencias:
+        if (
+            referencia.id is None
+            or await db.get(referencia.modelo, referencia.id) is None
+        ):
+            return HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"{referencia.nome} com ID {referencia.id} não encontrado",
+            )
+
+    mensagem = _mensagem(erro)
+    if "FOREIGN KEY" in mensagem:
+        return restrito or HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Registro referenciado por outros registros",
+        )
+
+    for restricao, detalhe in (unicos or {}).items():
+        if restricao in mensagem:
+            return HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail=detalhe
+            )
+
+    return HTTPException(status_code=status.HTTP_409_CONFLICT, detail=mensagem)
+
+
+async def tratar_violacao(request: Request, exc: IntegrityError):
+    """Violações que nenhuma rota traduziu: 409 com o texto do SQLite"""
+    return JSONResponse(
+        status_code=status.HTTP_409_CONFLICT, content={"detail": _mensagem(exc)}
+    )
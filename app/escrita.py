@@ -0,0 +1,296 @@
+## Escritor único com commit em grupo (ESCRITA_COORDENADA=1)
+#
+# Sem o coordenador, cada requisição abre a própria transação numa conexão
+# do pool e disputa o lock de escrita do SQLite: sob muitas escritas
+# simultâneas, quem espera mais que busy_timeout recebe "database is
+# locked", e quem consegue o lock é questão de sorte.
+#
+# Com ESCRITA_COORDENADA=1, as requisições que alteram dados (get_db com
+# POST, PUT, PATCH e DELETE) e as escritas das tarefas de fundo
+# (transacao_de_escrita) passam por uma única conexão, a do escritor:
+# - Uma transação por vez, na ordem de chegada (a fila do asyncio.Lock é
+#   FIFO). A transação pega o escritor no primeiro comando e o devolve no
+#   commit ou rollback.
+# - Cada transação é um SAVEPOINT dentro da transação do grupo. O rollback
+#   desfaz só o savepoint; o commit o libera, cede o escritor à próxima da
+#   fila e espera o COMMIT do grupo. Cada requisição mantém o próprio
+#   sucesso ou falha: se o COMMIT do grupo falhar, todas as do grupo recebem
+#   o erro.
+# - O grupo cresce enquanto houver transações na fila. Quem devolve o
+#   escritor com a fila vazia (ou com ESCRITA_GRUPO_MAX transações no grupo)
+#   confirma o grupo inteiro com um único COMMIT (um fsync). Sem carga, o
+#   grupo tem uma transação e o custo é o de antes.
+#
+# As leituras (GET) seguem no pool de leitura (app/database.py). Uma
+# requisição não deve esperar a auditoria durável (app/auditoria.py) com uma
+# transação aberta: a auditoria também precisa do escritor.
+
+import asyncio
+import functools
+import os
+import time
+from contextlib import asynccontextmanager
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.cache import cache
+from app.database import ESCRITA_COORDENADA, engine_escrita, logger
+
+ESCRITA_GRUPO_MAX = int(os.environ.get("ESCRITA_GRUPO_MAX", 100))
+
+
+class FalhaNoGrupo(Exception):
+    """O SQLite desfez a transação do grupo: nenhuma transação dele foi gravada"""
+
+
+def _com_escritor(metodo):
+    """Envolve um método da sessão que usa a conexão: espera a vez antes"""
+
+    @functools.wraps(metodo)
+    async def envolvido(self, *args, **kwargs):
+        await self._pegar_escritor()
+        return await metodo(self, *args, **kwargs)
+
+    return envolvido
+
+
+class SessaoEscrita(AsyncSession):
+    """Sessão das requisições de escrita: cada transação é um savepoint do grupo"""
+
+    def __init__(self, coordenador):
+        super().__init__(
+            bind=coordenador.conexao,
+            join_transaction_mode="create_savepoint",
+            autoflush=False,
+            expire_on_commit=False,
+        )
+        self._coordenador = coordenador
+        self._com_escritor = False
+
+    async def _pegar_escritor(self):
+        if not self._com_escritor:
+            await self._coordenador.adquirir()
+            self._com_escritor = True
+
+    async def _devolver_escritor(self):
+        if self._com_escritor:
+            self._com_escritor = False
+            await self._coordenador.liberar()
+
+    execute = _com_escritor(AsyncSession.execute)
+    scalar = _com_escritor(AsyncSession.scalar)
+    scalars = _com_escritor(AsyncSession.scalars)
+    get = _com_escritor(AsyncSession.get)
+    get_one = _com_escritor(AsyncSession.get_one)
+    stream = _com_escritor(AsyncSession.stream)
+    stream_scalars = _com_escritor(AsyncSession.stream_scalars)
+    delete = _com_escritor(AsyncSession.delete)
+    merge = _com_escritor(AsyncSession.merge)
+    flush = _com_escritor(AsyncSession.flush)
+    refresh = _com_escritor(AsyncSession.refresh)
+    run_sync = _com_escritor(AsyncSession.run_sync)
+    connection = _com_escritor(AsyncSession.connection)
+
+    async def commit(self):
+        if not self.in_transaction():
+            return
+        await self._pegar_escritor()
+        # Se o flush falhar, o savepoint segue aberto (e o escritor, com
+        # esta sessão) até o rollback
+        await super().commit()
+        self._com_escritor = False
+        await self._coordenador.confirmar()
+
+    async def rollback(self):
+        await super().rollback()
+        await self._devolver_escritor()
+
+    async def close(self):
+        await super().close()
+        await self._devolver_escritor()
+
+
+class Coordenador:
+    """Conexão do escritor, fila de transações e COMMIT dos grupos"""
+
+    def __init__(self, grupo_max: int):
+        self._grupo_max = grupo_max
+        self.conexao = None
+        self._trava = None
+        self._pendente = None
+        self._grupo: list[asyncio.Future] = []
+        self._tarefa = None
+        self._encerrando = False
+        self._esperando = 0
+        self._contadores = {
+            "grupos": 0,
+            "transacoes": 0,
+            "maior_grupo": 0,
+            "falhas": 0,
+            "ultimo_commit_ms": None,
+        }
+
+    @property
+    def ativo(self) -> bool:
+        return self.conexao is not None
+
+    async def iniciar(self):
+        """Abre a conexão do escritor e sobe a tarefa de reserva dos commits"""
+        if not ESCRITA_COORDENADA:
+            return
+        self.conexao = await engine_escrita.connect()
+        self._trava = asyncio.Lock()
+        self._pendente = asyncio.Event()
+        self._encerrando = False
+        self._tarefa = asyncio.create_task(self._encerrar_grupos_pendentes())
+        logger.info("✍️ Escritas pelo escritor único, com commit em grupo")
+
+    async def encerrar(self):
+        """Confirma o último grupo e fecha a conexão do escritor"""
+        if self._tarefa is None:
+            return
+        tarefa, self._tarefa = self._tarefa, None
+        self._encerrando = True
+        self._pendente.set()
+        await tarefa
+        conexao, self.conexao = self.conexao, None
+        await conexao.close()
+
+    @asynccontextmanager
+    async def sessao(self):
+        """Sessão de uma requisição de escrita (get_db)"""
+        sessao = SessaoEscrita(self)
+        async with sessao:
+            yield sessao
+
+    @asynccontextmanager
+    async def transacao(self):
+        """Transação das tarefas de fundo, num savepoint do grupo"""
+        await self.adquirir()
+        try:
+            async with self.conexao.begin_nested():
+                yield self.conexao
+        except BaseException:
+            await self.liberar()
+            raise
+        await self.confirmar()
+
+    async def adquirir(self):
+        """Espera a vez na fila do escritor e garante a transação do grupo"""
+        self._esperando += 1
+        try:
+            await self._trava.acquire()
+        finally:
+            self._esperando -= 1
+        # Sem transação aberta na conexão, a sessão faria o próprio COMMIT em
+        # vez de usar um savepoint
+        if not self.conexao.in_transaction():
+            try:
+                await self.conexao.begin()
+            except BaseException:
+                self._trava.release()
+                raise
+
+    async def liberar(self):
+        """
+        Devolve o escritor. Com mais transações na fila, o grupo continua
+        aberto para elas; sem ninguém esperando (ou com ESCRITA_GRUPO_MAX
+        transações), quem devolve encerra o grupo antes.
+        """
+        if self._esperando and len(self._grupo) < self._grupo_max:
+            self._trava.release()
+            # Reserva: se as da fila desistirem, a tarefa encerra o grupo
+            self._pendente.set()
+            return
+        # Blindado: mesmo com a requisição cancelada, o COMMIT termina antes
+        # que outra transação use a conexão
+        encerramento = asyncio.ensure_future(self._encerrar_grupo())
+        encerramento.add_done_callback(lambda _: self._trava.release())
+        await asyncio.shield(encerramento)
+
+    async def confirmar(self):
+        """Devolve o escritor após liberar o savepoint e espera o COMMIT do grupo"""
+        confirmacao = asyncio.get_running_loop().create_future()
+        self._grupo.append(confirmacao)
+        await self.liberar()
+        await confirmacao
+
+    async def _encerrar_grupos_pendentes(self):
+        while True:
+            await self._pendente.wait()
+            async with self._trava:
+                self._pendente.clear()
+                await self._encerrar_grupo()
+            if self._encerrando:
+                return
+
+    async def _encerrar_grupo(self):
+        """COMMIT das transações liberadas desde o último (com o escritor)"""
+        grupo, self._grupo = self._grupo, []
+        try:
+            if grupo:
+                await self._confirmar_grupo(grupo)
+            elif self.conexao.in_transaction():
+                # Só savepoints desfeitos ou leituras: nada a confirmar, mas a
+                # transação não deve segurar o lock de escrita
+                await self.conexao.rollback()
+        except Exception as e:
+            logger.error(f"❌ Falha ao encerrar a transação do escritor: {e}")
+
+    async def _confirmar_grupo(self, grupo):
+        inicio = time.perf_counter()
+        try:
+            bruta = await self.conexao.get_raw_connection()
+            # Alguns erros (ex.: disco cheio) fazem o SQLite desfazer a
+            # transação inteira; o driver não acusaria no COMMIT
+            if not bruta.driver_connection.in_transaction:
+                raise FalhaNoGrupo("O SQLite desfez a transação do grupo")
+            await self.conexao.commit()
+            # O escritor não volta ao pool: o cache não veria o COMMIT
+            cache.escrita_confirmada()
+        except Exception as e:
+            self._contadores["falhas"] += 1
+            logger.error(f"❌ Falha no commit de {len(grupo)} transações: {e}")
+            for confirmacao in grupo:
+                if not confirmacao.done():
+                    confirmacao.set_exception(e)
+            await self.conexao.rollback()
+            return
+
+        self._contadores["ultimo_commit_ms"] = round(
+            (time.perf_counter() - inicio) * 1000, 3
+        )
+        self._contadores["grupos"] += 1
+        self._contadores["transacoes"] += len(grupo)
+        self._contadores["maior_grupo"] = max(
+            self._contadores["maior_grupo"], len(grupo)
+        )
+        for confirmacao in grupo:
+            if not confirmacao.done():
+                confirmacao.set_result(None)
+
+    def estatisticas(self):
+        """Grupos confirmados, transações por grupo e fila do escritor"""
+        grupos = self._contadores["grupos"]
+        return {
+            "ativo": self.ativo,
+            "esperando": self._esperando,
+            **self._contadores,
+            "transacoes_por_grupo": (
+                round(self._contadores["transacoes"] / grupos, 2) if grupos else None
+            ),
+        }
+
+
+coordenador = Coordenador(ESCRITA_GRUPO_MAX)
+
+
+@asynccontextmanager
+async def transacao_de_escrita():
+    """Transação de escrita fora das requisições (tarefas de fundo, startup)"""
+    if coordenador.ativo:
+        async with coordenador.transacao() as conn:
+            yield conn
+    else:
+        async with engine_escrita.begin() as conn:
+            yield conn
@@ -0,0 +1,84 @@
+## Exportação em fluxo (NDJSON ou CSV) de tabelas grandes
+#
+# As linhas são lidas com um cursor do lado do servidor (`stream` +
+# `yield_per`) e enviadas em blocos à medida que chegam, então a memória do
+# worker não cresce com o tamanho da tabela e o primeiro byte sai assim que
+# o primeiro bloco é lido.
+#
+# A consulta roda em uma conexão própria, aberta dentro do gerador: a sessão
+# de `get_db` é fechada antes de o corpo da resposta começar a ser enviado.
+
+import csv
+import io
+import json
+from datetime import date, datetime, timezone
+from typing import Literal
+
+from fastapi.responses import StreamingResponse
+
+from app.database import engine_leitura
+
+LINHAS_POR_BLOCO = 1000
+
+TIPOS_CONTEUDO = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+FormatoExportacao = Literal["ndjson", "csv"]
+
+
+def em_utc(momento: datetime) -> datetime:
+    """
+    Converte um limite de período com fuso para UTC, o fuso em que logs e
+    histórico são gravados; sem fuso, o momento já é tomado como UTC
+    """
+    if momento.tzinfo is not None:
+        momento = momento.astimezone(timezone.utc)
+    return momento
+
+
+def _texto(valor):
+    if isinstance(valor, (date, datetime)):
+        return valor.isoformat()
+    return valor
+
+
+async def _blocos(consulta, formato: str):
+    async with engine_leitura.connect() as conexao:
+        resultado = await conexao.stream(
+            consulta.execution_options(yield_per=LINHAS_POR_BLOCO)
+        )
+        colunas = list(resultado.keys())
+
+        if formato == "csv":
+            buffer = io.StringIO()
+            escritor = csv.writer(buffer)
+            escritor.writerow(colunas)
+            yield buffer.getvalue().encode()
+
+        async for linhas in resultado.partitions():
+            if formato == "csv":
+                buffer.seek(0)
+                buffer.truncate()
+                escritor.writerows(linhas)
+                yield buffer.getvalue().encode()
+            else:
+                yield "".join(
+                    json.dumps(
+                        dict(zip(colunas, map(_texto, linha))), ensure_ascii=False
+                    )
+                    + "\n"
+                    for linha in linhas
+                ).encode()
+
+
+def exportar(consulta, formato: str, nome_arquivo: str) -> StreamingResponse:
+    """Resposta que transmite o resultado da consulta (colunas, não objetos ORM)"""
+    return StreamingResponse(
+        _blocos(consulta, formato),
+        media_type=TIPOS_CONTEUDO[formato],
+        headers={
+            "Content-Disposition": f'attachment; filename="{nome_arquivo}.{formato}"'
+        },
+    )
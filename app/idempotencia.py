@@ -0,0 +1,183 @@
+## Chaves de idempotência (header Idempotency-Key) das escritas de empréstimo
+#
+# Um cliente que repete o POST /api/emprestimos/ após um timeout criaria um
+# segundo empréstimo, e os triggers baixariam o estoque e gravariam o log
+# de novo. Com o header Idempotency-Key, a resposta da primeira execução
+# fica em idempotency_keys por IDEMPOTENCIA_TTL_S segundos e as repetições
+# a recebem de volta sem escrever nada (header Idempotent-Replayed: true).
+#
+# - A consulta é pela chave primária (16 bytes) e pelo pool de leitura: com
+#   WAL, ela não espera nem bloqueia os escritores, e com
+#   ESCRITA_COORDENADA=1 uma rajada de repetições não entra na fila do
+#   escritor único.
+# - A chave é gravada na transação da própria escrita, por um upsert que só
+#   substitui chaves expiradas. Se duas requisições com a mesma chave
+#   correm juntas, a segunda encontra a chave da primeira (o SQLite tem um
+#   escritor por vez), desfaz a própria escrita e devolve a resposta dela.
+# - Só respostas de sucesso são guardadas: uma escrita recusada não altera
+#   nada, e a repetição pode dar certo depois (ex.: estoque reposto).
+# - A mesma chave com outro corpo é recusada com 422.
+#
+# Uma tarefa de fundo apaga as chaves expiradas a cada
+# IDEMPOTENCIA_LIMPEZA_S segundos, em lotes curtos.
+
+import asyncio
+import hashlib
+import json
+import os
+import time
+from typing import NamedTuple, Optional
+
+from fastapi import Header, HTTPException, Request, status
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import engine_leitura, logger
+from app.escrita import transacao_de_escrita
+
+IDEMPOTENCIA_TTL_S = int(os.environ.get("IDEMPOTENCIA_TTL_S", 86400))
+IDEMPOTENCIA_LIMPEZA_S = float(os.environ.get("IDEMPOTENCIA_LIMPEZA_S", 3600))
+LOTE_LIMPEZA = 1000
+
+_CONSULTAR = text("""
+    SELECT request_hash, status, body FROM idempotency_keys
+    WHERE key = :chave AND expires_at > :agora
+""")
+# Sem linha no RETURNING: a chave já está em uso (e não expirou)
+_REGISTRAR = text("""
+    INSERT INTO idempotency_keys (key, request_hash, status, body, expires_at)
+    VALUES (:chave, :impressao, :status, :corpo, :expira)
+    ON CONFLICT (key) DO UPDATE SET
+        request_hash = excluded.request_hash,
+        status = excluded.status,
+        body = excluded.body,
+        expires_at = excluded.expires_at
+    WHERE idempotency_keys.expires_at <= :agora
+    RETURNING 1
+""")
+_APAGAR_EXPIRADAS = text("""
+    DELETE FROM idempotency_keys WHERE key IN (
+        SELECT key FROM idempotency_keys WHERE expires_at <= :agora LIMIT :tamanho
+    )
+""")
+
+
+class ChaveIdempotente(NamedTuple):
+    """Resumos da chave (com método e rota) e do corpo da requisição"""
+
+    chave: bytes
+    impressao: bytes
+
+
+def _resumo(dados: bytes) -> bytes:
+    return hashlib.sha256(dados).digest()[:16]
+
+
+async def chave_idempotente(
+    request: Request,
+    idempotency_key: Optional[str] = Header(
+        None,
+        max_length=255,
+        description="Repetições com a mesma chave devolvem a primeira resposta",
+    ),
+) -> Optional[ChaveIdempotente]:
+    """Dependência: a chave da requisição, ou None sem o header"""
+    if idempotency_key is None:
+        return None
+    escopo = f"{request.method} {request.url.path}:{idempotency_key}"
+    return ChaveIdempotente(_resumo(escopo.encode()), _resumo(await request.body()))
+
+
+async def resposta_registrada(
+    chave: ChaveIdempotente, db: Optional[AsyncSession] = None
+) -> Optional[JSONResponse]:
+    """
+    Resposta guardada para a chave, ou None se ela ainda não foi usada.
+    Consulta pelo pool de leitura; com `db` (a sessão de escrita), enxerga
+    também as chaves de um grupo do escritor único ainda sem COMMIT.
+    """
+    parametros = {"chave": chave.chave, "agora": int(time.time())}
+    if db is None:
+        async with engine_leitura.connect() as conexao:
+            linha = (await conexao.execute(_CONSULTAR, parametros)).first()
+    else:
+        linha = (await db.execute(_CONSULTAR, parametros)).first()
+    if linha is None:
+        return None
+    if linha.request_hash != chave.impressao:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Idempotency-Key já usada com outro corpo de requisição",
+        )
+    return JSONResponse(
+        status_code=linha.status,
+        content=json.loads(linha.body),
+        headers={"Idempotent-Replayed": "true"},
+    )
+
+
+async def registrar(
+    db: AsyncSession, chave: ChaveIdempotente, status_code: int, corpo: BaseModel
+) -> bool:
+    """
+    Grava a resposta na transação da escrita (antes do commit). False se
+    outra requisição registrou a mesma chave antes: a escrita deve ser
+    desfeita com resposta_da_concorrente.
+    """
+    agora = int(time.time())
+    registrada = await db.execute(
+        _REGISTRAR,
+        {
+            "chave": chave.chave,
+            "impressao": chave.impressao,
+            "status": status_code,
+            "corpo": corpo.model_dump_json(),
+            "expira": agora + IDEMPOTENCIA_TTL_S,
+            "agora": agora,
+        },
+    )
+    return registrada.first() is not None
+
+
+async def resposta_da_concorrente(
+    db: AsyncSession, chave: ChaveIdempotente
+) -> JSONResponse:
+    """Desfaz a escrita e devolve a resposta de quem registrou a chave antes"""
+    await db.rollback()
+    resposta = await resposta_registrada(chave, db)
+    if resposta is None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Outra requisição com esta Idempotency-Key está em andamento",
+        )
+    return resposta
+
+
+async def apagar_expiradas(tamanho_lote: int = LOTE_LIMPEZA) -> int:
+    """Apaga as chaves expiradas em transações de até `tamanho_lote` linhas"""
+    apagadas = 0
+    while True:
+        async with transacao_de_escrita() as conn:
+            lote = (
+                await conn.execute(
+                    _APAGAR_EXPIRADAS,
+                    {"agora": int(time.time()), "tamanho": tamanho_lote},
+                )
+            ).rowcount
+        apagadas += lote
+        if lote < tamanho_lote:
+            return apagadas
+
+
+async def executar_periodicamente():
+    """Apaga as chaves expiradas a cada IDEMPOTENCIA_LIMPEZA_S segundos"""
+    while True:
+        try:
+            apagadas = await apagar_expiradas()
+            if apagadas:
+                logger.info(f"🧹 {apagadas} chaves de idempotência expiradas apagadas")
+        except Exception as e:
+            logger.error(f"❌ Falha na limpeza das chaves de idempotência: {e}")
+        await asyncio.sleep(IDEMPOTENCIA_LIMPEZA_S)
@@ -0,0 +1,305 @@
+## Importação em massa de livros, autores e usuários (CSV ou NDJSON)
+#
+# O arquivo é lido como fluxo (corpo da requisição ou arquivo local) e
+# processado em lotes:
+#   1. cada linha é validada pelo schema de criação da entidade;
+#   2. chaves estrangeiras (autor e gênero dos livros) são resolvidas com uma
+#      consulta por lote, aceitando id ou nome;
+#   3. as linhas válidas são inseridas em uma transação por lote.
+# Linhas inválidas entram no relatório com o número da linha e o motivo, sem
+# interromper a carga. Se o lote falhar no banco, ele é refeito linha a linha
+# para isolar as linhas problemáticas.
+
+import csv
+import json
+import time
+from typing import AsyncIterator, Optional
+
+from fastapi import HTTPException, Request, status
+from pydantic import ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.exc import DBAPIError
+
+from app.busca_aproximada import indice_autores, indice_livros
+from app.cache import cache
+from app.database import SessionLeitura
+from app.escrita import FalhaNoGrupo
+from app.models.models import Autor, Genero, Livro, Usuario
+from app.schemas.autor_schema import AutorCreate
+from app.schemas.livro_schema import LivroCreate
+from app.schemas.usuario_schema import UsuarioCreate
+
+TAMANHO_LOTE = 1000
+MAX_ERROS_REPORTADOS = 1000
+
+# entidade -> (modelo, schema de criação, coluna de texto do índice aproximado,
+#              índice aproximado, tabela invalidada no cache)
+ENTIDADES = {
+    "livros": (Livro, LivroCreate, "title", indice_livros, "books"),
+    "autores": (Autor, AutorCreate, "name", indice_autores, "authors"),
+    "usuarios": (Usuario, UsuarioCreate, None, None, None),
+}
+
+# Documenta o corpo aceito pelos endpoints /importar no OpenAPI
+CORPO_IMPORTACAO = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "text/csv": {"schema": {"type": "string"}},
+            "application/x-ndjson": {"schema": {"type": "string"}},
+        },
+    }
+}
+
+
+def formato_da_requisicao(request: Request, formato: Optional[str]) -> str:
+    """Formato informado na query string ou deduzido do Content-Type"""
+    if formato is None:
+        tipo = request.headers.get("content-type", "")
+        if "csv" in tipo:
+            formato = "csv"
+        elif "ndjson" in tipo or "jsonl" in tipo:
+            formato = "ndjson"
+
+    if formato not in ("csv", "ndjson"):
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Envie text/csv ou application/x-ndjson (ou use ?formato=)",
+        )
+    return formato
+
+
+async def _linhas(blocos: AsyncIterator[bytes]):
+    """Linhas de texto (UTF-8) de um fluxo de bytes, sem carregá-lo inteiro"""
+    pendente = b""
+    primeira = True
+    async for bloco in blocos:
+        pendente += bloco
+        *completas, pendente = pendente.split(b"\n")
+        for linha in completas:
+            if primeira:
+                linha = linha.removeprefix(b"\xef\xbb\xbf")
+                primeira = False
+            yield linha.decode("utf-8", errors="replace").rstrip("\r")
+    if pendente:
+        yield pendente.decode("utf-8", errors="replace").rstrip("\r")
+
+
+async def _registros(blocos: AsyncIterator[bytes], formato: str):
+    """
+    Gera (número da linha, dados) para cada registro. Em registros ilegíveis,
+    `dados` é a mensagem de erro (str).
+    """
+    numero = 0
+    if formato == "ndjson":
+        async for linha in _linhas(blocos):
+            numero += 1
+            if not linha.strip():
+                continue
+            try:
+                dados = json.loads(linha)
+            except json.JSONDecodeError as e:
+                yield numero, f"JSON inválido: {e.msg}"
+                continue
+            yield numero, (dados if isinstance(dados, dict) else "Esperado um objeto")
+        return
+
+    # CSV: um registro pode ocupar várias linhas quando um campo entre aspas
+    # contém quebras de linha; o registro termina quando as aspas fecham
+    cabecalho = None
+    registro, inicio = [], 0
+    async for linha in _linhas(blocos):
+        numero += 1
+        if not registro:
+            inicio = numero
+        registro.append(linha)
+        if sum(parte.count('"') for parte in registro) % 2:
+            continue
+
+        valores = next(csv.reader(["\n".join(registro)]), [])
+        registro = []
+        if not any(valores):
+            continue
+        if cabecalho is None:
+            cabecalho = [coluna.strip() for coluna in valores]
+            continue
+        if len(valores) != len(cabecalho):
+            yield inicio, f"Esperadas {len(cabecalho)} colunas, encontradas {len(valores)}"
+            continue
+        # Células vazias contam como ausentes (o schema decide se são exigidas)
+        yield inicio, {c: v for c, v in zip(cabecalho, valores) if v != ""}
+
+    if registro:
+        yield inicio, "Campo entre aspas não foi fechado"
+
+
+def _mensagem_validacao(erro: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(parte) for parte in detalhe['loc'])}: {detalhe['msg']}"
+        for detalhe in erro.errors()
+    )
+
+
+async def _resolver_referencias(db, dados_lote):
+    """
+    Completa author_id/genre_id dos livros a partir dos nomes ("author",
+    "genre") e confere, com uma consulta por tabela, se os ids existem.
+    Retorna {posição no lote: mensagem de erro}.
+    """
+    erros = {}
+    for modelo, coluna_id, coluna_nome, rotulo in (
+        (Autor, "author_id", "author", "Autor"),
+        (Genero, "genre_id", "genre", "Gênero"),
+    ):
+        nomes = {
+            dados[coluna_nome]
+            for dados in dados_lote
+            if dados.get(coluna_id) is None and dados.get(coluna_nome)
+        }
+        ids_por_nome = {}
+        if nomes:
+            ids_por_nome = dict(
+                (
+                    await db.execute(
+                        select(modelo.name, modelo.id).where(modelo.name.in_(nomes))
+                    )
+                ).all()
+            )
+
+        for posicao, dados in enumerate(dados_lote):
+            nome = dados.pop(coluna_nome, None)
+            if dados.get(coluna_id) is None and nome is not None:
+                if nome in ids_por_nome:
+                    dados[coluna_id] = ids_por_nome[nome]
+                else:
+                    erros[posicao] = f"{rotulo} '{nome}' não encontrado"
+
+        ids = set()
+        for dados in dados_lote:
+            try:
+                ids.add(int(dados[coluna_id]))
+            except (KeyError, TypeError, ValueError):
+                pass  # ausente ou inválido: a validação do schema acusa
+        existentes = set()
+        if ids:
+            existentes = set(
+                (await db.scalars(select(modelo.id).where(modelo.id.in_(ids)))).all()
+            )
+        for posicao, dados in enumerate(dados_lote):
+            try:
+                id = int(dados[coluna_id])
+            except (KeyError, TypeError, ValueError):
+                continue
+            if id not in existentes:
+                erros.setdefault(posicao, f"{rotulo} com ID {id} não encontrado")
+    return erros
+
+
+async def _inserir(db, modelo, coluna_texto, valores):
+    """
+    Insere as linhas e retorna pares (id, texto indexado). O RETURNING traz o
+    texto junto porque, sem exigir a ordem dos parâmetros, o SQLAlchemy insere
+    o lote em poucos INSERTs de várias linhas em vez de um por linha.
+    """
+    colunas = [modelo.id]
+    if coluna_texto is not None:
+        colunas.append(getattr(modelo, coluna_texto))
+    resultado = await db.execute(insert(modelo).returning(*colunas), valores)
+    return [(linha[0], linha[-1] if coluna_texto else None) for linha in resultado]
+
+
+async def importar(
+    db,
+    entidade: str,
+    blocos: AsyncIterator[bytes],
+    formato: str,
+    tamanho_lote: int = TAMANHO_LOTE,
+):
+    """Importa os registros do fluxo e retorna o relatório da carga"""
+    modelo, schema, coluna_texto, indice, tabela_cache = ENTIDADES[entidade]
+    relatorio = {
+        "entidade": entidade,
+        "formato": formato,
+        "linhas": 0,
+        "inseridas": 0,
+        "com_erro": 0,
+        "erros": [],
+    }
+
+    def registrar_erro(numero, mensagem):
+        relatorio["com_erro"] += 1
+        if len(relatorio["erros"]) < MAX_ERROS_REPORTADOS:
+            relatorio["erros"].append({"linha": numero, "erro": mensagem})
+
+    async def processar(lote):
+        erros_referencia = {}
+        if modelo is Livro:
+            # Pelo pool de leitura: validar o lote não deve ocupar o escritor
+            async with SessionLeitura() as leitura:
+                erros_referencia = await _resolver_referencias(
+                    leitura, [dados for _, dados in lote]
+                )
+
+        validos = []
+        for posicao, (numero, dados) in enumerate(lote):
+            if posicao in erros_referencia:
+                registrar_erro(numero, erros_referencia[posicao])
+                continue
+            try:
+                validos.append((numero, schema.model_validate(dados).model_dump()))
+            except ValidationError as e:
+                registrar_erro(numero, _mensagem_validacao(e))
+        if not validos:
+            # Nada a inserir: não deixa transação aberta (nem, com
+            # ESCRITA_COORDENADA=1, o escritor preso) durante o próximo lote
+            await db.rollback()
+            return
+
+        try:
+            inseridos = await _inserir(
+                db, modelo, coluna_texto, [valores for _, valores in validos]
+            )
+            await db.commit()
+        except (DBAPIError, FalhaNoGrupo):
+            # Refaz o lote linha a linha para descobrir quais falham
+            await db.rollback()
+            inseridos = []
+            for numero, valores in validos:
+                try:
+                    linha = await _inserir(db, modelo, coluna_texto, [valores])
+                    await db.commit()
+                except (DBAPIError, FalhaNoGrupo) as e:
+                    await db.rollback()
+                    registrar_erro(numero, str(getattr(e, "orig", e)))
+                    continue
+                # Só depois do commit: uma linha desfeita não vai ao índice
+                inseridos += linha
+
+        relatorio["inseridas"] += len(inseridos)
+        for id, texto in inseridos:
+            if indice is not None and texto:
+                indice.adicionar(id, texto)
+            if tabela_cache is not None:
+                cache.invalidar(tabela_cache, id)
+
+    inicio = time.perf_counter()
+    lote = []
+    async for numero, dados in _registros(blocos, formato):
+        relatorio["linhas"] += 1
+        if isinstance(dados, str):
+            registrar_erro(numero, dados)
+            continue
+        lote.append((numero, dados))
+        if len(lote) >= tamanho_lote:
+            await processar(lote)
+            lote = []
+    if lote:
+        await processar(lote)
+
+    duracao = time.perf_counter() - inicio
+    relatorio["erros"].sort(key=lambda erro: erro["linha"])
+    relatorio["duracao_s"] = round(duracao, 3)
+    relatorio["linhas_por_s"] = (
+        round(relatorio["linhas"] / duracao, 1) if duracao else None
+    )
+    return relatorio
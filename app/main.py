@@ -1,4 +1,8 @@
+import asyncio
+
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
+from sqlalchemy.exc import IntegrityError
 from app.routers import (
     autores,
     livros,
@@ -9,7 +13,19 @@ from app.routers import (
     historico_de_emprestimos,
     log,
 )
-from app.database import verificar_conexao
+from app.database import (
+    SessionLeitura,
+    verificar_conexao,
+    preparar_banco,
+    fechar_banco,
+    estatisticas_pool,
+)
+from app import busca_aproximada, idempotencia, metricas, perfil_sql, retencao_logs
+from app.auditoria import auditoria
+from app.cache import cache
+from app.escrita import coordenador
+from app.condicional import NaoModificado, tratar_nao_modificado
+from app.erros import tratar_violacao
 
 app = FastAPI(
     title="Biblioteca API",
@@ -20,12 +36,46 @@ app = FastAPI(
     ),
     version="1.0.0",
 )
+app.add_exception_handler(NaoModificado, tratar_nao_modificado)
+app.add_exception_handler(IntegrityError, tratar_violacao)
+app.add_middleware(metricas.MedicaoRequisicoes)
+if perfil_sql.HABILITADO:
+    perfil_sql.ativar()
+    app.add_middleware(perfil_sql.PerfilSQL)
+
+# Tarefas de fundo iniciadas no startup e canceladas no shutdown
+tarefas_de_fundo: list[asyncio.Task] = []
 
 
 @app.on_event("startup")
 async def startup_event():
-    if not verificar_conexao():
+    if not await verificar_conexao():
         raise RuntimeError("Falha crítica: Banco de dados não disponível")
+    await preparar_banco()
+    await coordenador.iniciar()
+    await auditoria.iniciar()
+    if busca_aproximada.HABILITADA:
+        await busca_aproximada.carregar_indices(SessionLeitura)
+    metricas.iniciar()
+    tarefas_de_fundo.append(asyncio.create_task(metricas.gravar_periodicamente()))
+    tarefas_de_fundo.append(asyncio.create_task(idempotencia.executar_periodicamente()))
+    if retencao_logs.LOG_RETENCAO_DIAS > 0:
+        tarefas_de_fundo.append(
+            asyncio.create_task(retencao_logs.executar_periodicamente())
+        )
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    for tarefa in tarefas_de_fundo:
+        tarefa.cancel()
+    await asyncio.gather(*tarefas_de_fundo, return_exceptions=True)
+    tarefas_de_fundo.clear()
+    await auditoria.encerrar()
+    await coordenador.encerrar()
+    metricas.gravar_retrato()
+    await cache.fechar()
+    await fechar_banco()
 
 
 app.include_router(autores.router, prefix="/api/autores", tags=["AUTORES"])
@@ -43,5 +93,43 @@ app.include_router(log.router, prefix="/api/logs", tags=["LOGS"])
 
 
 @app.get("/")
-def root():
+async def root():
     return {"message": "Bem-vindo à Biblioteca API!"}
+
+
+@app.get("/status/pool", tags=["STATUS"])
+async def status_pool():
+    """Ocupação dos pools de conexões de leitura e de escrita"""
+    return estatisticas_pool()
+
+
+@app.get("/status/cache", tags=["STATUS"])
+async def status_cache():
+    """Acertos, faltas e despejos do cache de leitura"""
+    return cache.estatisticas()
+
+
+@app.get("/status/auditoria", tags=["STATUS"])
+async def status_auditoria():
+    """Fila, lotes gravados e esperas da gravação em lote dos logs"""
+    return auditoria.estatisticas()
+
+
+@app.get("/status/escrita", tags=["STATUS"])
+async def status_escrita():
+    """Grupos confirmados e fila do escritor único (ESCRITA_COORDENADA=1)"""
+    return coordenador.estatisticas()
+
+
+@app.get("/status/perfil-sql", tags=["STATUS"])
+async def status_perfil_sql():
+    """Comandos SQL por rota nas requisições amostradas (PERFIL_SQL=1)"""
+    return perfil_sql.estatisticas()
+
+
+@app.get("/metrics", tags=["STATUS"], response_class=PlainTextResponse)
+async def metrics():
+    """Métricas de todos os workers no formato texto do Prometheus"""
+    return PlainTextResponse(
+        metricas.exposicao(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
@@ -0,0 +1,438 @@
+## Métricas no formato do Prometheus (GET /metrics)
+#
+# Um middleware ASGI puro mede cada requisição: contagem por método, rota e
+# status, erros (5xx), histograma de latência, requisições em andamento e
+# quantidade de comandos SQL executados (contados por um listener do
+# SQLAlchemy). A rota é o template registrado ("/api/livros/{livro_id}"),
+# não o caminho da URL, para que o número de séries seja limitado.
+#
+# Por requisição o custo é o de alguns incrementos em dicionários. Com vários
+# workers do uvicorn, cada um grava periodicamente (METRICAS_INTERVALO_S) um
+# retrato das suas métricas em METRICAS_DIR/<pid do processo principal>, e o
+# /metrics de qualquer worker soma os retratos de todos. Cada execução da API
+# começa do zero: os diretórios de processos principais que já terminaram
+# são apagados na inicialização. Os contadores de um worker que terminou são
+# somados a um único retrato de aposentados (para não voltarem para trás) e
+# o arquivo dele é apagado; os gauges só contam os workers vivos.
+
+import asyncio
+import contextvars
+import fcntl
+import glob
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+import zlib
+from bisect import bisect_left
+
+from sqlalchemy import event
+
+from app.cache import cache
+from app.database import DATABASE_PATH, ENGINES, estatisticas_pool, logger
+
+METRICAS_DIR = os.environ.get(
+    "METRICAS_DIR",
+    os.path.join(
+        tempfile.gettempdir(),
+        f"biblioteca_metricas_{zlib.crc32(os.path.abspath(DATABASE_PATH).encode())}",
+    ),
+)
+METRICAS_INTERVALO_S = float(os.environ.get("METRICAS_INTERVALO_S", 5))
+
+BUCKETS_LATENCIA = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+BUCKETS_COMANDOS_SQL = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# Rótulo das requisições que não casaram com nenhuma rota (404)
+ROTA_DESCONHECIDA = "desconhecida"
+
+# Contador de comandos SQL da requisição atual; as greenlets do SQLAlchemy
+# herdam o contexto da task, então o listener enxerga o da requisição
+_comandos_sql = contextvars.ContextVar("comandos_sql", default=None)
+
+
+def contar_comando_sql(conn, cursor, statement, parameters, context, executemany):
+    contador = _comandos_sql.get()
+    if contador is not None:
+        contador[0] += 1
+
+
+for motor in ENGINES:
+    event.listen(motor.sync_engine, "before_cursor_execute", contar_comando_sql)
+
+
+class Metricas:
+    """Métricas de um worker, acumuladas em memória"""
+
+    def __init__(self):
+        # (método, rota, status) -> total
+        self.requisicoes: dict[tuple, int] = {}
+        # (método, rota) -> [contagem por bucket..., +Inf, soma, total]
+        self.latencias: dict[tuple, list] = {}
+        # rota -> [contagem por bucket..., +Inf, soma, total]
+        self.comandos_sql: dict[str, list] = {}
+        self.em_andamento = 0
+
+    def registrar(self, metodo, rota, status, duracao, comandos):
+        chave = (metodo, rota, status)
+        self.requisicoes[chave] = self.requisicoes.get(chave, 0) + 1
+        _observar(self.latencias, (metodo, rota), BUCKETS_LATENCIA, duracao)
+        _observar(self.comandos_sql, rota, BUCKETS_COMANDOS_SQL, comandos)
+
+    def retrato(self):
+        """Estado do worker em formato serializável (JSON)"""
+        pools = estatisticas_pool().values()
+        estatisticas_cache = cache.estatisticas()
+        return {
+            "pid": os.getpid(),
+            "contadores": {
+                "requisicoes": [[*k, v] for k, v in self.requisicoes.items()],
+                "latencias": [[*k, v] for k, v in self.latencias.items()],
+                "comandos_sql": [[k, v] for k, v in self.comandos_sql.items()],
+                "pool_checkouts": sum(pool["checkouts"] for pool in pools),
+                "pool_conexoes_criadas": sum(
+                    pool["conexoes_criadas"] for pool in pools
+                ),
+                "cache": {
+                    chave: estatisticas_cache[chave]
+                    for chave in ("acertos", "faltas", "despejos", "invalidacoes")
+                },
+            },
+            "gauges": {
+                "em_andamento": self.em_andamento,
+                "pool_em_uso": sum(pool["em_uso"] for pool in pools),
+                "cache_entradas": estatisticas_cache["entradas"],
+            },
+        }
+
+
+def _observar(series, chave, buckets, valor):
+    serie = series.get(chave)
+    if serie is None:
+        serie = series[chave] = [0] * (len(buckets) + 3)
+    serie[bisect_left(buckets, valor)] += 1
+    serie[-2] += valor
+    serie[-1] += 1
+
+
+metricas = Metricas()
+
+
+class MedicaoRequisicoes:
+    """Middleware ASGI que alimenta `metricas` a cada requisição HTTP"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status = 500
+
+        async def enviar(mensagem):
+            nonlocal status
+            if mensagem["type"] == "http.response.start":
+                status = mensagem["status"]
+            await send(mensagem)
+
+        contador = [0]
+        token = _comandos_sql.set(contador)
+        metricas.em_andamento += 1
+        inicio = time.perf_counter()
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            duracao = time.perf_counter() - inicio
+            metricas.em_andamento -= 1
+            _comandos_sql.reset(token)
+            # O roteador grava a rota encontrada no próprio scope
+            rota = scope.get("route")
+            metricas.registrar(
+                scope["method"],
+                rota.path if rota is not None else ROTA_DESCONHECIDA,
+                status,
+                duracao,
+                contador[0],
+            )
+
+
+# Retratos compartilhados entre workers
+
+# Os workers do `uvicorn --workers N` são filhos do processo principal; sem
+# ele, o processo é o único worker e o diretório é só dele
+_principal = multiprocessing.parent_process()
+_PID_PRINCIPAL = _principal.pid if _principal is not None else os.getpid()
+_DIRETORIO = os.path.join(METRICAS_DIR, str(_PID_PRINCIPAL))
+_APOSENTADOS = os.path.join(_DIRETORIO, "aposentados.json")
+
+
+def _caminho_retrato(pid):
+    return os.path.join(_DIRETORIO, f"{pid}.json")
+
+
+def _gravar_json(caminho, conteudo):
+    temporario = f"{caminho}.{os.getpid()}.tmp"
+    with open(temporario, "w") as arquivo:
+        json.dump(conteudo, arquivo)
+    os.replace(temporario, caminho)  # leitores nunca veem um arquivo pela metade
+
+
+def gravar_retrato():
+    os.makedirs(_DIRETORIO, exist_ok=True)
+    _gravar_json(_caminho_retrato(os.getpid()), metricas.retrato())
+
+
+def iniciar():
+    """Apaga os retratos de execuções anteriores e publica o deste worker"""
+    os.makedirs(_DIRETORIO, exist_ok=True)
+    for diretorio in glob.glob(os.path.join(METRICAS_DIR, "*")):
+        nome = os.path.basename(diretorio)
+        if nome.isdigit() and int(nome) != _PID_PRINCIPAL and not _vivo(int(nome)):
+            shutil.rmtree(diretorio, ignore_errors=True)
+    # Um retrato com o PID deste worker é de um worker anterior que terminou
+    # (o PID foi reaproveitado): seus contadores vão para os aposentados
+    # antes que o retrato deste worker o substitua
+    _aposentar([_caminho_retrato(os.getpid())])
+    gravar_retrato()
+
+
+async def gravar_periodicamente():
+    while True:
+        await asyncio.sleep(METRICAS_INTERVALO_S)
+        try:
+            gravar_retrato()
+        except OSError as e:
+            logger.error(f"❌ Falha ao gravar métricas em {METRICAS_DIR}: {e}")
+
+
+def _vivo(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _ler_json(caminho):
+    try:
+        with open(caminho) as arquivo:
+            return json.load(arquivo)
+    except (OSError, ValueError):
+        return None
+
+
+def _contadores_vazios():
+    return {
+        "requisicoes": [],
+        "latencias": [],
+        "comandos_sql": [],
+        "pool_checkouts": 0,
+        "pool_conexoes_criadas": 0,
+        "cache": {"acertos": 0, "faltas": 0, "despejos": 0, "invalidacoes": 0},
+    }
+
+
+def _acumular(destino, contadores):
+    """Soma contadores serializados (de retrato()) em `destino`"""
+    for nome, tamanho_chave in (
+        ("requisicoes", 3),
+        ("latencias", 2),
+        ("comandos_sql", 1),
+    ):
+        series = {}
+        _somar_series(series, destino[nome], tamanho_chave)
+        _somar_series(series, contadores[nome], tamanho_chave)
+        destino[nome] = [[*chave, valor] for chave, valor in series.items()]
+    destino["pool_checkouts"] += contadores["pool_checkouts"]
+    destino["pool_conexoes_criadas"] += contadores["pool_conexoes_criadas"]
+    for chave in destino["cache"]:
+        destino["cache"][chave] += contadores["cache"][chave]
+
+
+def _aposentar(caminhos):
+    """Move os contadores dos retratos para os aposentados e apaga os arquivos"""
+    # A trava impede que dois workers somem o mesmo retrato duas vezes
+    with open(os.path.join(_DIRETORIO, ".trava"), "w") as trava:
+        fcntl.flock(trava, fcntl.LOCK_EX)
+        existentes = [caminho for caminho in caminhos if os.path.exists(caminho)]
+        if not existentes:
+            return
+        aposentados = _ler_json(_APOSENTADOS) or _contadores_vazios()
+        for caminho in existentes:
+            retrato = _ler_json(caminho)
+            if retrato is not None:
+                _acumular(aposentados, retrato["contadores"])
+        _gravar_json(_APOSENTADOS, aposentados)
+        for caminho in existentes:
+            os.remove(caminho)
+
+
+def _retratos():
+    retratos, mortos = {}, []
+    for caminho in glob.glob(_caminho_retrato("[0-9]*")):
+        retrato = _ler_json(caminho)
+        if retrato is None or retrato["pid"] == os.getpid():
+            continue
+        if _vivo(retrato["pid"]):
+            retratos[retrato["pid"]] = retrato
+        else:
+            mortos.append(caminho)
+    if mortos:
+        try:
+            _aposentar(mortos)
+        except OSError as e:
+            logger.error(f"❌ Falha ao aposentar métricas em {_DIRETORIO}: {e}")
+    # O retrato deste worker vem da memória, sempre atual
+    retratos[os.getpid()] = metricas.retrato()
+    aposentados = _ler_json(_APOSENTADOS)
+    if aposentados is not None:
+        retratos[None] = {"pid": None, "contadores": aposentados, "gauges": {}}
+    return retratos.values()
+
+
+def _somar_series(destino, series, tamanho_chave):
+    for linha in series:
+        chave, valor = tuple(linha[:tamanho_chave]), linha[tamanho_chave]
+        if isinstance(valor, list):
+            atual = destino.setdefault(chave, [0] * len(valor))
+            for i, parcela in enumerate(valor):
+                atual[i] += parcela
+        else:
+            destino[chave] = destino.get(chave, 0) + valor
+
+
+def _rotulos(**rotulos):
+    texto = ",".join(f'{nome}="{_escapar(valor)}"' for nome, valor in rotulos.items())
+    return "{" + texto + "}" if texto else ""
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _histograma(linhas, nome, buckets, series, nomes_rotulos):
+    for chave, serie in sorted(series.items()):
+        rotulos = dict(zip(nomes_rotulos, chave))
+        acumulado = 0
+        for limite, contagem in zip((*buckets, "+Inf"), serie):
+            acumulado += contagem
+            linhas.append(f"{nome}_bucket{_rotulos(**rotulos, le=limite)} {acumulado}")
+        linhas.append(f"{nome}_sum{_rotulos(**rotulos)} {serie[-2]}")
+        linhas.append(f"{nome}_count{_rotulos(**rotulos)} {serie[-1]}")
+
+
+def exposicao() -> str:
+    """Métricas somadas de todos os workers no formato texto do Prometheus"""
+    requisicoes, latencias, comandos_sql = {}, {}, {}
+    escalares = {
+        "pool_checkouts": 0,
+        "pool_conexoes_criadas": 0,
+        "em_andamento": 0,
+        "pool_em_uso": 0,
+        "cache_entradas": 0,
+    }
+    cache = {"acertos": 0, "faltas": 0, "despejos": 0, "invalidacoes": 0}
+    workers = 0
+
+    for retrato in _retratos():
+        contadores = retrato["contadores"]
+        _somar_series(requisicoes, contadores["requisicoes"], 3)
+        _somar_series(latencias, contadores["latencias"], 2)
+        _somar_series(comandos_sql, contadores["comandos_sql"], 1)
+        escalares["pool_checkouts"] += contadores["pool_checkouts"]
+        escalares["pool_conexoes_criadas"] += contadores["pool_conexoes_criadas"]
+        for chave in cache:
+            cache[chave] += contadores["cache"][chave]
+        if retrato["pid"] is not None:
+            workers += 1
+            for chave, valor in retrato["gauges"].items():
+                escalares[chave] += valor
+
+    linhas = [
+        "# HELP http_requests_total Requisições HTTP atendidas",
+        "# TYPE http_requests_total counter",
+    ]
+    for (metodo, rota, status), total in sorted(requisicoes.items()):
+        linhas.append(
+            f"http_requests_total{_rotulos(method=metodo, route=rota, status=status)} {total}"
+        )
+
+    erros = {}
+    for (metodo, rota, status), total in requisicoes.items():
+        if status >= 500:
+            erros[(metodo, rota)] = erros.get((metodo, rota), 0) + total
+    linhas += [
+        "# HELP http_request_errors_total Requisições HTTP que terminaram com status 5xx",
+        "# TYPE http_request_errors_total counter",
+    ]
+    for (metodo, rota), total in sorted(erros.items()):
+        linhas.append(
+            f"http_request_errors_total{_rotulos(method=metodo, route=rota)} {total}"
+        )
+
+    linhas += [
+        "# HELP http_request_duration_seconds Latência das requisições HTTP",
+        "# TYPE http_request_duration_seconds histogram",
+    ]
+    _histograma(
+        linhas,
+        "http_request_duration_seconds",
+        BUCKETS_LATENCIA,
+        latencias,
+        ("method", "route"),
+    )
+
+    linhas += [
+        "# HELP http_request_sql_statements Comandos SQL executados por requisição",
+        "# TYPE http_request_sql_statements histogram",
+    ]
+    _histograma(
+        linhas,
+        "http_request_sql_statements",
+        BUCKETS_COMANDOS_SQL,
+        comandos_sql,
+        ("route",),
+    )
+
+    consultas_cache = cache["acertos"] + cache["faltas"]
+    linhas += [
+        "# HELP http_requests_in_flight Requisições HTTP em andamento",
+        "# TYPE http_requests_in_flight gauge",
+        f"http_requests_in_flight {escalares['em_andamento']}",
+        "# HELP app_workers Workers com métricas publicadas e ainda vivos",
+        "# TYPE app_workers gauge",
+        f"app_workers {workers}",
+        "# HELP db_pool_checkouts_total Conexões retiradas do pool",
+        "# TYPE db_pool_checkouts_total counter",
+        f"db_pool_checkouts_total {escalares['pool_checkouts']}",
+        "# HELP db_pool_connections_created_total Conexões abertas com o banco",
+        "# TYPE db_pool_connections_created_total counter",
+        f"db_pool_connections_created_total {escalares['pool_conexoes_criadas']}",
+        "# HELP db_pool_connections_in_use Conexões do pool em uso",
+        "# TYPE db_pool_connections_in_use gauge",
+        f"db_pool_connections_in_use {escalares['pool_em_uso']}",
+        "# HELP cache_hits_total Acertos do cache de leitura",
+        "# TYPE cache_hits_total counter",
+        f"cache_hits_total {cache['acertos']}",
+        "# HELP cache_misses_total Faltas do cache de leitura",
+        "# TYPE cache_misses_total counter",
+        f"cache_misses_total {cache['faltas']}",
+        "# HELP cache_evictions_total Entradas despejadas do cache de leitura (LRU)",
+        "# TYPE cache_evictions_total counter",
+        f"cache_evictions_total {cache['despejos']}",
+        "# HELP cache_invalidations_total Entradas invalidadas por escritas",
+        "# TYPE cache_invalidations_total counter",
+        f"cache_invalidations_total {cache['invalidacoes']}",
+        "# HELP cache_entries Entradas no cache de leitura",
+        "# TYPE cache_entries gauge",
+        f"cache_entries {escalares['cache_entradas']}",
+        "# HELP cache_hit_ratio Fração das leituras atendidas pelo cache",
+        "# TYPE cache_hit_ratio gauge",
+        f"cache_hit_ratio {cache['acertos'] / consultas_cache if consultas_cache else 0}",
+    ]
+    return "\n".join(linhas) + "\n"
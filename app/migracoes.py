@@ -0,0 +1,384 @@
+## Migrações incrementais aplicadas sobre bancos já existentes
+#
+# O esquema base é criado por database/sqlite_script.txt. Alterações
+# posteriores (índices, tabelas auxiliares, triggers) ficam aqui, numeradas,
+# para que bancos antigos sejam atualizados na inicialização da API.
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _triggers_alteracoes(tabela):
+    """Triggers que registram em cache_changes cada linha alterada da tabela"""
+    return [
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_{tabela}_changes_{operacao.lower()}
+        AFTER {operacao} ON {tabela}
+        BEGIN
+            INSERT INTO cache_changes (table_name, row_id)
+            VALUES ('{tabela}', {linha}.id);
+        END
+        """
+        for operacao, linha in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD"))
+    ]
+
+
+def _triggers_versao(tabela):
+    """Triggers que incrementam a versão da tabela em table_versions"""
+    return [f"""
+        CREATE TRIGGER IF NOT EXISTS trg_{tabela}_version_{operacao.lower()}
+        AFTER {operacao} ON {tabela}
+        BEGIN
+            UPDATE table_versions SET version = version + 1
+            WHERE table_name = '{tabela}';
+        END
+        """ for operacao in ("INSERT", "UPDATE", "DELETE")]
+
+
+# Condição dos triggers de empréstimo para gravar o próprio log
+_LOGS_PELOS_TRIGGERS = (
+    "COALESCE((SELECT value FROM audit_config WHERE name = 'logs_by_app'), 0) = 0"
+)
+
+MIGRACOES = [
+    (
+        1,
+        "Índices para paginação keyset",
+        [
+            "CREATE INDEX IF NOT EXISTS idx_logs_timestamp_id ON logs(timestamp, id)",
+        ],
+    ),
+    (
+        2,
+        "Total de livros por autor mantido por triggers",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS author_book_counts (
+                author_id INTEGER PRIMARY KEY,
+                total INTEGER NOT NULL DEFAULT 0,
+                FOREIGN KEY (author_id) REFERENCES authors(id) ON DELETE CASCADE
+            )
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_books_count_insert
+            AFTER INSERT ON books
+            BEGIN
+                INSERT INTO author_book_counts (author_id, total)
+                VALUES (NEW.author_id, 1)
+                ON CONFLICT(author_id) DO UPDATE SET total = total + 1;
+            END
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_books_count_delete
+            AFTER DELETE ON books
+            BEGIN
+                UPDATE author_book_counts SET total = total - 1
+                WHERE author_id = OLD.author_id;
+            END
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_books_count_move
+            AFTER UPDATE OF author_id ON books
+            WHEN OLD.author_id IS NOT NEW.author_id
+            BEGIN
+                UPDATE author_book_counts SET total = total - 1
+                WHERE author_id = OLD.author_id;
+
+                INSERT INTO author_book_counts (author_id, total)
+                VALUES (NEW.author_id, 1)
+                ON CONFLICT(author_id) DO UPDATE SET total = total + 1;
+            END
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_authors_count_delete
+            AFTER DELETE ON authors
+            BEGIN
+                DELETE FROM author_book_counts WHERE author_id = OLD.id;
+            END
+            """,
+            """
+            INSERT OR REPLACE INTO author_book_counts (author_id, total)
+            SELECT author_id, COUNT(*) FROM books GROUP BY author_id
+            """,
+        ],
+    ),
+    (
+        3,
+        "Índice de busca textual (FTS5) sobre livros, autores e gêneros",
+        [
+            "CREATE INDEX IF NOT EXISTS idx_books_genre ON books(genre_id)",
+            """
+            CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5(
+                title, author, genre,
+                tokenize = 'unicode61 remove_diacritics 2'
+            )
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_books_fts_insert
+            AFTER INSERT ON books
+            BEGIN
+                INSERT INTO books_fts (rowid, title, author, genre)
+                VALUES (
+                    NEW.id,
+                    NEW.title,
+                    (SELECT name FROM authors WHERE id = NEW.author_id),
+                    (SELECT name FROM genres WHERE id = NEW.genre_id)
+                );
+            END
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_books_fts_update
+            AFTER UPDATE OF title, author_id, genre_id ON books
+            BEGIN
+                DELETE FROM books_fts WHERE rowid = OLD.id;
+
+                INSERT INTO books_fts (rowid, title, author, genre)
+                VALUES (
+                    NEW.id,
+                    NEW.title,
+                    (SELECT name FROM authors WHERE id = NEW.author_id),
+                    (SELECT name FROM genres WHERE id = NEW.genre_id)
+                );
+            END
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_books_fts_delete
+            AFTER DELETE ON books
+            BEGIN
+                DELETE FROM books_fts WHERE rowid = OLD.id;
+            END
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_authors_fts_update
+            AFTER UPDATE OF name ON authors
+            BEGIN
+                UPDATE books_fts SET author = NEW.name
+                WHERE rowid IN (SELECT id FROM books WHERE author_id = NEW.id);
+            END
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_genres_fts_update
+            AFTER UPDATE OF name ON genres
+            BEGIN
+                UPDATE books_fts SET genre = NEW.name
+                WHERE rowid IN (SELECT id FROM books WHERE genre_id = NEW.id);
+            END
+            """,
+            "DELETE FROM books_fts",
+            """
+            INSERT INTO books_fts (rowid, title, author, genre)
+            SELECT books.id, books.title, authors.name, genres.name
+            FROM books
+            LEFT JOIN authors ON authors.id = books.author_id
+            LEFT JOIN genres ON genres.id = books.genre_id
+            """,
+        ],
+    ),
+    (
+        4,
+        "Log de alterações de gêneros, autores e livros para o cache de leitura",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS cache_changes (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                table_name TEXT NOT NULL,
+                row_id INTEGER NOT NULL
+            )
+            """,
+            # Mantém só as alterações mais recentes; um worker que ficar para
+            # trás percebe a lacuna e descarta o cache inteiro
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_cache_changes_prune
+            AFTER INSERT ON cache_changes
+            WHEN NEW.seq % 1000 = 0
+            BEGIN
+                DELETE FROM cache_changes WHERE seq <= NEW.seq - 10000;
+            END
+            """,
+            *_triggers_alteracoes("genres"),
+            *_triggers_alteracoes("authors"),
+            *_triggers_alteracoes("books"),
+        ],
+    ),
+    (
+        5,
+        "Versão por tabela do catálogo para ETags",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS table_versions (
+                table_name TEXT PRIMARY KEY,
+                version INTEGER NOT NULL DEFAULT 0
+            ) WITHOUT ROWID
+            """,
+            # '_epoch' distingue bancos recriados, cujas versões recomeçam do 0
+            """
+            INSERT OR IGNORE INTO table_versions (table_name, version)
+            VALUES ('_epoch', abs(random()) % 1000000000),
+                   ('genres', 0), ('authors', 0), ('books', 0), ('stock', 0)
+            """,
+            *_triggers_versao("genres"),
+            *_triggers_versao("authors"),
+            *_triggers_versao("books"),
+            *_triggers_versao("stock"),
+        ],
+    ),
+    (
+        6,
+        "Filtro de logs por ação e resumo diário para a retenção",
+        [
+            "CREATE INDEX IF NOT EXISTS idx_logs_action_timestamp_id"
+            " ON logs(action, timestamp, id)",
+            # Totais por dia (UTC) e ação dos logs já apagados pela retenção
+            """
+            CREATE TABLE IF NOT EXISTS log_daily_summary (
+                day TEXT NOT NULL,
+                action TEXT NOT NULL,
+                total INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (day, action)
+            ) WITHOUT ROWID
+            """,
+        ],
+    ),
+    (
+        7,
+        "Logs de empréstimo gravados pelos triggers ou pela aplicação",
+        [
+            # logs_by_app = 1: a API grava os logs de empréstimo, devolução e
+            # exclusão em lotes (app/auditoria.py) e os triggers não os gravam
+            """
+            CREATE TABLE IF NOT EXISTS audit_config (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            ) WITHOUT ROWID
+            """,
+            "INSERT OR IGNORE INTO audit_config (name, value) VALUES ('logs_by_app', 0)",
+            "DROP TRIGGER IF EXISTS trg_borrowal_insert",
+            f"""
+            CREATE TRIGGER trg_borrowal_insert
+            AFTER INSERT ON borrowals
+            BEGIN
+                UPDATE stock SET quantity = quantity - 1 WHERE book_id = NEW.book_id;
+
+                INSERT INTO borrowal_history (book_id, borrower_id, action, date)
+                VALUES (NEW.book_id, NEW.borrower_id, 'borrowed', NEW.borrow_date);
+
+                INSERT INTO logs (action, description)
+                SELECT
+                    'BORROW',
+                    'Livro ID ' || NEW.book_id ||
+                    ' | Usuário ID ' || NEW.borrower_id ||
+                    ' | Devolução: ' || COALESCE(NEW.return_date, 'Pendente')
+                WHERE {_LOGS_PELOS_TRIGGERS};
+            END
+            """,
+            "DROP TRIGGER IF EXISTS trg_borrowal_return",
+            f"""
+            CREATE TRIGGER trg_borrowal_return
+            AFTER UPDATE OF return_date ON borrowals
+            WHEN NEW.return_date IS NOT NULL AND OLD.return_date IS NULL
+            BEGIN
+                UPDATE stock SET quantity = quantity + 1 WHERE book_id = NEW.book_id;
+
+                INSERT INTO borrowal_history (book_id, borrower_id, action, date)
+                VALUES (NEW.book_id, NEW.borrower_id, 'returned', NEW.return_date);
+
+                INSERT INTO logs (action, description)
+                SELECT
+                    'RETURN',
+                    'Livro ID ' || NEW.book_id ||
+                    ' | Usuário ID ' || NEW.borrower_id ||
+                    ' | Atraso: ' || CAST(
+                        CASE
+                            WHEN JULIANDAY(NEW.return_date) > JULIANDAY(OLD.borrow_date, '+30 days')
+                            THEN (JULIANDAY(NEW.return_date) - JULIANDAY(OLD.borrow_date, '+30 days'))
+                            ELSE 0
+                        END AS INTEGER
+                    ) || ' dias'
+                WHERE {_LOGS_PELOS_TRIGGERS};
+            END
+            """,
+            "DROP TRIGGER IF EXISTS trg_borrowal_delete",
+            f"""
+            CREATE TRIGGER trg_borrowal_delete
+            AFTER DELETE ON borrowals
+            WHEN OLD.return_date IS NULL
+            BEGIN
+                UPDATE stock SET quantity = quantity + 1 WHERE book_id = OLD.book_id;
+
+                INSERT INTO logs (action, description)
+                SELECT
+                    'DELETE',
+                    'Empréstimo ID ' || OLD.id ||
+                    ' excluído | Estoque ajustado (+1)'
+                WHERE {_LOGS_PELOS_TRIGGERS};
+            END
+            """,
+        ],
+    ),
+    (
+        8,
+        "Versão por linha do estoque para atualizações otimistas",
+        [
+            "ALTER TABLE stock ADD COLUMN version INTEGER NOT NULL DEFAULT 0",
+            # A API incrementa version no próprio UPDATE (e o lê no RETURNING);
+            # as demais alterações de quantidade (triggers de empréstimo,
+            # escritas diretas no banco) são incrementadas aqui
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_stock_row_version
+            AFTER UPDATE OF quantity ON stock
+            WHEN NEW.version = OLD.version
+            BEGIN
+                UPDATE stock SET version = OLD.version + 1
+                WHERE book_id = NEW.book_id;
+            END
+            """,
+        ],
+    ),
+    (
+        9,
+        "Chaves de idempotência dos empréstimos e devoluções",
+        [
+            # key: 16 bytes do SHA-256 de "MÉTODO /rota:Idempotency-Key";
+            # request_hash: 16 bytes do SHA-256 do corpo da requisição;
+            # expires_at: segundos Unix (ver app/idempotencia.py)
+            """
+            CREATE TABLE IF NOT EXISTS idempotency_keys (
+                key BLOB PRIMARY KEY,
+                request_hash BLOB NOT NULL,
+                status INTEGER NOT NULL,
+                body TEXT NOT NULL,
+                expires_at INTEGER NOT NULL
+            ) WITHOUT ROWID
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires_at"
+            " ON idempotency_keys(expires_at)",
+        ],
+    ),
+]
+
+
+def aplicar_migracoes(conexao):
+    """Aplica, em ordem, as migrações ainda não registradas no banco"""
+    conexao.exec_driver_sql("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            versao INTEGER PRIMARY KEY,
+            descricao TEXT NOT NULL,
+            aplicada_em DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        """)
+    aplicadas = {
+        linha[0]
+        for linha in conexao.exec_driver_sql("SELECT versao FROM schema_migrations")
+    }
+
+    for versao, descricao, comandos in MIGRACOES:
+        if versao in aplicadas:
+            continue
+        for comando in comandos:
+            conexao.exec_driver_sql(comando)
+        conexao.exec_driver_sql(
+            "INSERT OR IGNORE INTO schema_migrations (versao, descricao) VALUES (?, ?)",
+            (versao, descricao),
+        )
+        logger.info(f"🛠️ Migração {versao} aplicada: {descricao}")
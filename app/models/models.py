@@ -11,6 +11,13 @@ class Autor(Base):
     country = Column(String)
 
 
+class TotalLivrosAutor(Base):
+    # Mantida pelos triggers trg_books_count_* (ver app/migracoes.py)
+    __tablename__ = "author_book_counts"
+    author_id = Column(Integer, ForeignKey("authors.id"), primary_key=True)
+    total = Column(Integer, nullable=False, default=0)
+
+
 class Usuario(Base):
     __tablename__ = "borrowers"
     id = Column(Integer, primary_key=True, index=True)
@@ -50,6 +57,7 @@ class Stock(Base):
     __tablename__ = "stock"
     book_id = Column(Integer, ForeignKey("books.id"), unique=True, primary_key=True)
     quantity = Column(Integer, default=0)
+    version = Column(Integer, nullable=False, default=0)
 
 
 class Historico_de_emprestimos(Base):
@@ -68,3 +76,11 @@ class Log(Base):
     action = Column(String, nullable=False)
     description = Column(String)
     timestamp = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class ResumoDiarioLog(Base):
+    # Preenchida pela retenção de logs (ver app/retencao_logs.py)
+    __tablename__ = "log_daily_summary"
+    day = Column(String, primary_key=True)
+    action = Column(String, primary_key=True)
+    total = Column(Integer, nullable=False, default=0)
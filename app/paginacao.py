@@ -0,0 +1,82 @@
+## Paginação por cursor (keyset) compartilhada pelos endpoints de listagem
+
+import base64
+import binascii
+import json
+from typing import Optional
+
+from fastapi import HTTPException, Query, status
+from sqlalchemy import tuple_
+
+LIMITE_PADRAO = 100
+LIMITE_MAXIMO = 1000
+
+
+class ParametrosPaginacao:
+    """Dependency com os parâmetros `limit` e `after` das listagens"""
+
+    def __init__(
+        self,
+        limit: int = Query(
+            LIMITE_PADRAO,
+            ge=1,
+            le=LIMITE_MAXIMO,
+            description="Quantidade máxima de itens na página",
+        ),
+        after: Optional[str] = Query(
+            None, description="Cursor retornado em `next_cursor` pela página anterior"
+        ),
+    ):
+        self.limit = limit
+        self.after = after
+
+
+def codificar_cursor(*valores) -> str:
+    """Gera um cursor opaco a partir dos valores da chave de ordenação"""
+    bruto = json.dumps(valores, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(bruto).decode().rstrip("=")
+
+
+def decodificar_cursor(cursor: str, quantidade: int) -> list:
+    """Recupera os valores da chave de ordenação a partir de um cursor"""
+    try:
+        preenchimento = "=" * (-len(cursor) % 4)
+        valores = json.loads(base64.urlsafe_b64decode(cursor + preenchimento))
+    except (binascii.Error, ValueError):
+        valores = None
+
+    if not isinstance(valores, list) or len(valores) != quantidade:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Cursor inválido"
+        )
+    return valores
+
+
+async def paginar(
+    db, query, colunas, paginacao: ParametrosPaginacao, descendente=False
+):
+    """
+    Aplica paginação keyset a um `select()` ORM.
+
+    `colunas` é a chave de ordenação (única e indexada). Em vez de OFFSET, a
+    página seguinte filtra a partir da última chave vista, então o custo de
+    cada página não depende da profundidade. A query retorna tuplas
+    `(modelo, *colunas)` para que o cursor use os valores crus do banco.
+    """
+    if paginacao.after is not None:
+        ultimo = decodificar_cursor(paginacao.after, len(colunas))
+        chave = tuple_(*colunas) if len(colunas) > 1 else colunas[0]
+        limite = tuple_(*ultimo) if len(colunas) > 1 else ultimo[0]
+        query = query.where(chave < limite if descendente else chave > limite)
+
+    ordem = [coluna.desc() if descendente else coluna for coluna in colunas]
+    rotulos = [coluna.label(f"cursor_{i}") for i, coluna in enumerate(colunas)]
+    query = query.add_columns(*rotulos).order_by(*ordem).limit(paginacao.limit + 1)
+    linhas = (await db.execute(query)).all()
+
+    proximo = None
+    if len(linhas) > paginacao.limit:
+        linhas = linhas[: paginacao.limit]
+        proximo = codificar_cursor(*linhas[-1][1:])
+
+    return {"items": [linha[0] for linha in linhas], "next_cursor": proximo}
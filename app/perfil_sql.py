@@ -0,0 +1,181 @@
+## Perfil dos comandos SQL de cada requisição (opcional: PERFIL_SQL=1)
+#
+# Listeners do SQLAlchemy contam e cronometram cada comando executado
+# durante a requisição. O resultado vai no header `Server-Timing` (visível
+# na aba de rede do navegador) e em GET /status/perfil-sql, agregado por
+# rota. Quando o mesmo formato de comando (o SQL com os parâmetros como `?`
+# e listas de IN colapsadas) se repete mais de PERFIL_SQL_REPETICOES vezes
+# em uma requisição, um aviso de possível N+1 vai para o log.
+#
+# PERFIL_SQL_AMOSTRAGEM (0 a 1) escolhe a fração das requisições medidas;
+# nas demais o custo é uma leitura de contextvar por comando.
+
+import contextvars
+import os
+import random
+import re
+import time
+
+from sqlalchemy import event
+
+from app.database import ENGINES, logger
+from app.metricas import ROTA_DESCONHECIDA
+
+HABILITADO = os.environ.get("PERFIL_SQL", "0") == "1"
+PERFIL_SQL_AMOSTRAGEM = float(os.environ.get("PERFIL_SQL_AMOSTRAGEM", 1.0))
+PERFIL_SQL_REPETICOES = int(os.environ.get("PERFIL_SQL_REPETICOES", 5))
+
+_perfil_atual = contextvars.ContextVar("perfil_sql", default=None)
+
+_ESPACOS = re.compile(r"\s+")
+# "IN (?, ?, ?)" e "VALUES (?, ?), (?, ?)" variam com a quantidade de itens
+_LISTA_PARAMETROS = re.compile(r"\(\?(?:, \?)*\)(?:, \(\?(?:, \?)*\))*")
+
+
+def formato_comando(statement: str) -> str:
+    """SQL normalizado: o mesmo formato para qualquer quantidade de parâmetros"""
+    return _LISTA_PARAMETROS.sub("(?)", _ESPACOS.sub(" ", statement).strip())
+
+
+class PerfilRequisicao:
+    """Comandos SQL executados em uma requisição"""
+
+    def __init__(self):
+        self.comandos = 0
+        self.tempo_s = 0.0
+        # SQL -> [execuções, tempo total]
+        self.formatos: dict[str, list] = {}
+
+    def registrar(self, statement, duracao):
+        self.comandos += 1
+        self.tempo_s += duracao
+        formato = self.formatos.setdefault(statement, [0, 0.0])
+        formato[0] += 1
+        formato[1] += duracao
+
+    def repetidos(self, limite):
+        """Formatos executados mais de `limite` vezes, do mais repetido ao menos"""
+        contagem = {}
+        for statement, (execucoes, tempo) in self.formatos.items():
+            atual = contagem.setdefault(formato_comando(statement), [0, 0.0])
+            atual[0] += execucoes
+            atual[1] += tempo
+        return sorted(
+            (
+                (formato, execucoes, tempo)
+                for formato, (execucoes, tempo) in contagem.items()
+                if execucoes > limite
+            ),
+            key=lambda item: -item[1],
+        )
+
+
+def _antes(conn, cursor, statement, parameters, context, executemany):
+    if _perfil_atual.get() is not None:
+        conn.info.setdefault("perfil_sql_inicio", []).append(time.perf_counter())
+
+
+def _depois(conn, cursor, statement, parameters, context, executemany):
+    perfil = _perfil_atual.get()
+    inicios = conn.info.get("perfil_sql_inicio")
+    if perfil is not None and inicios:
+        perfil.registrar(statement, time.perf_counter() - inicios.pop())
+
+
+def ativar():
+    """Registra os listeners nos engines (chamado só quando PERFIL_SQL=1)"""
+    for motor in ENGINES:
+        event.listen(motor.sync_engine, "before_cursor_execute", _antes)
+        event.listen(motor.sync_engine, "after_cursor_execute", _depois)
+
+
+# rota -> totais das requisições amostradas
+_rotas: dict[str, dict] = {}
+
+
+def estatisticas():
+    return {
+        "habilitado": HABILITADO,
+        "amostragem": PERFIL_SQL_AMOSTRAGEM,
+        "limite_repeticoes": PERFIL_SQL_REPETICOES,
+        "rotas": {
+            rota: {
+                **totais,
+                "comandos_por_requisicao": round(
+                    totais["comandos"] / totais["requisicoes"], 2
+                ),
+                "tempo_sql_ms": round(totais["tempo_sql_ms"], 3),
+            }
+            for rota, totais in sorted(
+                _rotas.items(), key=lambda item: -item[1]["comandos"]
+            )
+        },
+    }
+
+
+class PerfilSQL:
+    """Middleware ASGI que mede os comandos SQL das requisições amostradas"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or random.random() >= PERFIL_SQL_AMOSTRAGEM:
+            return await self.app(scope, receive, send)
+
+        perfil = PerfilRequisicao()
+        inicio = time.perf_counter()
+
+        async def enviar(mensagem):
+            if mensagem["type"] == "http.response.start":
+                total_ms = (time.perf_counter() - inicio) * 1000
+                valor = (
+                    f'db;dur={perfil.tempo_s * 1000:.2f};desc="{perfil.comandos} SQL",'
+                    f" app;dur={total_ms:.2f}"
+                )
+                mensagem = {
+                    **mensagem,
+                    "headers": [
+                        *mensagem.get("headers", []),
+                        (b"server-timing", valor.encode()),
+                    ],
+                }
+            await send(mensagem)
+
+        token = _perfil_atual.set(perfil)
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            _perfil_atual.reset(token)
+            rota = scope.get("route")
+            self._registrar(
+                scope["method"],
+                rota.path if rota is not None else ROTA_DESCONHECIDA,
+                perfil,
+            )
+
+    def _registrar(self, metodo, rota, perfil):
+        chave = f"{metodo} {rota}"
+        totais = _rotas.setdefault(
+            chave,
+            {
+                "requisicoes": 0,
+                "comandos": 0,
+                "max_comandos": 0,
+                "tempo_sql_ms": 0.0,
+                "alertas_n_mais_1": 0,
+            },
+        )
+        totais["requisicoes"] += 1
+        totais["comandos"] += perfil.comandos
+        totais["max_comandos"] = max(totais["max_comandos"], perfil.comandos)
+        totais["tempo_sql_ms"] += perfil.tempo_s * 1000
+
+        repetidos = perfil.repetidos(PERFIL_SQL_REPETICOES)
+        if repetidos:
+            totais["alertas_n_mais_1"] += 1
+        for formato, execucoes, tempo in repetidos:
+            logger.warning(
+                f"⚠️ Possível N+1 em {chave}: {execucoes}x ({tempo * 1000:.1f} ms) "
+                f"{formato[:300]}"
+            )
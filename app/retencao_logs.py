@@ -0,0 +1,99 @@
+## Retenção dos logs: compacta as linhas antigas em totais diários
+#
+# Os triggers de empréstimo, devolução e exclusão gravam uma linha em `logs`
+# a cada operação. Linhas anteriores a LOG_RETENCAO_DIAS dias (contados a
+# partir do início do dia, em UTC como o CURRENT_TIMESTAMP do SQLite) são
+# somadas em `log_daily_summary` (um total por dia e ação) e apagadas.
+#
+# O trabalho é feito em lotes de LOG_RETENCAO_LOTE linhas, cada um em uma
+# transação curta que soma e apaga as mesmas linhas: a trava de escrita é
+# liberada entre os lotes, então empréstimos e devoluções esperam no máximo
+# um lote, e uma interrupção no meio nunca conta uma linha duas vezes.
+
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import text
+
+from app.database import logger
+from app.escrita import transacao_de_escrita
+
+LOG_RETENCAO_DIAS = int(os.environ.get("LOG_RETENCAO_DIAS", 0))
+LOG_RETENCAO_INTERVALO_S = float(os.environ.get("LOG_RETENCAO_INTERVALO_S", 3600))
+LOG_RETENCAO_LOTE = int(os.environ.get("LOG_RETENCAO_LOTE", 1000))
+
+# Pausa entre lotes para que escritores à espera da trava consigam entrar
+PAUSA_ENTRE_LOTES_S = 0.05
+
+# Os dois comandos selecionam o mesmo lote (o mais antigo pela ordem do
+# índice idx_logs_timestamp_id) dentro da mesma transação de escrita
+_LOTE = """
+    SELECT id FROM logs WHERE timestamp < :limite
+    ORDER BY timestamp, id LIMIT :tamanho
+"""
+_SOMAR_LOTE = text(f"""
+    INSERT INTO log_daily_summary (day, action, total)
+    SELECT date(timestamp), action, COUNT(*) FROM logs
+    WHERE id IN ({_LOTE})
+    GROUP BY date(timestamp), action
+    ON CONFLICT (day, action) DO UPDATE SET total = total + excluded.total
+""")
+_APAGAR_LOTE = text(f"DELETE FROM logs WHERE id IN ({_LOTE})")
+
+
+def limite_retencao(dias: int) -> str:
+    """Timestamp (texto do SQLite) a partir do qual os logs são mantidos"""
+    inicio_do_dia = datetime.now(timezone.utc).replace(
+        hour=0, minute=0, second=0, microsecond=0
+    )
+    return (inicio_do_dia - timedelta(days=dias)).strftime("%Y-%m-%d %H:%M:%S")
+
+
+async def compactar_logs(
+    dias: int,
+    tamanho_lote: int = LOG_RETENCAO_LOTE,
+    pausa: float = PAUSA_ENTRE_LOTES_S,
+):
+    """
+    Soma em log_daily_summary e apaga os logs mais antigos que `dias` dias,
+    lote a lote. Retorna o relatório da execução.
+    """
+    parametros = {"limite": limite_retencao(dias), "tamanho": tamanho_lote}
+    relatorio = {"limite": parametros["limite"], "apagadas": 0, "lotes": 0}
+    maior_lote_s = 0.0
+    inicio = time.perf_counter()
+
+    while True:
+        inicio_lote = time.perf_counter()
+        async with transacao_de_escrita() as conn:
+            await conn.execute(_SOMAR_LOTE, parametros)
+            apagadas = (await conn.execute(_APAGAR_LOTE, parametros)).rowcount
+        maior_lote_s = max(maior_lote_s, time.perf_counter() - inicio_lote)
+
+        if apagadas:
+            relatorio["apagadas"] += apagadas
+            relatorio["lotes"] += 1
+        if apagadas < tamanho_lote:
+            break
+        await asyncio.sleep(pausa)
+
+    relatorio["duracao_s"] = round(time.perf_counter() - inicio, 3)
+    relatorio["maior_lote_ms"] = round(maior_lote_s * 1000, 1)
+    return relatorio
+
+
+async def executar_periodicamente():
+    """Aplica a retenção a cada LOG_RETENCAO_INTERVALO_S segundos"""
+    while True:
+        try:
+            relatorio = await compactar_logs(LOG_RETENCAO_DIAS)
+            if relatorio["apagadas"]:
+                logger.info(
+                    f"🧹 {relatorio['apagadas']} logs anteriores a "
+                    f"{relatorio['limite']} compactados em {relatorio['duracao_s']}s"
+                )
+        except Exception as e:
+            logger.error(f"❌ Falha na retenção de logs: {e}")
+        await asyncio.sleep(LOG_RETENCAO_INTERVALO_S)
@@ -1,63 +1,144 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy import func
-from sqlalchemy.orm import Session
-from app.database import SessionLocal
-from app.models.models import Autor, Livro
-from app.schemas.autor_schema import AutorCreate, AutorUpdatePATCH, AutorUpdatePUT
+from itertools import groupby
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.cache import cache
+from app.condicional import condicional
+from app.database import get_db
+from app.erros import traduzir_violacao
+from app.importacao import (
+    CORPO_IMPORTACAO,
+    TAMANHO_LOTE,
+    formato_da_requisicao,
+    importar,
+)
+from app.models.models import Autor, Genero, Livro, TotalLivrosAutor
+from app.schemas.autor_schema import (
+    AutorCreate,
+    AutorUpdatePATCH,
+    AutorUpdatePUT,
+    AutorResponse,
+)
+from app.schemas.pagina_schema import Pagina
+from app.paginacao import ParametrosPaginacao, paginar
+from app.busca_aproximada import indice_autores
 
 # router = APIRouter(prefix="/autores", tags="AUTORES")
 router = APIRouter()
 
 
-# Dependency
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
-@router.get("/")
-def listar_autores(db: Session = Depends(get_db)):
-    autores = db.query(Autor).all()
-    return autores
+@router.get(
+    "/",
+    response_model=Pagina[AutorResponse],
+    dependencies=[condicional("authors")],
+)
+async def listar_autores(
+    paginacao: ParametrosPaginacao = Depends(), db: AsyncSession = Depends(get_db)
+):
+    return await paginar(db, select(Autor), [Autor.id], paginacao)
 
 
 # Endpoint: Total de livros por autor
-@router.get("/quantidade-de-livros", response_model=list[dict])
-def quantidade_de_livros(db: Session = Depends(get_db)):
-    autores = db.query(Autor).all()
+@router.get(
+    "/quantidade-de-livros",
+    response_model=list[dict],
+    dependencies=[condicional("authors", "books", "genres")],
+)
+async def quantidade_de_livros(
+    resumo: bool = Query(
+        False,
+        description="Retorna apenas os totais pré-calculados, sem a lista de livros",
+    ),
+    db: AsyncSession = Depends(get_db),
+):
+    if resumo:
+        linhas = (
+            await db.execute(
+                select(Autor.id, Autor.name, func.coalesce(TotalLivrosAutor.total, 0))
+                .outerjoin(TotalLivrosAutor, TotalLivrosAutor.author_id == Autor.id)
+                .order_by(Autor.id)
+            )
+        ).all()
+        if not linhas:
+            raise HTTPException(status_code=404, detail="Nenhum autor encontrado.")
+
+        return [
+            {"id": autor_id, "autor": nome, "total_livros": total}
+            for autor_id, nome, total in linhas
+        ]
+
+    # Uma única consulta com autores, livros e gêneros; o agrupamento por
+    # autor é feito em memória sobre as linhas já ordenadas
+    linhas = (
+        await db.execute(
+            select(
+                Autor.id,
+                Autor.name,
+                Livro.id,
+                Livro.title,
+                Livro.publication_year,
+                Genero.name,
+            )
+            .outerjoin(Livro, Livro.author_id == Autor.id)
+            .outerjoin(Genero, Genero.id == Livro.genre_id)
+            .order_by(Autor.id, Livro.id)
+        )
+    ).all()
 
-    if not autores:
+    if not linhas:
         raise HTTPException(status_code=404, detail="Nenhum autor encontrado.")
 
     resultado = []
-    for autor in autores:
-        livros = db.query(Livro).filter(Livro.author_id == autor.id).all()
+    for (autor_id, nome), grupo in groupby(linhas, key=lambda linha: linha[:2]):
+        livros = [
+            {
+                "id": livro_id,
+                "titulo": titulo,
+                "ano": ano,
+                "genero": genero,
+            }
+            for _, _, livro_id, titulo, ano, genero in grupo
+            if livro_id is not None
+        ]
 
         resultado.append(
             {
-                "id": autor.id,
-                "autor": autor.name,
+                "id": autor_id,
+                "autor": nome,
                 "total_livros": len(livros),
-                "livros": [
-                    {
-                        "id": livro.id,
-                        "titulo": livro.title,
-                        "ano": livro.publication_year,
-                        "genero": livro.genre,
-                    }
-                    for livro in livros
-                ],
+                "livros": livros,
             }
         )
 
     return resultado
 
 
+@router.get(
+    "/{autor_id}/quantidade-de-livros",
+    dependencies=[condicional("authors", "books")],
+)
+async def quantidade_de_livros_do_autor(
+    autor_id: int, db: AsyncSession = Depends(get_db)
+):
+    linha = (
+        await db.execute(
+            select(Autor.name, func.coalesce(TotalLivrosAutor.total, 0))
+            .outerjoin(TotalLivrosAutor, TotalLivrosAutor.author_id == Autor.id)
+            .where(Autor.id == autor_id)
+        )
+    ).first()
+    if not linha:
+        raise HTTPException(status_code=404, detail="Autor não encontrado")
+
+    return {"id": autor_id, "autor": linha[0], "total_livros": linha[1]}
+
+
 @router.get(
     "/{autor_id}",
+    dependencies=[condicional("authors")],
     responses={
         status.HTTP_200_OK: {
             "description": "Autor encontrado com sucesso",
@@ -79,13 +160,31 @@ def quantidade_de_livros(db: Session = Depends(get_db)):
         },
     },
 )
-def obter_autor(autor_id: int, db: Session = Depends(get_db)):
-    autor = db.query(Autor).filter(Autor.id == autor_id).first()
+async def obter_autor(autor_id: int, db: AsyncSession = Depends(get_db)):
+    async def carregar():
+        autor = await db.get(Autor, autor_id)
+        return AutorResponse.model_validate(autor) if autor else None
+
+    autor = await cache.obter(("autor", autor_id), carregar, [("authors", autor_id)])
     if not autor:
         raise HTTPException(status_code=404, detail="Autor não encontrado")
     return autor
 
 
+@router.post("/importar", openapi_extra=CORPO_IMPORTACAO)
+async def importar_autores(
+    request: Request,
+    formato: Optional[str] = Query(None, description="csv ou ndjson"),
+    lote: int = Query(TAMANHO_LOTE, ge=1, le=10_000),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Importa autores em massa de um CSV ou NDJSON enviado no corpo
+    """
+    formato = formato_da_requisicao(request, formato)
+    return await importar(db, "autores", request.stream(), formato, lote)
+
+
 @router.post(
     "/",
     status_code=status.HTTP_201_CREATED,
@@ -101,24 +200,42 @@ def obter_autor(autor_id: int, db: Session = Depends(get_db)):
         status.HTTP_400_BAD_REQUEST: {"description": "Dados inválidos"},
     },
 )
-def criar_autor(autor: AutorCreate, db: Session = Depends(get_db)):
+async def criar_autor(autor: AutorCreate, db: AsyncSession = Depends(get_db)):
     try:
         novo_autor = Autor(name=autor.name, country=autor.country)
 
         db.add(novo_autor)
-        db.commit()
-        db.refresh(novo_autor)
+        await db.commit()
+        await db.refresh(novo_autor)
+        indice_autores.adicionar(novo_autor.id, novo_autor.name)
+        cache.invalidar("authors", novo_autor.id)
 
         return novo_autor
 
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Erro ao criar autor: {str(e)}",
         )
 
 
+async def _atualizar(db: AsyncSession, autor_id: int, campos: dict):
+    """UPDATE ... RETURNING em uma ida ao banco; None se o autor não existe"""
+    autor = await db.scalar(
+        update(Autor)
+        .where(Autor.id == autor_id)
+        .values(**campos)
+        .returning(Autor)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    if autor is not None:
+        indice_autores.adicionar(autor.id, autor.name)
+        cache.invalidar("authors", autor.id)
+    return autor
+
+
 @router.put(
     "/{autor_id}",
     responses={
@@ -127,30 +244,23 @@ def criar_autor(autor: AutorCreate, db: Session = Depends(get_db)):
         400: {"description": "Dados inválidos"},
     },
 )
-def atualizar_autor(
-    autor_id: int, autor_data: AutorUpdatePUT, db: Session = Depends(get_db)
+async def atualizar_autor(
+    autor_id: int, autor_data: AutorUpdatePUT, db: AsyncSession = Depends(get_db)
 ):
     """
     Atualiza **todos** os campos de um autor
     """
 
-    autor = db.query(Autor).filter(Autor.id == autor_id).first()
-    if not autor:
-        raise HTTPException(status_code=404, detail="Autor não encontrado")
-
     try:
-        autor.name = autor_data.name
-        autor.country = autor_data.country
-
-        db.commit()
-        db.refresh(autor)
-
-        return autor
-
+        autor = await _atualizar(db, autor_id, autor_data.model_dump())
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=400, detail=f"Erro na atualização: {str(e)}")
 
+    if autor is None:
+        raise HTTPException(status_code=404, detail="Autor não encontrado")
+    return autor
+
 
 @router.patch(
     "/{autor_id}",
@@ -160,18 +270,13 @@ def atualizar_autor(
         400: {"description": "Dados inválidos ou nenhum campo para atualizar"},
     },
 )
-def atualizar_autor(
-    autor_id: int, autor_data: AutorUpdatePATCH, db: Session = Depends(get_db)
+async def atualizar_autor(
+    autor_id: int, autor_data: AutorUpdatePATCH, db: AsyncSession = Depends(get_db)
 ):
     """
     Atualiza **apenas alguns campos** de um autor
     """
 
-    # Busca o autor
-    autor = db.query(Autor).filter(Autor.id == autor_id).first()
-    if not autor:
-        raise HTTPException(status_code=404, detail="Autor não encontrado")
-
     # Verifica se há campos para atualizar
     update_data = autor_data.dict(exclude_unset=True)
     if not update_data:
@@ -181,18 +286,15 @@ def atualizar_autor(
 
     try:
         # Atualiza apenas os campos enviados
-        for key, value in update_data.items():
-            setattr(autor, key, value)
-
-        db.commit()
-        db.refresh(autor)
-
-        return autor
-
+        autor = await _atualizar(db, autor_id, update_data)
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=400, detail=f"Erro na atualização: {str(e)}")
 
+    if autor is None:
+        raise HTTPException(status_code=404, detail="Autor não encontrado")
+    return autor
+
 
 @router.delete(
     "/{autor_id}",
@@ -218,32 +320,37 @@ def atualizar_autor(
         },
     },
 )
-def excluir_autor(autor_id: int, db: Session = Depends(get_db)):
+async def excluir_autor(autor_id: int, db: AsyncSession = Depends(get_db)):
     """
     Exclui um autor pelo ID.
     """
-    # Busca o autor no banco
-    autor = db.query(Autor).filter(Autor.id == autor_id).first()
+    try:
+        # Um único DELETE: nenhuma linha removida = autor inexistente
+        excluido = await db.scalar(
+            delete(Autor).where(Autor.id == autor_id).returning(Autor.id)
+        )
+        await db.commit()
+    except IntegrityError as e:
+        # books.author_id é ON DELETE RESTRICT
+        raise await traduzir_violacao(
+            db,
+            e,
+            restrito=HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Autor possui livros vinculados",
+            ),
+        )
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Erro ao excluir autor: {str(e)}",
+        )
 
-    if not autor:
+    if excluido is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Autor não encontrado"
         )
-
-    try:
-        db.delete(autor)
-        db.commit()
-        return {"message": "Autor excluído com sucesso"}
-
-    except Exception as e:
-        db.rollback()
-        if "locked" in str(e):
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="Autor possui livros vinculados",
-            )
-        else:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=f"Erro ao excluir autor: {str(e)}",
-            )
+    indice_autores.remover(autor_id)
+    cache.invalidar("authors", autor_id)
+    return {"message": "Autor excluído com sucesso"}
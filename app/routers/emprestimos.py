@@ -1,161 +1,364 @@
+from collections import Counter, defaultdict
+from typing import Optional
+
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import date
-from app.database import SessionLocal
-from app.models.models import Emprestimo, Livro, Usuario
+from app import idempotencia
+from app.auditoria import auditoria
+from app.database import get_db
+from app.erros import Referencia, traduzir_violacao
+from app.idempotencia import ChaveIdempotente, chave_idempotente
+from app.models.models import Emprestimo, Livro, Stock, Usuario
 from app.schemas.emprestimo_schema import (
+    BorrowalBatchCreate,
+    BorrowalBatchResponse,
     BorrowalCreate,
     BorrowalUpdatePUT,
     BorrowalUpdatePATCH,
     BorrowalResponse,
 )
+from app.schemas.pagina_schema import Pagina
+from app.paginacao import ParametrosPaginacao, paginar
 
 router = APIRouter()
 
 
-def get_session_local():
-    yield SessionLocal()
+# Log de devolução (mesma condição do trigger trg_borrowal_return)
+async def _registrar_devolucao(emprestimo, borrow_date_anterior, return_date_anterior):
+    if return_date_anterior is None and emprestimo.return_date is not None:
+        await auditoria.devolucao(
+            emprestimo.book_id,
+            emprestimo.borrower_id,
+            borrow_date_anterior,
+            emprestimo.return_date,
+        )
 
 
-# Helper para verificar existência de recursos
-def verificar_recurso(db: Session, model, resource_id: int, nome_recurso: str):
-    recurso = db.query(model).filter(model.id == resource_id).first()
-    if not recurso:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"{nome_recurso} com ID {resource_id} não encontrado",
+# Livro e usuário referenciados (o banco confere; estes nomeiam o 404)
+def _referencias(campos: dict):
+    return [
+        Referencia(modelo, campos[coluna], nome)
+        for modelo, coluna, nome in (
+            (Livro, "book_id", "Livro"),
+            (Usuario, "borrower_id", "Usuário"),
         )
-    return recurso
+        if coluna in campos
+    ]
 
 
 # CREATE
 @router.post("/", response_model=BorrowalResponse, status_code=status.HTTP_201_CREATED)
-def criar_emprestimo(
-    emprestimo: BorrowalCreate, db: Session = Depends(get_session_local)
+async def criar_emprestimo(
+    emprestimo: BorrowalCreate,
+    db: AsyncSession = Depends(get_db),
+    chave: Optional[ChaveIdempotente] = Depends(chave_idempotente),
 ):
-    # Verifica livro
-    verificar_recurso(db, Livro, emprestimo.book_id, "Livro")
-
-    # Verifica usuário
-    verificar_recurso(db, Usuario, emprestimo.borrower_id, "Usuário")
+    """
+    Com o header Idempotency-Key, repetir a requisição (ex.: após um timeout)
+    devolve o empréstimo criado na primeira vez, sem criar outro.
+    """
+    if chave is not None:
+        repetida = await idempotencia.resposta_registrada(chave)
+        if repetida is not None:
+            return repetida
 
+    # Livro e usuário inexistentes são recusados pelas chaves estrangeiras;
+    # estoque zerado, pelo trigger trg_check_stock_before_borrow (409)
+    campos = emprestimo.model_dump()
+    registrada = True
     try:
-        novo_emprestimo = Emprestimo(**emprestimo.model_dump())
+        novo_emprestimo = Emprestimo(**campos)
         db.add(novo_emprestimo)
-        db.commit()
-        db.refresh(novo_emprestimo)
-        return novo_emprestimo
+        await db.flush()
+        if chave is not None:
+            registrada = await idempotencia.registrar(
+                db,
+                chave,
+                status.HTTP_201_CREATED,
+                BorrowalResponse.model_validate(novo_emprestimo),
+            )
+        if registrada:
+            await db.commit()
+    except IntegrityError as e:
+        await db.rollback()
+        # A mesma chave pode ter levado o último exemplar um instante antes
+        repetida = chave and await idempotencia.resposta_registrada(chave, db)
+        if repetida:
+            return repetida
+        raise await traduzir_violacao(db, e, *_referencias(campos))
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Erro ao criar empréstimo: {str(e)}",
         )
 
+    if not registrada:
+        return await idempotencia.resposta_da_concorrente(db, chave)
+
+    await auditoria.emprestimo(
+        novo_emprestimo.book_id,
+        novo_emprestimo.borrower_id,
+        novo_emprestimo.return_date,
+    )
+    return novo_emprestimo
+
+
+# CREATE (vários livros para o mesmo usuário)
+@router.post(
+    "/batch",
+    response_model=BorrowalBatchResponse,
+    status_code=status.HTTP_201_CREATED,
+    responses={
+        status.HTTP_404_NOT_FOUND: {"description": "Usuário não encontrado"},
+        status.HTTP_409_CONFLICT: {
+            "description": "Livro inexistente ou sem estoque; nada foi emprestado",
+            "content": {
+                "application/json": {
+                    "example": {
+                        "detail": {
+                            "mensagem": "Nenhum empréstimo foi criado",
+                            "itens": [
+                                {"book_id": 1, "id": None, "erro": None},
+                                {
+                                    "book_id": 2,
+                                    "id": None,
+                                    "erro": "Estoque insuficiente para empréstimo",
+                                },
+                            ],
+                        }
+                    }
+                }
+            },
+        },
+    },
+)
+async def criar_emprestimos_em_lote(
+    lote: BorrowalBatchCreate, db: AsyncSession = Depends(get_db)
+):
+    """
+    Empresta vários livros a um usuário em uma única transação: ou todos os
+    empréstimos são criados, ou nenhum. O resultado traz um item por livro.
+    """
+    # Usuário, livros e estoque validados em uma única consulta
+    linhas = (
+        await db.execute(
+            select(Usuario.id, Livro.id, Stock.quantity)
+            .select_from(Usuario)
+            .outerjoin(Livro, Livro.id.in_(set(lote.book_ids)))
+            .outerjoin(Stock, Stock.book_id == Livro.id)
+            .where(Usuario.id == lote.borrower_id)
+        )
+    ).all()
+    if not linhas:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Usuário com ID {lote.borrower_id} não encontrado",
+        )
+
+    # Mesma regra do trigger trg_check_stock_before_borrow: livros sem linha
+    # em stock não são barrados
+    estoque = {livro_id: qtd for _, livro_id, qtd in linhas if livro_id is not None}
+    pedidos = Counter(lote.book_ids)
+    itens = []
+    for book_id in lote.book_ids:
+        erro = None
+        if book_id not in estoque:
+            erro = f"Livro com ID {book_id} não encontrado"
+        elif estoque[book_id] is not None and estoque[book_id] < pedidos[book_id]:
+            erro = "Estoque insuficiente para empréstimo"
+        itens.append({"book_id": book_id, "id": None, "erro": erro})
+
+    if any(item["erro"] for item in itens):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={"mensagem": "Nenhum empréstimo foi criado", "itens": itens},
+        )
+
+    try:
+        resultado = await db.execute(
+            insert(Emprestimo).returning(Emprestimo.id, Emprestimo.book_id),
+            [
+                {
+                    "book_id": book_id,
+                    "borrower_id": lote.borrower_id,
+                    "borrow_date": lote.borrow_date,
+                }
+                for book_id in lote.book_ids
+            ],
+        )
+        ids_por_livro = defaultdict(list)
+        for emprestimo_id, book_id in resultado:
+            ids_por_livro[book_id].append(emprestimo_id)
+        await db.commit()
+    except IntegrityError as e:
+        # Estoque consumido por outra requisição entre a validação e o INSERT
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={
+                "mensagem": f"Nenhum empréstimo foi criado: {e.orig}",
+                "itens": itens,
+            },
+        )
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Erro ao criar empréstimos: {str(e)}",
+        )
+
+    for item in itens:
+        item["id"] = ids_por_livro[item["book_id"]].pop(0)
+        await auditoria.emprestimo(item["book_id"], lote.borrower_id)
+    return {"borrower_id": lote.borrower_id, "itens": itens}
+
 
 # READ ALL
-@router.get("/", response_model=list[BorrowalResponse])
-def listar_emprestimos(db: Session = Depends(get_session_local)):
-    return db.query(Emprestimo).all()
+@router.get("/", response_model=Pagina[BorrowalResponse])
+async def listar_emprestimos(
+    paginacao: ParametrosPaginacao = Depends(),
+    db: AsyncSession = Depends(get_db),
+):
+    return await paginar(db, select(Emprestimo), [Emprestimo.id], paginacao)
 
 
 # READ BY ID
 @router.get("/{emprestimo_id}", response_model=BorrowalResponse)
-def obter_emprestimo(emprestimo_id: int, db: Session = Depends(get_session_local)):
-    emprestimo = db.query(Emprestimo).filter(Emprestimo.id == emprestimo_id).first()
+async def obter_emprestimo(emprestimo_id: int, db: AsyncSession = Depends(get_db)):
+    emprestimo = await db.get(Emprestimo, emprestimo_id)
     if not emprestimo:
         raise HTTPException(status_code=404, detail="Empréstimo não encontrado")
     return emprestimo
 
 
-# UPDATE (PUT)
-@router.put("/{emprestimo_id}", response_model=BorrowalResponse)
-def atualizar_emprestimo(
+async def _atualizar(
+    db: AsyncSession,
     emprestimo_id: int,
-    emprestimo_data: BorrowalUpdatePUT,
-    db: Session = Depends(get_session_local),
+    campos: dict,
+    chave: Optional[ChaveIdempotente] = None,
 ):
-    emprestimo = db.query(Emprestimo).filter(Emprestimo.id == emprestimo_id).first()
-    if not emprestimo:
-        raise HTTPException(status_code=404, detail="Empréstimo não encontrado")
+    """UPDATE ... RETURNING em uma ida ao banco; livro e usuário informados
+    são conferidos pelas chaves estrangeiras"""
+    if chave is not None:
+        repetida = await idempotencia.resposta_registrada(chave)
+        if repetida is not None:
+            return repetida
 
-    # Verificações
-    verificar_recurso(db, Livro, emprestimo_data.book_id, "Livro")
-    verificar_recurso(db, Usuario, emprestimo_data.borrower_id, "Usuário")
+    # O RETURNING só enxerga os valores novos. Quando a API grava os logs e o
+    # empréstimo pode estar sendo devolvido, as datas anteriores são lidas
+    # antes (no modo banco o trigger trg_borrowal_return cuida disso)
+    anterior = None
+    if auditoria.pela_aplicacao and campos.get("return_date") is not None:
+        anterior = (
+            await db.execute(
+                select(Emprestimo.borrow_date, Emprestimo.return_date).where(
+                    Emprestimo.id == emprestimo_id
+                )
+            )
+        ).first()
 
+    registrada = True
     try:
-        # Use uma abordagem alternativa com update()
-        db.query(Emprestimo).filter(Emprestimo.id == emprestimo_id).update(
-            {
-                Emprestimo.book_id: emprestimo_data.book_id,
-                Emprestimo.borrower_id: emprestimo_data.borrower_id,
-                Emprestimo.borrow_date: emprestimo_data.borrow_date,
-                Emprestimo.return_date: emprestimo_data.return_date,
-            }
+        emprestimo = await db.scalar(
+            update(Emprestimo)
+            .where(Emprestimo.id == emprestimo_id)
+            .values(**campos)
+            .returning(Emprestimo)
+            .execution_options(synchronize_session=False)
         )
-
-        db.commit()
-        db.refresh(emprestimo)
-        return emprestimo
+        if emprestimo is not None and chave is not None:
+            registrada = await idempotencia.registrar(
+                db,
+                chave,
+                status.HTTP_200_OK,
+                BorrowalResponse.model_validate(emprestimo),
+            )
+        if registrada:
+            await db.commit()
+    except IntegrityError as e:
+        raise await traduzir_violacao(db, e, *_referencias(campos))
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Erro ao atualizar: {str(e)}")
 
+    if not registrada:
+        return await idempotencia.resposta_da_concorrente(db, chave)
+    if emprestimo is None:
+        raise HTTPException(status_code=404, detail="Empréstimo não encontrado")
+
+    if anterior is not None:
+        await _registrar_devolucao(emprestimo, *anterior)
+    return emprestimo
+
+
+# UPDATE (PUT)
+@router.put("/{emprestimo_id}", response_model=BorrowalResponse)
+async def atualizar_emprestimo(
+    emprestimo_id: int,
+    emprestimo_data: BorrowalUpdatePUT,
+    db: AsyncSession = Depends(get_db),
+):
+    return await _atualizar(db, emprestimo_id, emprestimo_data.model_dump())
+
 
 # UPDATE (PATCH)
 @router.patch("/{emprestimo_id}", response_model=BorrowalResponse)
-def atualizar_emprestimo(
+async def atualizar_emprestimo(
     emprestimo_id: int,
     emprestimo_data: BorrowalUpdatePATCH,
-    db: Session = Depends(get_session_local),
+    db: AsyncSession = Depends(get_db),
+    chave: Optional[ChaveIdempotente] = Depends(chave_idempotente),
 ):
-    emprestimo = db.query(Emprestimo).filter(Emprestimo.id == emprestimo_id).first()
-    if not emprestimo:
-        raise HTTPException(status_code=404, detail="Empréstimo não encontrado")
-
+    """
+    Atualiza alguns campos; a devolução é `{"return_date": "AAAA-MM-DD"}`.
+    Aceita Idempotency-Key como a criação do empréstimo.
+    """
     update_data = emprestimo_data.model_dump(exclude_unset=True)
-
-    # Verifica chaves estrangeiras se fornecidas
-    if "book_id" in update_data:
-        verificar_recurso(db, Livro, update_data["book_id"], "Livro")
-    if "borrower_id" in update_data:
-        verificar_recurso(db, Usuario, update_data["borrower_id"], "Usuário")
-
-    try:
-        for key, value in update_data.items():
-            setattr(emprestimo, key, value)
-
-        db.commit()
-        db.refresh(emprestimo)
+    if not update_data:
+        emprestimo = await db.get(Emprestimo, emprestimo_id)
+        if not emprestimo:
+            raise HTTPException(status_code=404, detail="Empréstimo não encontrado")
         return emprestimo
-    except Exception as e:
-        db.rollback()
-        raise HTTPException(status_code=500, detail=f"Erro ao atualizar: {str(e)}")
+
+    return await _atualizar(db, emprestimo_id, update_data, chave)
 
 
 # DELETE
 @router.delete("/{emprestimo_id}", status_code=status.HTTP_200_OK)
-def excluir_emprestimo(emprestimo_id: int, db: Session = Depends(get_session_local)):
-    emprestimo = db.query(Emprestimo).filter(Emprestimo.id == emprestimo_id).first()
-    if not emprestimo:
-        raise HTTPException(status_code=404, detail="Empréstimo não encontrado")
-
+async def excluir_emprestimo(emprestimo_id: int, db: AsyncSession = Depends(get_db)):
     try:
-        db.delete(emprestimo)
-        db.commit()
-        return {"message": "Empréstimo excluído com sucesso"}
+        # Um único DELETE, que devolve a linha removida (nenhuma = 404)
+        excluido = (
+            await db.execute(
+                delete(Emprestimo)
+                .where(Emprestimo.id == emprestimo_id)
+                .returning(Emprestimo.return_date)
+            )
+        ).first()
+        await db.commit()
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Erro ao excluir: {str(e)}")
 
+    if excluido is None:
+        raise HTTPException(status_code=404, detail="Empréstimo não encontrado")
+    # Como o trigger trg_borrowal_delete: só empréstimos não devolvidos
+    if excluido.return_date is None:
+        await auditoria.exclusao(emprestimo_id)
+    return {"message": "Empréstimo excluído com sucesso"}
+
 
 @router.get("/por-usuario/{usuario_id}", response_model=list[BorrowalResponse])
-def listar_emprestimos_por_usuario(
-    usuario_id: int, db: Session = Depends(get_session_local)
+async def listar_emprestimos_por_usuario(
+    usuario_id: int, db: AsyncSession = Depends(get_db)
 ):
     emprestimos = (
-        db.query(Emprestimo).filter(Emprestimo.borrower_id == usuario_id).all()
-    )
+        await db.scalars(select(Emprestimo).where(Emprestimo.borrower_id == usuario_id))
+    ).all()
 
     if not emprestimos:
         raise HTTPException(
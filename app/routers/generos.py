@@ -1,94 +1,144 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from app.database import SessionLocal
+from sqlalchemy import delete, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.cache import cache
+from app.condicional import condicional
+from app.database import get_db
+from app.erros import traduzir_violacao
 from app.models.models import Genero, Livro
 from app.schemas.genero_schema import GenreCreate, GenreResponse
 
 router = APIRouter()
 
-
-# Dependency
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# Restrição UNIQUE -> mensagem do 400
+_UNICOS = {"genres.name": "Gênero já existe."}
 
 
 # Criar gênero
 @router.post("/", response_model=GenreResponse, status_code=status.HTTP_201_CREATED)
-def criar_genero(genero: GenreCreate, db: Session = Depends(get_db)):
-    genero_existente = db.query(Genero).filter(Genero.name == genero.name).first()
-    if genero_existente:
-        raise HTTPException(status_code=400, detail="Gênero já existe.")
-
+async def criar_genero(genero: GenreCreate, db: AsyncSession = Depends(get_db)):
+    # Nome repetido é recusado pelo UNIQUE de genres.name
     novo_genero = Genero(name=genero.name)
     db.add(novo_genero)
-    db.commit()
-    db.refresh(novo_genero)
+    try:
+        await db.commit()
+    except IntegrityError as e:
+        raise await traduzir_violacao(db, e, unicos=_UNICOS)
+    await db.refresh(novo_genero)
+    cache.invalidar("genres", novo_genero.id)
     return novo_genero
 
 
 # Listar todos os gêneros
-@router.get("/", response_model=list[GenreResponse])
-def listar_generos(db: Session = Depends(get_db)):
-    return db.query(Genero).all()
+@router.get(
+    "/", response_model=list[GenreResponse], dependencies=[condicional("genres")]
+)
+async def listar_generos(db: AsyncSession = Depends(get_db)):
+    async def carregar():
+        generos = (await db.scalars(select(Genero))).all()
+        return [GenreResponse.model_validate(genero) for genero in generos]
+
+    return await cache.obter(("generos",), carregar, [("genres", None)])
 
 
 # Obter gênero por ID
-@router.get("/{genre_id}", response_model=GenreResponse)
-def obter_genero(genero_id: int, db: Session = Depends(get_db)):
-    genero = db.query(Genero).filter(Genero.id == genero_id).first()
+@router.get(
+    "/{genero_id}",
+    response_model=GenreResponse,
+    dependencies=[condicional("genres")],
+)
+async def obter_genero(genero_id: int, db: AsyncSession = Depends(get_db)):
+    async def carregar():
+        genero = await db.get(Genero, genero_id)
+        return GenreResponse.model_validate(genero) if genero else None
+
+    genero = await cache.obter(("genero", genero_id), carregar, [("genres", genero_id)])
     if not genero:
         raise HTTPException(status_code=404, detail="Gênero não encontrado.")
     return genero
 
 
 # Atualizar gênero
-@router.put("/{genre_id}", response_model=GenreResponse)
-def atualizar_genero(
-    genero_id: int, genero: GenreCreate, db: Session = Depends(get_db)
+@router.put("/{genero_id}", response_model=GenreResponse)
+async def atualizar_genero(
+    genero_id: int, genero_data: GenreCreate, db: AsyncSession = Depends(get_db)
 ):
-    genero = db.query(Genero).filter(Genero.id == genero_id).first()
+    # Um único UPDATE ... RETURNING; o nome repetido é recusado pelo UNIQUE
+    try:
+        genero = await db.scalar(
+            update(Genero)
+            .where(Genero.id == genero_id)
+            .values(name=genero_data.name)
+            .returning(Genero)
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+    except IntegrityError as e:
+        raise await traduzir_violacao(db, e, unicos=_UNICOS)
     if not genero:
         raise HTTPException(status_code=404, detail="Gênero não encontrado.")
 
-    genero.name = genero.name
-    db.commit()
-    db.refresh(genero)
+    cache.invalidar("genres", genero_id)
     return genero
 
 
 # Deletar gênero
-@router.delete("/{genre_id}", status_code=status.HTTP_200_OK)
-def deletar_genero(genero_id: int, db: Session = Depends(get_db)):
-    genero = db.query(Genero).filter(Genero.id == genero_id).first()
-    if not genero:
+@router.delete("/{genero_id}", status_code=status.HTTP_200_OK)
+async def deletar_genero(genero_id: int, db: AsyncSession = Depends(get_db)):
+    try:
+        excluido = await db.scalar(
+            delete(Genero).where(Genero.id == genero_id).returning(Genero.id)
+        )
+        await db.commit()
+    except IntegrityError as e:
+        # books.genre_id é ON DELETE RESTRICT
+        raise await traduzir_violacao(
+            db,
+            e,
+            restrito=HTTPException(
+                status_code=409, detail="Gênero possui livros vinculados."
+            ),
+        )
+    if excluido is None:
         raise HTTPException(status_code=404, detail="Gênero não encontrado.")
 
-    db.delete(genero)
-    db.commit()
+    cache.invalidar("genres", genero_id)
     return {"message": f"Gênero {genero_id} excluído com sucesso."}
 
 
 # Listar livros por gênero
-@router.get("/{genre_id}/livros", response_model=list[dict])
-def listar_livros_por_genero(genero_id: int, db: Session = Depends(get_db)):
-    genero = db.query(Genero).filter(Genero.id == genero_id).first()
-    if not genero:
+@router.get(
+    "/{genero_id}/livros",
+    response_model=list[dict],
+    dependencies=[condicional("genres", "books")],
+)
+async def listar_livros_por_genero(genero_id: int, db: AsyncSession = Depends(get_db)):
+    async def carregar():
+        genero = await db.get(Genero, genero_id)
+        if not genero:
+            return None
+
+        livros = (
+            await db.scalars(select(Livro).where(Livro.genre_id == genero_id))
+        ).all()
+        return [
+            {
+                "id": livro.id,
+                "titulo": livro.title,
+                "ano": livro.publication_year,
+                "autor_id": livro.author_id,
+                "imagem": livro.image,
+                "genero": genero.name,
+            }
+            for livro in livros
+        ]
+
+    livros = await cache.obter(
+        ("genero", genero_id, "livros"),
+        carregar,
+        [("genres", genero_id), ("books", None)],
+    )
+    if livros is None:
         raise HTTPException(status_code=404, detail="Gênero não encontrado.")
-
-    livros = db.query(Livro).filter(Livro.genre_id == genero_id).all()
-
-    return [
-        {
-            "id": livro.id,
-            "titulo": livro.title,
-            "ano": livro.publication_year,
-            "autor_id": livro.author_id,
-            "imagem": livro.image,
-            "genero": genero.name,
-        }
-        for livro in livros
-    ]
+    return livros
@@ -1,63 +1,95 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
-from typing import List, Literal
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime
+from typing import List, Literal, Optional
+from app.exportacao import FormatoExportacao, em_utc, exportar
 from app.models.models import Historico_de_emprestimos
 from app.schemas.historico_de_emprestimos_schema import BorrowalHistoryResponse
-from app.database import SessionLocal
+from app.schemas.pagina_schema import Pagina
+from app.paginacao import ParametrosPaginacao, paginar
+from app.database import get_db
 
 router = APIRouter()
 
 
-def get_session_local():
-    yield SessionLocal()
+@router.get("/", response_model=Pagina[BorrowalHistoryResponse])
+async def listar_historico(
+    action: Literal["all", "borrowed", "returned"] = Query("all"),
+    paginacao: ParametrosPaginacao = Depends(),
+    db: AsyncSession = Depends(get_db),
+):
+    query = select(Historico_de_emprestimos)
+    if action != "all":
+        query = query.where(Historico_de_emprestimos.action == action)
+    return await paginar(db, query, [Historico_de_emprestimos.id], paginacao)
 
 
-@router.get("/", response_model=List[BorrowalHistoryResponse])
-def listar_historico(
+@router.get("/export")
+async def exportar_historico(
+    formato: FormatoExportacao = Query("ndjson"),
     action: Literal["all", "borrowed", "returned"] = Query("all"),
-    db: Session = Depends(get_session_local),
+    de: Optional[datetime] = Query(
+        None, alias="from", description="Data inicial (inclusiva)"
+    ),
+    ate: Optional[datetime] = Query(
+        None, alias="to", description="Data final (inclusiva)"
+    ),
 ):
-    query = db.query(Historico_de_emprestimos)
+    """
+    Exporta o histórico completo (ou filtrado) em NDJSON ou CSV, transmitido
+    em blocos sem carregar a tabela em memória. `from` e `to` aceitam os
+    mesmos valores da exportação dos logs; o histórico guarda só o dia
+    (UTC), então um horário com fuso vale pelo dia em UTC
+    """
+    historico = Historico_de_emprestimos
+    query = select(
+        historico.id,
+        historico.book_id,
+        historico.borrower_id,
+        historico.action,
+        historico.date,
+    ).order_by(historico.id)
     if action != "all":
-        query = query.filter(Historico_de_emprestimos.action == action)
-    return query.all()
+        query = query.where(historico.action == action)
+    if de is not None:
+        query = query.where(historico.date >= em_utc(de).date())
+    if ate is not None:
+        query = query.where(historico.date <= em_utc(ate).date())
+    return exportar(query, formato, "historico_de_emprestimos")
 
 
 @router.get("/{history_id}", response_model=BorrowalHistoryResponse)
-def obter_registro_por_id(history_id: int, db: Session = Depends(get_session_local)):
-    registro = (
-        db.query(Historico_de_emprestimos)
-        .filter(Historico_de_emprestimos.id == history_id)
-        .first()
-    )
+async def obter_registro_por_id(history_id: int, db: AsyncSession = Depends(get_db)):
+    registro = await db.get(Historico_de_emprestimos, history_id)
     if not registro:
         raise HTTPException(status_code=404, detail="Registro não encontrado")
     return registro
 
 
 @router.get("/book/{book_id}", response_model=List[BorrowalHistoryResponse])
-def historico_por_livro(
+async def historico_por_livro(
     book_id: int,
     action: Literal["all", "borrowed", "returned"] = Query("all"),
-    db: Session = Depends(get_session_local),
+    db: AsyncSession = Depends(get_db),
 ):
-    query = db.query(Historico_de_emprestimos).filter(
+    query = select(Historico_de_emprestimos).where(
         Historico_de_emprestimos.book_id == book_id
     )
     if action != "all":
-        query = query.filter(Historico_de_emprestimos.action == action)
-    return query.all()
+        query = query.where(Historico_de_emprestimos.action == action)
+    return (await db.scalars(query)).all()
 
 
 @router.get("/user/{user_id}", response_model=List[BorrowalHistoryResponse])
-def historico_por_usuario(
+async def historico_por_usuario(
     user_id: int,
     action: Literal["all", "borrowed", "returned"] = Query("all"),
-    db: Session = Depends(get_session_local),
+    db: AsyncSession = Depends(get_db),
 ):
-    query = db.query(Historico_de_emprestimos).filter(
+    query = select(Historico_de_emprestimos).where(
         Historico_de_emprestimos.borrower_id == user_id
     )
     if action != "all":
-        query = query.filter(Historico_de_emprestimos.action == action)
-    return query.all()
+        query = query.where(Historico_de_emprestimos.action == action)
+    return (await db.scalars(query)).all()
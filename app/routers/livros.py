@@ -1,39 +1,125 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy import func
-from sqlalchemy.orm import Session
-from app.database import SessionLocal
-from app.models.models import Livro, Autor  ##Um livro deve pertencer a um autor
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.cache import cache
+from app.condicional import condicional
+from app.database import get_db
+from app.erros import Referencia, traduzir_violacao
+from app.importacao import (
+    CORPO_IMPORTACAO,
+    TAMANHO_LOTE,
+    formato_da_requisicao,
+    importar,
+)
+from app.models.models import Livro, Autor, Genero  ##Um livro deve pertencer a um autor
 from app.schemas.livro_schema import (
     LivroCreate,
     LivroUpdatePUT,
     LivroResponse,
     LivroUpdatePATCH,
 )
+from app.schemas.pagina_schema import Pagina
+from app.paginacao import (
+    ParametrosPaginacao,
+    codificar_cursor,
+    decodificar_cursor,
+    paginar,
+)
+from app.busca import books_fts, filtro_fts, montar_consulta_fts, relevancia
+from app.busca_aproximada import indice_autores, indice_livros
 
 router = APIRouter()
 
 
-# Dependency
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+@router.get(
+    "/",
+    response_model=Pagina[LivroResponse],
+    dependencies=[condicional("books")],
+)
+async def listar_livros(
+    paginacao: ParametrosPaginacao = Depends(), db: AsyncSession = Depends(get_db)
+):
+    return await paginar(db, select(Livro), [Livro.id], paginacao)
 
 
 @router.get(
-    "/",
-    response_model=list[LivroResponse],
+    "/search",
+    response_model=Pagina[LivroResponse],
+    dependencies=[condicional("books", "authors", "genres")],
 )
-def listar_livros(db: Session = Depends(get_db)):
-    livros = db.query(Livro).all()
-    return livros
+async def buscar_livros(
+    q: str = Query(..., min_length=1, description="Título, autor ou gênero"),
+    paginacao: ParametrosPaginacao = Depends(),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Busca textual no catálogo (título, autor e gênero), ordenada por relevância
+    """
+    consulta = montar_consulta_fts(q)
+    if consulta is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Informe ao menos uma palavra para a busca",
+        )
+
+    # Resultados ordenados por relevância não têm chave estável para keyset;
+    # o cursor guarda a posição (buscas raramente passam das primeiras páginas)
+    deslocamento = 0
+    if paginacao.after is not None:
+        deslocamento = decodificar_cursor(paginacao.after, 1)[0]
+        if not isinstance(deslocamento, int) or deslocamento < 0:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail="Cursor inválido"
+            )
+
+    livros = (
+        await db.scalars(
+            select(Livro)
+            .join(books_fts, books_fts.c.rowid == Livro.id)
+            .where(filtro_fts(consulta))
+            .order_by(relevancia(), Livro.id)
+            .limit(paginacao.limit + 1)
+            .offset(deslocamento)
+        )
+    ).all()
+
+    proximo = None
+    if len(livros) > paginacao.limit:
+        livros = livros[: paginacao.limit]
+        proximo = codificar_cursor(deslocamento + paginacao.limit)
+
+    return {"items": livros, "next_cursor": proximo}
+
+
+@router.get("/busca-aproximada")
+async def buscar_livros_aproximado(
+    q: str = Query(..., min_length=1, description="Título ou nome do autor"),
+    limiar: float = Query(0.4, gt=0, le=1, description="Similaridade mínima"),
+    limite: int = Query(10, ge=1, le=100),
+):
+    """
+    Busca tolerante a erros de digitação em títulos e nomes de autores,
+    respondida pelo índice de trigramas em memória
+    """
+    return {
+        "livros": [
+            {"id": chave, "title": texto, "similaridade": pontuacao}
+            for chave, texto, pontuacao in indice_livros.buscar(q, limiar, limite)
+        ],
+        "autores": [
+            {"id": chave, "name": texto, "similaridade": pontuacao}
+            for chave, texto, pontuacao in indice_autores.buscar(q, limiar, limite)
+        ],
+    }
 
 
 @router.get(
     "/{livro_id}",
     response_model=LivroResponse,
+    dependencies=[condicional("books")],
     responses={
         status.HTTP_200_OK: {
             "description": "Livro encontrado com sucesso",
@@ -57,13 +143,32 @@ def listar_livros(db: Session = Depends(get_db)):
         },
     },
 )
-def obter_livro(livro_id: int, db: Session = Depends(get_db)):
-    livro = db.query(Livro).filter(Livro.id == livro_id).first()
+async def obter_livro(livro_id: int, db: AsyncSession = Depends(get_db)):
+    async def carregar():
+        livro = await db.get(Livro, livro_id)
+        return LivroResponse.model_validate(livro) if livro else None
+
+    livro = await cache.obter(("livro", livro_id), carregar, [("books", livro_id)])
     if not livro:
         raise HTTPException(status_code=404, detail="Livro não encontrado")
     return livro
 
 
+@router.post("/importar", openapi_extra=CORPO_IMPORTACAO)
+async def importar_livros(
+    request: Request,
+    formato: Optional[str] = Query(None, description="csv ou ndjson"),
+    lote: int = Query(TAMANHO_LOTE, ge=1, le=10_000),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Importa livros em massa de um CSV ou NDJSON enviado no corpo. Autor e
+    gênero podem vir por id (author_id, genre_id) ou por nome (author, genre)
+    """
+    formato = formato_da_requisicao(request, formato)
+    return await importar(db, "livros", request.stream(), formato, lote)
+
+
 @router.post(
     "/",
     status_code=status.HTTP_201_CREATED,
@@ -95,16 +200,8 @@ def obter_livro(livro_id: int, db: Session = Depends(get_db)):
         },
     },
 )
-def criar_livro(livro: LivroCreate, db: Session = Depends(get_db)):
-    # Primeiro verifica se o autor existe
-    autor = db.query(Autor).filter(Autor.id == livro.author_id).first()
-
-    if not autor:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Autor com ID {livro.author_id} não encontrado",
-        )
-
+async def criar_livro(livro: LivroCreate, db: AsyncSession = Depends(get_db)):
+    # Autor e gênero inexistentes são recusados pelas chaves estrangeiras
     try:
         novo_livro = Livro(
             title=livro.title,
@@ -115,19 +212,52 @@ def criar_livro(livro: LivroCreate, db: Session = Depends(get_db)):
         )
 
         db.add(novo_livro)
-        db.commit()
-        db.refresh(novo_livro)
+        await db.commit()
+        await db.refresh(novo_livro)
+        indice_livros.adicionar(novo_livro.id, novo_livro.title)
+        cache.invalidar("books", novo_livro.id)
 
         return novo_livro
 
+    except IntegrityError as e:
+        raise await traduzir_violacao(db, e, *_referencias(livro.model_dump()))
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Erro ao criar livro: {str(e)}",
         )
 
 
+# Autor e gênero referenciados (o banco confere; estes nomeiam o 404)
+def _referencias(campos: dict):
+    return [
+        Referencia(modelo, campos[coluna], nome)
+        for modelo, coluna, nome in (
+            (Autor, "author_id", "Autor"),
+            (Genero, "genre_id", "Gênero"),
+        )
+        if coluna in campos
+    ]
+
+
+async def _atualizar(db: AsyncSession, livro_id: int, campos: dict):
+    """UPDATE ... RETURNING em uma ida ao banco; None se o livro não existe.
+    Autor e gênero informados são conferidos pelas chaves estrangeiras"""
+    livro = await db.scalar(
+        update(Livro)
+        .where(Livro.id == livro_id)
+        .values(**campos)
+        .returning(Livro)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    if livro is not None:
+        indice_livros.adicionar(livro.id, livro.title)
+        cache.invalidar("books", livro.id)
+    return livro
+
+
 # app/routers/livros.py
 @router.put(
     "/{livro_id}",
@@ -150,44 +280,29 @@ def criar_livro(livro: LivroCreate, db: Session = Depends(get_db)):
         },
     },
 )
-def atualizar_livro_completo(
-    livro_id: int, livro_data: LivroUpdatePUT, db: Session = Depends(get_db)
+async def atualizar_livro_completo(
+    livro_id: int, livro_data: LivroUpdatePUT, db: AsyncSession = Depends(get_db)
 ):
-    # Verifica se o livro existe
-    livro = db.query(Livro).filter(Livro.id == livro_id).first()
-    if not livro:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Livro com ID {livro_id} não encontrado",
-        )
-
-    # Verifica se o novo autor existe
-    autor = db.query(Autor).filter(Autor.id == livro_data.author_id).first()
-    if not autor:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Autor com ID {livro_data.author_id} não encontrado",
-        )
+    campos = livro_data.model_dump()
     try:
         # Atualiza todos os campos
-        livro.title = livro_data.title
-        livro.author_id = livro_data.author_id
-        livro.publication_year = livro_data.publication_year
-        livro.genre_id = livro_data.genre_id
-        livro.image = livro_data.image
-
-        db.commit()
-        db.refresh(livro)
-
-        return livro
-
+        livro = await _atualizar(db, livro_id, campos)
+    except IntegrityError as e:
+        raise await traduzir_violacao(db, e, *_referencias(campos))
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Erro ao atualizar livro: {str(e)}",
         )
 
+    if livro is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Livro com ID {livro_id} não encontrado",
+        )
+    return livro
+
 
 @router.patch(
     "/{livro_id}",
@@ -203,43 +318,38 @@ def atualizar_livro_completo(
         },
     },
 )
-def atualizar_livro_parcial(
-    livro_id: int, livro_data: LivroUpdatePATCH, db: Session = Depends(get_db)
+async def atualizar_livro_parcial(
+    livro_id: int, livro_data: LivroUpdatePATCH, db: AsyncSession = Depends(get_db)
 ):
-    livro = db.query(Livro).filter(Livro.id == livro_id).first()
-    if not livro:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Livro com ID {livro_id} não encontrado",
-        )
-
-    # Verifica se o novo autor (se fornecido) existe
-    if livro_data.author_id is not None:
-        autor = db.query(Autor).filter(Autor.id == livro_data.author_id).first()
-        if not autor:
+    update_data = livro_data.dict(exclude_unset=True)
+    if not update_data:
+        livro = await db.get(Livro, livro_id)
+        if not livro:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
-                detail=f"Autor com ID {livro_data.author_id} não encontrado",
+                detail=f"Livro com ID {livro_id} não encontrado",
             )
+        return livro
 
     try:
         # Atualiza apenas os campos fornecidos
-        update_data = livro_data.dict(exclude_unset=True)
-        for key, value in update_data.items():
-            setattr(livro, key, value)
-
-        db.commit()
-        db.refresh(livro)
-
-        return livro
-
+        livro = await _atualizar(db, livro_id, update_data)
+    except IntegrityError as e:
+        raise await traduzir_violacao(db, e, *_referencias(update_data))
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Erro ao atualizar livro: {str(e)}",
         )
 
+    if livro is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Livro com ID {livro_id} não encontrado",
+        )
+    return livro
+
 
 @router.delete(
     "/{livro_id}",
@@ -247,58 +357,84 @@ def atualizar_livro_parcial(
     responses={
         200: {"description": "Livro excluído com sucesso"},
         404: {"description": "Livro não encontrado"},
+        409: {"description": "Livro possui empréstimos registrados"},
     },
 )
-def excluir_livro(livro_id: int, db: Session = Depends(get_db)):
-    livro = db.query(Livro).filter(Livro.id == livro_id).first()
-    if not livro:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Livro com ID {livro_id} não encontrado",
-        )
-
+async def excluir_livro(livro_id: int, db: AsyncSession = Depends(get_db)):
     try:
-        db.delete(livro)
-        db.commit()
-        return {"message": f"Livro {livro_id} excluído com sucesso"}
-
+        # Um único DELETE: nenhuma linha removida = livro inexistente
+        excluido = await db.scalar(
+            delete(Livro).where(Livro.id == livro_id).returning(Livro.id)
+        )
+        await db.commit()
+    except IntegrityError as e:
+        # Empréstimos e histórico referenciam o livro (o estoque é excluído junto)
+        raise await traduzir_violacao(
+            db,
+            e,
+            restrito=HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Livro possui empréstimos registrados",
+            ),
+        )
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Erro ao excluir livro: {str(e)}",
         )
 
+    if excluido is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Livro com ID {livro_id} não encontrado",
+        )
+    indice_livros.remover(livro_id)
+    cache.invalidar("books", livro_id)
+    return {"message": f"Livro {livro_id} excluído com sucesso"}
+
 
 ##-----------------------------------------------------------------
 ##ENDPOINTS ESPECIFICOS
 
 
 # Endpoint: Buscar livros por ID do autor
-@router.get("/autor/id/{autor_id}", response_model=list[dict])
-def listar_livros_por_autor_id(autor_id: int, db: Session = Depends(get_db)):
-    livros = buscar_livros_por_autor_id(db, autor_id)
+@router.get(
+    "/autor/id/{autor_id}",
+    response_model=list[dict],
+    dependencies=[condicional("books", "genres")],
+)
+async def listar_livros_por_autor_id(autor_id: int, db: AsyncSession = Depends(get_db)):
+    async def carregar():
+        return [
+            {
+                "id": livro.id,
+                "titulo": livro.title,
+                "ano": livro.publication_year,
+                "genero": genero,
+                "imagem": livro.image,
+            }
+            for livro, genero in await buscar_livros_por_autor_id(db, autor_id)
+        ]
+
+    livros = await cache.obter(
+        ("autor", autor_id, "livros"), carregar, [("books", None), ("genres", None)]
+    )
     if not livros:
         raise HTTPException(
             status_code=404, detail="Nenhum livro encontrado para este autor."
         )
-
-    return [
-        {
-            "id": livro.id,
-            "titulo": livro.title,
-            "ano": livro.publication_year,
-            "genero": livro.genre,
-            "imagem": livro.image,
-        }
-        for livro in livros
-    ]
+    return livros
 
 
 # Endpoint: Buscar livros por nome do autor
-@router.get("/autor/nome/{nome}", response_model=list[dict])
-def listar_livros_por_autor_nome(nome: str, db: Session = Depends(get_db)):
-    livros = buscar_livros_por_autor_nome(db, nome)
+@router.get(
+    "/autor/nome/{nome}",
+    response_model=list[dict],
+    dependencies=[condicional("books", "authors", "genres")],
+)
+async def listar_livros_por_autor_nome(nome: str, db: AsyncSession = Depends(get_db)):
+    livros = await buscar_livros_por_autor_nome(db, nome)
     if not livros:
         raise HTTPException(
             status_code=404, detail="Nenhum livro encontrado para este autor."
@@ -309,27 +445,40 @@ def listar_livros_por_autor_nome(nome: str, db: Session = Depends(get_db)):
             "id": livro.id,
             "titulo": livro.title,
             "ano": livro.publication_year,
-            "genero": livro.genre,
+            "genero": genero,
             "imagem": livro.image,
         }
-        for livro in livros
+        for livro, genero in livros
     ]
 
 
 ##----------------------------------------------------------
 ##FUNÇÕES DOS ENDPOINTS ESPECIFICOS
 # Função utilitária: buscar livros por autor_id
-def buscar_livros_por_autor_id(db: Session, autor_id: int):
-    return db.query(Livro).filter(Livro.author_id == autor_id).all()
+# (retorna pares livro/nome do gênero)
+async def buscar_livros_por_autor_id(db: AsyncSession, autor_id: int):
+    return (
+        await db.execute(
+            select(Livro, Genero.name)
+            .outerjoin(Genero, Genero.id == Livro.genre_id)
+            .where(Livro.author_id == autor_id)
+        )
+    ).all()
 
 
 # Função utilitária: buscar livros por nome do autor (parcial ou completo)
-def buscar_livros_por_autor_nome(db: Session, nome: str):
+# usando a coluna "author" do índice de busca textual
+async def buscar_livros_por_autor_nome(db: AsyncSession, nome: str):
+    consulta = montar_consulta_fts(nome, coluna="author")
+    if consulta is None:
+        return []
+
     return (
-        db.query(Livro)
-        .join(Autor)
-        .filter(
-            Autor.name.ilike(f"%{nome}%")
-        )  # busca insensível a maiúsculas/minúsculas
-        .all()
-    )
+        await db.execute(
+            select(Livro, Genero.name)
+            .join(books_fts, books_fts.c.rowid == Livro.id)
+            .outerjoin(Genero, Genero.id == Livro.genre_id)
+            .where(filtro_fts(consulta))  # prefixos, sem acentos/maiúsculas
+            .order_by(Livro.id)
+        )
+    ).all()
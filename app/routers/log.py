@@ -1,17 +1,120 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from app.database import SessionLocal
-from app.models.models import Log
-from app.schemas.log_schema import LogResponse
-from typing import List
+from datetime import date, datetime
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy import String, func, select, type_coerce, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_db
+from app.exportacao import FormatoExportacao, em_utc, exportar
+from app.models.models import Log, ResumoDiarioLog
+from app.schemas.log_schema import LogDailySummaryResponse, LogResponse
+from app.schemas.pagina_schema import Pagina
+from app.paginacao import ParametrosPaginacao, paginar
 
 router = APIRouter()
 
+# O timestamp é comparado como texto cru do SQLite ("AAAA-MM-DD HH:MM:SS"):
+# assim o cursor bate exatamente com o valor gravado pelos triggers e os
+# filtros aproveitam idx_logs_timestamp_id / idx_logs_action_timestamp_id
+timestamp = type_coerce(Log.timestamp, String)
+
+
+def _texto_utc(momento: datetime) -> str:
+    """Formata como os triggers gravam; com fuso, converte antes para UTC"""
+    return em_utc(momento).strftime("%Y-%m-%d %H:%M:%S")
+
+
+class FiltrosLog:
+    """Dependency com os filtros `action`, `from` e `to` dos logs"""
+
+    def __init__(
+        self,
+        action: Optional[str] = Query(None, description="Ex.: BORROW, RETURN, DELETE"),
+        de: Optional[datetime] = Query(
+            None, alias="from", description="Início (inclusivo)"
+        ),
+        ate: Optional[datetime] = Query(
+            None, alias="to", description="Fim (inclusivo)"
+        ),
+    ):
+        self.action = action
+        self.de = de
+        self.ate = ate
+
+    def aplicar(self, query):
+        if self.action is not None:
+            query = query.where(Log.action == self.action)
+        if self.de is not None:
+            query = query.where(timestamp >= _texto_utc(self.de))
+        if self.ate is not None:
+            query = query.where(timestamp <= _texto_utc(self.ate))
+        return query
+
+
+@router.get("/", response_model=Pagina[LogResponse])
+async def listar_logs(
+    filtros: FiltrosLog = Depends(),
+    paginacao: ParametrosPaginacao = Depends(),
+    db: AsyncSession = Depends(get_db),
+):
+    """Logs do mais recente para o mais antigo"""
+    return await paginar(
+        db,
+        filtros.aplicar(select(Log)),
+        [timestamp, Log.id],
+        paginacao,
+        descendente=True,
+    )
+
+
+@router.get("/export")
+async def exportar_logs(
+    formato: FormatoExportacao = Query("ndjson"),
+    filtros: FiltrosLog = Depends(),
+):
+    """
+    Exporta os logs em ordem cronológica, em NDJSON ou CSV, transmitidos em
+    blocos sem carregar a tabela em memória
+    """
+    query = select(Log.id, Log.action, Log.description, timestamp.label("timestamp"))
+    return exportar(filtros.aplicar(query).order_by(timestamp, Log.id), formato, "logs")
+
 
-def get_session_local():
-    yield SessionLocal()
+@router.get("/resumo", response_model=List[LogDailySummaryResponse])
+async def resumir_logs(
+    action: Optional[str] = Query(None, description="Ex.: BORROW, RETURN, DELETE"),
+    de: Optional[date] = Query(
+        None, alias="from", description="Dia inicial (inclusivo)"
+    ),
+    ate: Optional[date] = Query(None, alias="to", description="Dia final (inclusivo)"),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Total de logs por dia (UTC) e ação, somando os dias já compactados pela
+    retenção (log_daily_summary) e os logs ainda guardados
+    """
+    resumo = select(ResumoDiarioLog.day, ResumoDiarioLog.action, ResumoDiarioLog.total)
+    dia = func.date(timestamp)
+    recentes = select(
+        dia.label("day"), Log.action, func.count().label("total")
+    ).group_by(dia, Log.action)
 
+    if action is not None:
+        resumo = resumo.where(ResumoDiarioLog.action == action)
+        recentes = recentes.where(Log.action == action)
+    if de is not None:
+        resumo = resumo.where(ResumoDiarioLog.day >= de.isoformat())
+        recentes = recentes.where(timestamp >= de.isoformat())
+    if ate is not None:
+        resumo = resumo.where(ResumoDiarioLog.day <= ate.isoformat())
+        # Menor que o dia seguinte: inclui o dia inteiro e usa o índice
+        recentes = recentes.where(timestamp < func.date(ate.isoformat(), "+1 day"))
 
-@router.get("/", response_model=List[LogResponse])
-def listar_logs(db: Session = Depends(get_session_local)):
-    return db.query(Log).order_by(Log.timestamp.desc()).all()
+    # Um dia compactado só em parte aparece nas duas fontes: os totais somam
+    partes = union_all(resumo, recentes).subquery()
+    query = (
+        select(partes.c.day, partes.c.action, func.sum(partes.c.total).label("total"))
+        .group_by(partes.c.day, partes.c.action)
+        .order_by(partes.c.day, partes.c.action)
+    )
+    return (await db.execute(query)).mappings().all()
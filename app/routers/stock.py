@@ -1,36 +1,115 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from app.database import SessionLocal
+import json
+from collections import Counter
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from sqlalchemy import exists, literal, select, text, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.condicional import condicional
+from app.database import get_db
 from app.models.models import Stock, Livro
-from app.schemas.stock_schema import StockResponse, StockCreate, StockUpdate
+from app.schemas.stock_schema import (
+    StockResponse,
+    StockCreate,
+    StockDelta,
+    StockDeltaLote,
+    StockUpdate,
+)
+from app.schemas.pagina_schema import Pagina
+from app.paginacao import LIMITE_MAXIMO, ParametrosPaginacao, paginar
 
 router = APIRouter()
 
+# As escritas de estoque são um único comando condicional com RETURNING:
+# não há leitura antes da gravação para outra requisição invalidar. Cada
+# gravação incrementa `version` (ver migração 8)
+_COLUNAS = (Stock.book_id, Stock.quantity, Stock.version)
+
+
+async def _estoque_atual(db: AsyncSession, book_id: int):
+    """Estoque gravado; usado só para explicar uma escrita recusada"""
+    return (await db.execute(select(*_COLUNAS).where(Stock.book_id == book_id))).first()
+
+
+# Ajustes do PATCH em lote, passados como um único parâmetro JSON
+# ([[book_id, delta], ...]) em vez de dois parâmetros por livro. A subconsulta
+# fica no FROM, e não em um WITH, porque o sqlite3 só abre a transação
+# implícita para comandos que começam com INSERT/UPDATE/DELETE: começando
+# com WITH, o UPDATE seria gravado mesmo com o rollback
+_AJUSTAR_EM_LOTE = text("""
+    UPDATE stock
+    SET quantity = quantity + ajustes.delta, version = version + 1
+    FROM (
+        SELECT json_extract(value, '$[0]') AS book_id,
+               json_extract(value, '$[1]') AS delta
+        FROM json_each(:ajustes)
+    ) AS ajustes
+    WHERE stock.book_id = ajustes.book_id AND stock.quantity + ajustes.delta >= 0
+    RETURNING book_id, quantity, version
+    """)
 
-# Dependency
-def get_db():
-    db = SessionLocal()
+
+def _ids_da_consulta(book_ids: List[str]) -> list[int]:
+    """`book_ids=1,2,3` ou `book_ids=1&book_ids=2`, sem repetições"""
     try:
-        yield db
-    finally:
-        db.close()
+        ids = {int(id) for valor in book_ids for id in valor.split(",") if id.strip()}
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="book_ids deve conter apenas números inteiros",
+        )
+    if len(ids) > LIMITE_MAXIMO:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Informe no máximo {LIMITE_MAXIMO} livros",
+        )
+    return sorted(ids)
 
 
-@router.get("/", response_model=list[StockResponse])
-def listar_estoque(db: Session = Depends(get_db)):
-    return db.query(Stock).all()
+@router.get(
+    "/", response_model=Pagina[StockResponse], dependencies=[condicional("stock")]
+)
+async def listar_estoque(
+    book_ids: Optional[List[str]] = Query(
+        None,
+        description="Livros consultados de uma vez (ex.: 1,2,3); os que não "
+        "têm estoque ficam de fora da resposta",
+    ),
+    paginacao: ParametrosPaginacao = Depends(),
+    db: AsyncSession = Depends(get_db),
+):
+    if book_ids is None:
+        return await paginar(db, select(Stock), [Stock.book_id], paginacao)
 
+    # Disponibilidade de vários livros (ex.: uma página do catálogo) em uma
+    # única consulta IN, sem paginação
+    ids = _ids_da_consulta(book_ids)
+    linhas = (
+        await db.execute(
+            select(*_COLUNAS).where(Stock.book_id.in_(ids)).order_by(Stock.book_id)
+        )
+    ).all()
+    return {"items": linhas, "next_cursor": None}
 
-@router.get("/livro/{book_id}", response_model=StockResponse)
-def obter_estoque_por_livro(book_id: int, db: Session = Depends(get_db)):
-    # Verifica se o livro existe
-    livro = db.query(Livro).filter(Livro.id == book_id).first()
-    if not livro:
-        raise HTTPException(status_code=404, detail="Livro não encontrado.")
 
-    # Busca o estoque relacionado ao livro
-    estoque = db.query(Stock).filter(Stock.book_id == book_id).first()
-    if not estoque:
+@router.get(
+    "/livro/{book_id}",
+    response_model=StockResponse,
+    dependencies=[condicional("books", "stock")],
+)
+async def obter_estoque_por_livro(book_id: int, db: AsyncSession = Depends(get_db)):
+    # Livro e estoque na mesma consulta: o livro existe se a linha vier
+    estoque = (
+        await db.execute(
+            select(Livro.id, *_COLUNAS)
+            .outerjoin(Stock, Stock.book_id == Livro.id)
+            .where(Livro.id == book_id)
+        )
+    ).first()
+    if estoque is None:
+        raise HTTPException(status_code=404, detail="Livro não encontrado.")
+    if estoque.book_id is None:
         raise HTTPException(
             status_code=404, detail="Estoque não encontrado para este livro."
         )
@@ -38,35 +117,168 @@ def obter_estoque_por_livro(book_id: int, db: Session = Depends(get_db)):
     return estoque
 
 
-@router.post("/", response_model=StockResponse, status_code=201)
-def criar_estoque(stock: StockCreate, db: Session = Depends(get_db)):
-    # Verifica se o livro existe
-    livro = db.query(Livro).filter(Livro.id == stock.book_id).first()
-    if not livro:
+@router.post(
+    "/",
+    response_model=StockResponse,
+    status_code=201,
+    responses={200: {"description": "Estoque existente substituído"}},
+)
+async def criar_estoque(
+    stock: StockCreate, response: Response, db: AsyncSession = Depends(get_db)
+):
+    """
+    Cria o estoque do livro ou, se já existir, substitui a quantidade (upsert
+    em um único comando): 201 quando criado, 200 quando substituído.
+    """
+    comando = insert(Stock).from_select(
+        [Stock.book_id, Stock.quantity],
+        select(literal(stock.book_id), literal(stock.quantity)).where(
+            exists().where(Livro.id == stock.book_id)
+        ),
+    )
+    comando = comando.on_conflict_do_update(
+        index_elements=[Stock.book_id],
+        set_={"quantity": comando.excluded.quantity, "version": Stock.version + 1},
+    ).returning(*_COLUNAS)
+
+    estoque = (await db.execute(comando)).first()
+    if estoque is None:
         raise HTTPException(status_code=404, detail="Livro não encontrado.")
+    await db.commit()
 
-    # Verifica se já existe estoque para esse livro
-    db_estoque = db.query(Stock).filter(Stock.book_id == stock.book_id).first()
-    if db_estoque:
+    if estoque.version > 0:
+        response.status_code = status.HTTP_200_OK
+    return estoque
+
+
+@router.put("/{book_id}", response_model=StockResponse)
+async def atualizar_estoque(
+    book_id: int, dados: StockUpdate, db: AsyncSession = Depends(get_db)
+):
+    """
+    Define a quantidade. A `version` (a lida junto com o estoque) é
+    obrigatória: a gravação só acontece se ninguém alterou o estoque desde a
+    leitura; caso contrário a resposta é 409 com a quantidade e a versão
+    atuais. Sem ela, 428: para somar ou retirar unidades sem ler antes, use
+    o PATCH com `delta`.
+    """
+    if dados.version is None:
         raise HTTPException(
-            status_code=400, detail="Estoque já cadastrado para este livro."
+            status_code=status.HTTP_428_PRECONDITION_REQUIRED,
+            detail="Informe a version lida com o estoque (ou use PATCH com delta).",
         )
+    estoque = (
+        await db.execute(
+            update(Stock)
+            .where(Stock.book_id == book_id, Stock.version == dados.version)
+            .values(quantity=dados.quantity, version=Stock.version + 1)
+            .returning(*_COLUNAS)
+            .execution_options(synchronize_session=False)
+        )
+    ).first()
 
-    # Cria o novo estoque
-    novo_estoque = Stock(**stock.dict())
-    db.add(novo_estoque)
-    db.commit()
-    db.refresh(novo_estoque)
-    return novo_estoque
+    if estoque is None:
+        atual = await _estoque_atual(db, book_id)
+        if atual is None:
+            raise HTTPException(status_code=404, detail="Estoque não encontrado.")
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={
+                "mensagem": "Estoque alterado desde a leitura",
+                "quantity": atual.quantity,
+                "version": atual.version,
+            },
+        )
+    await db.commit()
+    return estoque
 
 
-@router.put("/{book_id}", response_model=StockResponse)
-def atualizar_estoque(book_id: int, dados: StockUpdate, db: Session = Depends(get_db)):
-    estoque = db.query(Stock).filter(Stock.book_id == book_id).first()
-    if not estoque:
-        raise HTTPException(status_code=404, detail="Estoque não encontrado.")
-
-    estoque.quantity = dados.quantity
-    db.commit()
-    db.refresh(estoque)
+@router.patch("/{book_id}", response_model=StockResponse)
+async def ajustar_estoque(
+    book_id: int, dados: StockDelta, db: AsyncSession = Depends(get_db)
+):
+    """
+    Soma `delta` à quantidade (entrada ou baixa) em um único UPDATE atômico,
+    sem deixar o estoque negativo: baixas maiores que o disponível são
+    recusadas com 409.
+    """
+    estoque = (
+        await db.execute(
+            update(Stock)
+            .where(Stock.book_id == book_id, Stock.quantity + dados.delta >= 0)
+            .values(quantity=Stock.quantity + dados.delta, version=Stock.version + 1)
+            .returning(*_COLUNAS)
+            .execution_options(synchronize_session=False)
+        )
+    ).first()
+
+    if estoque is None:
+        atual = await _estoque_atual(db, book_id)
+        if atual is None:
+            raise HTTPException(status_code=404, detail="Estoque não encontrado.")
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={
+                "mensagem": "Estoque insuficiente",
+                "quantity": atual.quantity,
+                "version": atual.version,
+            },
+        )
+    await db.commit()
     return estoque
+
+
+@router.patch("/", response_model=List[StockResponse])
+async def ajustar_estoque_em_lote(
+    lote: StockDeltaLote, db: AsyncSession = Depends(get_db)
+):
+    """
+    Aplica vários ajustes (`delta`) em um único UPDATE, na mesma transação:
+    ou todos são aplicados, ou nenhum. Deltas repetidos para o mesmo livro
+    são somados. Livros sem estoque ou que ficariam negativos geram 409 com
+    o problema de cada um.
+    """
+    ajustes = Counter()
+    for item in lote.itens:
+        ajustes[item.book_id] += item.delta
+
+    linhas = (
+        await db.execute(
+            _AJUSTAR_EM_LOTE, {"ajustes": json.dumps(list(ajustes.items()))}
+        )
+    ).all()
+
+    if len(linhas) < len(ajustes):
+        aplicados = {linha.book_id for linha in linhas}
+        pendentes = [book_id for book_id in ajustes if book_id not in aplicados]
+        atuais = dict(
+            (
+                await db.execute(
+                    select(Stock.book_id, Stock.quantity).where(
+                        Stock.book_id.in_(pendentes)
+                    )
+                )
+            ).all()
+        )
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={
+                "mensagem": "Nenhum ajuste foi aplicado",
+                "itens": [
+                    {
+                        "book_id": book_id,
+                        "quantity": atuais.get(book_id),
+                        "erro": (
+                            "Estoque insuficiente"
+                            if book_id in atuais
+                            else "Estoque não encontrado"
+                        ),
+                    }
+                    for book_id in pendentes
+                ],
+            },
+        )
+
+    await db.commit()
+    return sorted(linhas, key=lambda linha: linha.book_id)
@@ -1,6 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from app.database import SessionLocal
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from sqlalchemy import delete, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_db
+from app.erros import traduzir_violacao
+from app.importacao import (
+    CORPO_IMPORTACAO,
+    TAMANHO_LOTE,
+    formato_da_requisicao,
+    importar,
+)
 from app.models.models import Usuario
 from app.schemas.usuario_schema import (
     UsuarioCreate,
@@ -8,43 +19,43 @@ from app.schemas.usuario_schema import (
     UsuarioUpdatePATCH,
     UsuarioResponse,
 )
+from app.schemas.pagina_schema import Pagina
+from app.paginacao import ParametrosPaginacao, paginar
 
 router = APIRouter()
 
-
-# Dependency
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# Restrição UNIQUE -> mensagem do 400
+_UNICOS = {"borrowers.email": "Email já está em uso"}
 
 
 @router.get(
     "/",
-    response_model=list[UsuarioResponse],
+    response_model=Pagina[UsuarioResponse],
     responses={
         status.HTTP_200_OK: {
             "description": "Lista de usuários retornada com sucesso",
             "content": {
                 "application/json": {
-                    "example": [
-                        {
-                            "id": 1,
-                            "name": "João Silva",
-                            "email": "joao@email.com",
-                            "phone": "(11) 9999-1111",
-                        }
-                    ]
+                    "example": {
+                        "items": [
+                            {
+                                "id": 1,
+                                "name": "João Silva",
+                                "email": "joao@email.com",
+                                "phone": "(11) 9999-1111",
+                            }
+                        ],
+                        "next_cursor": "WzFd",
+                    }
                 }
             },
         }
     },
 )
-def listar_usuarios(db: Session = Depends(get_db)):
-    usuarios = db.query(Usuario).all()
-    return usuarios
+async def listar_usuarios(
+    paginacao: ParametrosPaginacao = Depends(), db: AsyncSession = Depends(get_db)
+):
+    return await paginar(db, select(Usuario), [Usuario.id], paginacao)
 
 
 @router.get(
@@ -72,8 +83,8 @@ def listar_usuarios(db: Session = Depends(get_db)):
         },
     },
 )
-def obter_usuario(usuario_id: int, db: Session = Depends(get_db)):
-    usuario = db.query(Usuario).filter(Usuario.id == usuario_id).first()
+async def obter_usuario(usuario_id: int, db: AsyncSession = Depends(get_db)):
+    usuario = await db.get(Usuario, usuario_id)
     if not usuario:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Usuário não encontrado"
@@ -81,6 +92,20 @@ def obter_usuario(usuario_id: int, db: Session = Depends(get_db)):
     return usuario
 
 
+@router.post("/importar", openapi_extra=CORPO_IMPORTACAO)
+async def importar_usuarios(
+    request: Request,
+    formato: Optional[str] = Query(None, description="csv ou ndjson"),
+    lote: int = Query(TAMANHO_LOTE, ge=1, le=10_000),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Importa usuários em massa de um CSV ou NDJSON enviado no corpo
+    """
+    formato = formato_da_requisicao(request, formato)
+    return await importar(db, "usuarios", request.stream(), formato, lote)
+
+
 @router.post(
     "/",
     response_model=UsuarioResponse,
@@ -107,13 +132,8 @@ def obter_usuario(usuario_id: int, db: Session = Depends(get_db)):
         },
     },
 )
-def criar_usuario(usuario: UsuarioCreate, db: Session = Depends(get_db)):
-    # Verifica se email já existe
-    if db.query(Usuario).filter(Usuario.email == usuario.email).first():
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST, detail="Email já está em uso"
-        )
-
+async def criar_usuario(usuario: UsuarioCreate, db: AsyncSession = Depends(get_db)):
+    # Email repetido é recusado pelo UNIQUE de borrowers.email
     try:
         novo_usuario = Usuario(
             name=usuario.name,
@@ -122,19 +142,49 @@ def criar_usuario(usuario: UsuarioCreate, db: Session = Depends(get_db)):
         )
 
         db.add(novo_usuario)
-        db.commit()
-        db.refresh(novo_usuario)
+        await db.commit()
+        await db.refresh(novo_usuario)
 
         return novo_usuario
 
+    except IntegrityError as e:
+        raise await traduzir_violacao(db, e, unicos=_UNICOS)
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Erro ao criar usuário: {str(e)}",
         )
 
 
+async def _atualizar(db: AsyncSession, usuario_id: int, campos: dict):
+    """UPDATE ... RETURNING em uma ida ao banco. O email repetido é recusado
+    pelo UNIQUE de borrowers.email"""
+    try:
+        usuario = await db.scalar(
+            update(Usuario)
+            .where(Usuario.id == usuario_id)
+            .values(**campos)
+            .returning(Usuario)
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+    except IntegrityError as e:
+        raise await traduzir_violacao(db, e, unicos=_UNICOS)
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Erro ao atualizar usuário: {str(e)}",
+        )
+
+    if usuario is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Usuário não encontrado"
+        )
+    return usuario
+
+
 @router.put(
     "/{usuario_id}",
     response_model=UsuarioResponse,
@@ -166,38 +216,10 @@ def criar_usuario(usuario: UsuarioCreate, db: Session = Depends(get_db)):
         },
     },
 )
-def atualizar_usuario(
-    usuario_id: int, usuario_data: UsuarioUpdatePUT, db: Session = Depends(get_db)
+async def atualizar_usuario(
+    usuario_id: int, usuario_data: UsuarioUpdatePUT, db: AsyncSession = Depends(get_db)
 ):
-    usuario = db.query(Usuario).filter(Usuario.id == usuario_id).first()
-    if not usuario:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, detail="Usuário não encontrado"
-        )
-
-    # Verifica se novo email já existe
-    if usuario_data.email != usuario.email:
-        if db.query(Usuario).filter(Usuario.email == usuario_data.email).first():
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST, detail="Email já está em uso"
-            )
-
-    try:
-        usuario.name = usuario_data.name
-        usuario.email = usuario_data.email
-        usuario.phone = usuario_data.phone
-
-        db.commit()
-        db.refresh(usuario)
-
-        return usuario
-
-    except Exception as e:
-        db.rollback()
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Erro ao atualizar usuário: {str(e)}",
-        )
+    return await _atualizar(db, usuario_id, usuario_data.model_dump())
 
 
 @router.patch(
@@ -231,39 +253,21 @@ def atualizar_usuario(
         },
     },
 )
-def atualizar_usuario(
-    usuario_id: int, usuario_data: UsuarioUpdatePATCH, db: Session = Depends(get_db)
+async def atualizar_usuario(
+    usuario_id: int,
+    usuario_data: UsuarioUpdatePATCH,
+    db: AsyncSession = Depends(get_db),
 ):
-    usuario = db.query(Usuario).filter(Usuario.id == usuario_id).first()
-    if not usuario:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, detail="Usuário não encontrado"
-        )
-
     update_data = usuario_data.dict(exclude_unset=True)
-
-    # Verifica se novo email (se fornecido) já existe
-    if "email" in update_data and update_data["email"] != usuario.email:
-        if db.query(Usuario).filter(Usuario.email == update_data["email"]).first():
+    if not update_data:
+        usuario = await db.get(Usuario, usuario_id)
+        if not usuario:
             raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST, detail="Email já está em uso"
+                status_code=status.HTTP_404_NOT_FOUND, detail="Usuário não encontrado"
             )
-
-    try:
-        for key, value in update_data.items():
-            setattr(usuario, key, value)
-
-        db.commit()
-        db.refresh(usuario)
-
         return usuario
 
-    except Exception as e:
-        db.rollback()
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Erro ao atualizar usuário: {str(e)}",
-        )
+    return await _atualizar(db, usuario_id, update_data)
 
 
 @router.delete(
@@ -282,23 +286,36 @@ def atualizar_usuario(
                 "application/json": {"example": {"detail": "Usuário não encontrado"}}
             },
         },
+        status.HTTP_409_CONFLICT: {
+            "description": "Usuário possui empréstimos registrados",
+        },
     },
 )
-def excluir_usuario(usuario_id: int, db: Session = Depends(get_db)):
-    usuario = db.query(Usuario).filter(Usuario.id == usuario_id).first()
-    if not usuario:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, detail="Usuário não encontrado"
-        )
-
+async def excluir_usuario(usuario_id: int, db: AsyncSession = Depends(get_db)):
     try:
-        db.delete(usuario)
-        db.commit()
-        return {"message": "Usuário excluído com sucesso"}
-
+        # Um único DELETE: nenhuma linha removida = usuário inexistente
+        excluido = await db.scalar(
+            delete(Usuario).where(Usuario.id == usuario_id).returning(Usuario.id)
+        )
+        await db.commit()
+    except IntegrityError as e:
+        raise await traduzir_violacao(
+            db,
+            e,
+            restrito=HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Usuário possui empréstimos registrados",
+            ),
+        )
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Erro ao excluir usuário: {str(e)}",
         )
+
+    if excluido is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Usuário não encontrado"
+        )
+    return {"message": "Usuário excluído com sucesso"}
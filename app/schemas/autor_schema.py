@@ -15,3 +15,11 @@ class AutorUpdatePUT(BaseModel):
 class AutorUpdatePATCH(BaseModel):
     name: Optional[str] = None
     country: Optional[str] = None
+
+
+class AutorResponse(BaseModel):
+    id: int
+    name: str
+    country: Optional[str] = None
+
+    model_config = {"from_attributes": True}
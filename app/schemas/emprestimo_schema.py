@@ -1,6 +1,6 @@
-from pydantic import BaseModel, field_validator, ValidationInfo
+from pydantic import BaseModel, Field, field_validator, ValidationInfo
 from datetime import date
-from typing import Optional
+from typing import List, Optional
 
 
 class BorrowalBase(BaseModel):
@@ -43,3 +43,20 @@ class BorrowalResponse(BaseModel):
     return_date: Optional[date] = None
 
     model_config = {"from_attributes": True}
+
+
+class BorrowalBatchCreate(BaseModel):
+    borrower_id: int
+    book_ids: List[int] = Field(..., min_length=1, max_length=100)
+    borrow_date: date
+
+
+class BorrowalBatchItem(BaseModel):
+    book_id: int
+    id: Optional[int] = None  # ID do empréstimo criado
+    erro: Optional[str] = None
+
+
+class BorrowalBatchResponse(BaseModel):
+    borrower_id: int
+    itens: List[BorrowalBatchItem]
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from datetime import datetime
+from datetime import date, datetime
 from typing import Optional
 
 
@@ -11,3 +11,9 @@ class LogResponse(BaseModel):
 
     class Config:
         orm_mode = True
+
+
+class LogDailySummaryResponse(BaseModel):
+    day: date
+    action: str
+    total: int
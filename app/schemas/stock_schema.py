@@ -1,4 +1,5 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, field_validator
+from typing import List, Optional
 
 
 class StockBase(BaseModel):
@@ -8,16 +9,40 @@ class StockBase(BaseModel):
 
 class StockCreate(BaseModel):
     book_id: int
-    quantity: int
+    quantity: int = Field(..., ge=0)
 
 
 class StockUpdate(BaseModel):
-    quantity: int
+    quantity: int = Field(..., ge=0)
+    # Versão lida junto com o estoque: a gravação só acontece se ninguém
+    # alterou o estoque desde a leitura. Obrigatória; sem ela a rota responde
+    # 428 (e não 422), como uma pré-condição ausente
+    version: Optional[int] = None
+
+
+class StockDelta(BaseModel):
+    delta: int = Field(..., description="Unidades somadas (+) ou retiradas (-)")
+
+    @field_validator("delta")
+    @classmethod
+    def validate_delta(cls, delta):
+        if delta == 0:
+            raise ValueError("delta deve ser diferente de zero")
+        return delta
+
+
+class StockDeltaItem(StockDelta):
+    book_id: int
+
+
+class StockDeltaLote(BaseModel):
+    itens: List[StockDeltaItem] = Field(..., min_length=1, max_length=1000)
 
 
 class StockResponse(StockBase):
     book_id: int
     quantity: int
+    version: int
 
     class Config:
         orm_mode = True
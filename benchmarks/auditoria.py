@@ -0,0 +1,141 @@
+## Benchmark: logs de empréstimo gravados pelos triggers x em lote pela API
+#
+# Roda a API no próprio processo (httpx + ASGITransport) sobre uma cópia do
+# banco. Em cada modo de AUDITORIA_MODO, --clientes clientes concorrentes
+# fazem --ciclos ciclos de empréstimo (POST) + devolução (PATCH), e no fim
+# confere se cada operação gerou exatamente um log:
+#
+#   python -m benchmarks.auditoria --clientes 16 --ciclos 100
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import time
+
+import httpx
+
+BANCO_ORIGEM = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    "..",
+    "database",
+    "biblioteca_amostra.db",
+)
+
+
+def _contar_logs():
+    with sqlite3.connect(os.environ["BIBLIOTECA_DB_PATH"]) as conexao:
+        return conexao.execute("SELECT COUNT(*) FROM logs").fetchone()[0]
+
+
+async def medir_modo(modo, clientes, ciclos, livros, usuario):
+    # Importado aqui: app.database lê BIBLIOTECA_DB_PATH na importação
+    from app.auditoria import auditoria
+    from app.main import app
+
+    auditoria.modo = modo
+    logs_antes = _contar_logs()
+    tempos = {"emprestimo": [], "devolucao": []}
+
+    await app.router.startup()
+    try:
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://bench"
+        ) as cliente:
+
+            async def ciclo(livro):
+                inicio = time.perf_counter()
+                resposta = await cliente.post(
+                    "/api/emprestimos/",
+                    json={
+                        "book_id": livro,
+                        "borrower_id": usuario,
+                        "borrow_date": "2025-01-01",
+                    },
+                )
+                resposta.raise_for_status()
+                meio = time.perf_counter()
+                resposta = await cliente.patch(
+                    f"/api/emprestimos/{resposta.json()['id']}",
+                    json={"return_date": "2025-03-01"},
+                )
+                resposta.raise_for_status()
+                tempos["emprestimo"].append(meio - inicio)
+                tempos["devolucao"].append(time.perf_counter() - meio)
+
+            async def cliente_simulado(n):
+                for i in range(ciclos):
+                    await ciclo(livros[(n * ciclos + i) % len(livros)])
+
+            inicio = time.perf_counter()
+            await asyncio.gather(*(cliente_simulado(n) for n in range(clientes)))
+            duracao = time.perf_counter() - inicio
+            estatisticas = auditoria.estatisticas()
+    finally:
+        # Grava o que restou na fila; sem isso as threads do aiosqlite
+        # mantêm o processo vivo
+        await app.router.shutdown()
+
+    operacoes = 2 * clientes * ciclos
+    resultado = {
+        "operacoes_por_s": round(operacoes / duracao, 1),
+        "logs_esperados": operacoes,
+        "logs_gravados": _contar_logs() - logs_antes,
+    }
+    for operacao, amostras in tempos.items():
+        quantis = statistics.quantiles(amostras, n=100)
+        resultado[f"{operacao}_p50_ms"] = round(quantis[49] * 1000, 3)
+        resultado[f"{operacao}_p99_ms"] = round(quantis[98] * 1000, 3)
+    if modo != "banco":
+        resultado["lotes"] = estatisticas["lotes"]
+        resultado["tamanho_medio_lote"] = estatisticas["tamanho_medio_lote"]
+        resultado["esperas_fila_cheia"] = estatisticas["esperas_fila_cheia"]
+    return resultado
+
+
+async def medir(modos, clientes, ciclos):
+    with sqlite3.connect(os.environ["BIBLIOTECA_DB_PATH"]) as conexao:
+        conexao.execute("UPDATE stock SET quantity = 1000000")
+        livros = [
+            id
+            for (id,) in conexao.execute(
+                "SELECT book_id FROM stock JOIN books ON books.id = stock.book_id"
+            )
+        ]
+        usuario = conexao.execute("SELECT MIN(id) FROM borrowers").fetchone()[0]
+
+    return {
+        modo: await medir_modo(modo, clientes, ciclos, livros, usuario)
+        for modo in modos
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Logs por trigger x em lote")
+    parser.add_argument("--clientes", type=int, default=16)
+    parser.add_argument("--ciclos", type=int, default=100)
+    parser.add_argument("--modos", nargs="+", default=["banco", "rapido", "duravel"])
+    parser.add_argument("--banco", default=BANCO_ORIGEM, help="Banco copiado")
+    parser.add_argument("--saida", help="Arquivo JSON com o resultado")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as diretorio:
+        copia = os.path.join(diretorio, "benchmark.db")
+        shutil.copy(args.banco, copia)
+        os.environ["BIBLIOTECA_DB_PATH"] = copia
+        os.environ.setdefault("BUSCA_APROXIMADA", "0")
+        resultado = asyncio.run(medir(args.modos, args.clientes, args.ciclos))
+
+    resultado = {"clientes": args.clientes, "ciclos": args.ciclos, **resultado}
+    print(json.dumps(resultado, indent=2))
+    if args.saida:
+        with open(args.saida, "w") as arquivo:
+            json.dump(resultado, arquivo, indent=2)
+
+
+if __name__ == "__main__":
+    main()
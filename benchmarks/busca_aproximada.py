@@ -0,0 +1,176 @@
+## Benchmark do índice de trigramas (app/busca_aproximada.py)
+#
+# Gera um catálogo sintético de títulos, mede o tempo de construção, a
+# memória ocupada por entrada indexada e a latência de consultas com erros
+# de digitação. A memória vem de uma segunda construção, sob tracemalloc
+# (que deixa a construção algumas vezes mais lenta). `iguais_a_exata` é a
+# fração das consultas com as mesmas pontuações da busca sem limite de
+# candidatos.
+#
+#   python -m benchmarks.busca_aproximada --titulos 1000000
+#   python -m benchmarks.busca_aproximada --max-candidatos 300
+
+import argparse
+import json
+import random
+import statistics
+import time
+import tracemalloc
+
+from app.busca_aproximada import MAX_CANDIDATOS, IndiceTrigramas, normalizar
+
+SILABAS = [consoante + vogal for consoante in "bcdfglmnprstvz" for vogal in "aeiou"] + [
+    "ção",
+    "lh",
+    "nh",
+    "qu",
+    "ar",
+    "er",
+    "or",
+    "an",
+    "en",
+    "in",
+]
+
+PALAVRAS_COMUNS = ["de", "da", "do", "e", "o", "a", "dos", "das", "no", "na"]
+
+
+def gerar_vocabulario(rng, tamanho):
+    vocabulario = set()
+    while len(vocabulario) < tamanho:
+        silabas = rng.randint(2, 5)
+        vocabulario.add("".join(rng.choice(SILABAS) for _ in range(silabas)))
+    return sorted(vocabulario)
+
+
+def gerar_titulos(rng, quantidade, vocabulario):
+    # Frequência das palavras segue uma distribuição de Zipf, como em textos
+    pesos = [1 / (posicao + 1) for posicao in range(len(vocabulario))]
+    acumulados = list(_acumular(pesos))
+    for _ in range(quantidade):
+        palavras = rng.choices(vocabulario, cum_weights=acumulados, k=rng.randint(2, 5))
+        if rng.random() < 0.4:
+            palavras.insert(
+                rng.randrange(1, len(palavras)), rng.choice(PALAVRAS_COMUNS)
+            )
+        yield " ".join(palavras).title()
+
+
+def _acumular(pesos):
+    total = 0.0
+    for peso in pesos:
+        total += peso
+        yield total
+
+
+def com_erro(rng, palavra):
+    """Aplica um erro de digitação: troca, omissão ou inversão de letras"""
+    if len(palavra) < 4:
+        return palavra
+    i = rng.randrange(1, len(palavra) - 1)
+    tipo = rng.choice(("troca", "omissao", "inversao"))
+    if tipo == "troca":
+        return palavra[:i] + rng.choice("abcdefghijlmnopqrstuvz") + palavra[i + 1 :]
+    if tipo == "omissao":
+        return palavra[:i] + palavra[i + 1 :]
+    return palavra[: i - 1] + palavra[i] + palavra[i - 1] + palavra[i + 1 :]
+
+
+def gerar_consultas(rng, titulos, quantidade):
+    consultas = []
+    for titulo in rng.sample(titulos, quantidade):
+        palavras = [p for p in normalizar(titulo) if p not in PALAVRAS_COMUNS]
+        palavras = palavras[: rng.randint(1, 2)]
+        alvo = rng.randrange(len(palavras))
+        palavras[alvo] = com_erro(rng, palavras[alvo])
+        consultas.append(" ".join(palavras))
+    return consultas
+
+
+def construir(titulos):
+    indice = IndiceTrigramas()
+    for chave, titulo in enumerate(titulos, start=1):
+        indice.adicionar(chave, titulo)
+    return indice
+
+
+def pontuacoes(resposta):
+    return [pontuacao for _, _, pontuacao in resposta]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark da busca aproximada")
+    parser.add_argument("--titulos", type=int, default=1_000_000)
+    parser.add_argument("--vocabulario", type=int, default=80_000)
+    parser.add_argument("--consultas", type=int, default=2_000)
+    parser.add_argument("--limiar", type=float, default=0.4)
+    parser.add_argument("--limite", type=int, default=10)
+    parser.add_argument("--max-candidatos", type=int, default=MAX_CANDIDATOS)
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--saida", help="Arquivo JSON com o resultado")
+    args = parser.parse_args()
+
+    rng = random.Random(args.semente)
+    vocabulario = gerar_vocabulario(rng, args.vocabulario)
+    titulos = list(gerar_titulos(rng, args.titulos, vocabulario))
+    consultas = gerar_consultas(rng, titulos, args.consultas)
+
+    tracemalloc.start()
+    indice = construir(titulos)
+    memoria, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del indice
+
+    inicio = time.perf_counter()
+    indice = construir(titulos)
+    construcao = time.perf_counter() - inicio
+
+    # Primeira passada aquece o cache de expansões; as duas são reportadas
+    resultados = {}
+    for passada in ("fria", "quente"):
+        tempos, encontrados, respostas = [], 0, []
+        for consulta in consultas:
+            inicio = time.perf_counter()
+            resposta = indice.buscar(
+                consulta, args.limiar, args.limite, args.max_candidatos
+            )
+            tempos.append(time.perf_counter() - inicio)
+            encontrados += bool(resposta)
+            respostas.append(pontuacoes(resposta))
+        quantis = statistics.quantiles(tempos, n=100)
+        resultados[passada] = {
+            "p50_ms": round(quantis[49] * 1000, 4),
+            "p95_ms": round(quantis[94] * 1000, 4),
+            "p99_ms": round(quantis[98] * 1000, 4),
+            "media_ms": round(statistics.fmean(tempos) * 1000, 4),
+            "consultas_com_resultado": round(encontrados / len(consultas), 4),
+        }
+
+    # Sem limite de candidatos, as respostas já são as exatas
+    iguais = len(consultas)
+    if args.max_candidatos is not None:
+        exatas = [
+            pontuacoes(indice.buscar(consulta, args.limiar, args.limite, None))
+            for consulta in consultas
+        ]
+        iguais = sum(resposta == exata for resposta, exata in zip(respostas, exatas))
+
+    relatorio = {
+        "titulos": len(indice),
+        "max_candidatos": args.max_candidatos,
+        "vocabulario": indice.vocabulario,
+        "construcao_s": round(construcao, 2),
+        "memoria_total_mb": round(memoria / 2**20, 1),
+        "bytes_por_titulo": round(memoria / len(indice), 1),
+        "consultas": resultados,
+        "iguais_a_exata": round(iguais / len(consultas), 4),
+    }
+    print(json.dumps(relatorio, indent=2, ensure_ascii=False))
+
+    if args.saida:
+        with open(args.saida, "w") as arquivo:
+            json.dump(relatorio, arquivo, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+## Benchmark: empréstimo de vários livros, um POST por livro x POST /batch
+#
+# Roda a API no próprio processo (httpx + ASGITransport) sobre uma cópia do
+# banco, com estoque alto para que nenhum empréstimo seja recusado, e mede o
+# tempo de um atendimento (um usuário levando --livros livros) nos dois
+# caminhos:
+#
+#   python -m benchmarks.emprestimo_em_lote --atendimentos 300 --livros 8
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import time
+
+import httpx
+
+BANCO_ORIGEM = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    "..",
+    "database",
+    "biblioteca_amostra.db",
+)
+
+
+def _resumo(tempos):
+    quantis = statistics.quantiles(tempos, n=100)
+    return {
+        "p50_ms": round(quantis[49] * 1000, 3),
+        "p95_ms": round(quantis[94] * 1000, 3),
+        "media_ms": round(statistics.fmean(tempos) * 1000, 3),
+        "atendimentos_por_s": round(len(tempos) / sum(tempos), 1),
+    }
+
+
+async def medir(atendimentos, livros_por_atendimento):
+    # Importado aqui: app.database lê BIBLIOTECA_DB_PATH na importação
+    from app.main import app
+
+    with sqlite3.connect(os.environ["BIBLIOTECA_DB_PATH"]) as conexao:
+        conexao.execute("UPDATE stock SET quantity = 1000000")
+        livros = [
+            id
+            for (id,) in conexao.execute(
+                "SELECT book_id FROM stock JOIN books ON books.id = stock.book_id"
+            )
+        ]
+        usuario = conexao.execute("SELECT MIN(id) FROM borrowers").fetchone()[0]
+
+    def pedido(i):
+        inicio = i * livros_por_atendimento
+        return [
+            livros[(inicio + j) % len(livros)] for j in range(livros_por_atendimento)
+        ]
+
+    await app.router.startup()
+    transporte = httpx.ASGITransport(app=app)
+    try:
+        async with httpx.AsyncClient(
+            transport=transporte, base_url="http://bench"
+        ) as cliente:
+
+            async def um_por_livro(book_ids):
+                for book_id in book_ids:
+                    resposta = await cliente.post(
+                        "/api/emprestimos/",
+                        json={
+                            "book_id": book_id,
+                            "borrower_id": usuario,
+                            "borrow_date": "2025-01-01",
+                        },
+                    )
+                    resposta.raise_for_status()
+
+            async def em_lote(book_ids):
+                resposta = await cliente.post(
+                    "/api/emprestimos/batch",
+                    json={
+                        "borrower_id": usuario,
+                        "book_ids": book_ids,
+                        "borrow_date": "2025-01-01",
+                    },
+                )
+                resposta.raise_for_status()
+
+            resultado = {}
+            for nome, caminho in (("um_por_livro", um_por_livro), ("batch", em_lote)):
+                await caminho(pedido(0))  # aquecimento
+                tempos = []
+                for i in range(atendimentos):
+                    inicio = time.perf_counter()
+                    await caminho(pedido(i))
+                    tempos.append(time.perf_counter() - inicio)
+                resultado[nome] = _resumo(tempos)
+    finally:
+        # Sem isso as threads do aiosqlite mantêm o processo vivo
+        await app.router.shutdown()
+
+    resultado["ganho_p50"] = round(
+        resultado["um_por_livro"]["p50_ms"] / resultado["batch"]["p50_ms"], 2
+    )
+    return resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Empréstimo em lote x unitário")
+    parser.add_argument("--atendimentos", type=int, default=300)
+    parser.add_argument("--livros", type=int, default=8)
+    parser.add_argument("--banco", default=BANCO_ORIGEM, help="Banco copiado")
+    parser.add_argument("--saida", help="Arquivo JSON com o resultado")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as diretorio:
+        copia = os.path.join(diretorio, "benchmark.db")
+        shutil.copy(args.banco, copia)
+        os.environ["BIBLIOTECA_DB_PATH"] = copia
+        os.environ.setdefault("BUSCA_APROXIMADA", "0")
+        resultado = asyncio.run(medir(args.atendimentos, args.livros))
+
+    resultado = {"livros_por_atendimento": args.livros, **resultado}
+    print(json.dumps(resultado, indent=2))
+    if args.saida:
+        with open(args.saida, "w") as arquivo:
+            json.dump(resultado, arquivo, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+## Latência e comandos SQL por escrita (POST, PUT, PATCH e DELETE da API)
+#
+# Reaproveita os cenários de benchmarks/rotas.py, mas mede uma requisição
+# por vez (sem concorrência: a latência de cada escrita, não a vazão) e com
+# PERFIL_SQL=1, para contar os comandos SQL que cada escrita envia ao banco.
+# Serve para comparar duas versões dos handlers sobre o mesmo banco:
+#
+#   python -m benchmarks.escritas --saida antes.json
+#   (altera os handlers)
+#   python -m benchmarks.escritas --comparar antes.json
+#
+# Com --comparar, imprime p50 e comandos por requisição lado a lado e termina
+# com código 1 se alguma rota passar a enviar mais comandos que antes (ou se
+# alguma requisição medida falhar).
+
+import argparse
+import asyncio
+import gc
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+import httpx
+
+from benchmarks.rotas import (
+    DIRETORIO_DADOS,
+    Amostra,
+    banco_da_escala,
+    medir_rota,
+    rotas_da_api,
+)
+
+METODOS_DE_ESCRITA = ("POST", "PUT", "PATCH", "DELETE")
+
+
+async def medir_escritas(args):
+    # Importados aqui: o perfil e o banco são lidos do ambiente na importação
+    from app import perfil_sql
+    from app.main import app
+
+    rotas = [
+        rota
+        for rota in rotas_da_api(app)
+        if rota.split(" ", 1)[0] in METODOS_DE_ESCRITA
+        and (not args.filtro or args.filtro in rota)
+    ]
+    amostra = Amostra(os.environ["BIBLIOTECA_DB_PATH"], args.semente)
+    resultado = {}
+    await app.router.startup()
+    try:
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=60
+        ) as cliente:
+            gc.collect()
+            gc.freeze()
+            for rota in rotas:
+                gc.collect()
+                medida = await medir_rota(cliente, rota, amostra, args)
+                perfil = perfil_sql.estatisticas()["rotas"].get(rota, {})
+                resultado[rota] = {
+                    "p50_ms": medida["p50_ms"],
+                    "p95_ms": medida["p95_ms"],
+                    "comandos_por_requisicao": perfil.get("comandos_por_requisicao"),
+                    "erros": medida["erros"],
+                    **(
+                        {"exemplos_erros": medida["exemplos_erros"]}
+                        if medida["erros"]
+                        else {}
+                    ),
+                }
+                print(_linha(rota, resultado[rota]), file=sys.stderr, flush=True)
+    finally:
+        await app.router.shutdown()
+    return resultado
+
+
+def _linha(rota, medida, base=None):
+    linha = (
+        f"{rota:<45} p50 {medida['p50_ms']:>7.2f} ms"
+        f"  {medida['comandos_por_requisicao']:>5} SQL"
+    )
+    if base is not None:
+        linha += (
+            f"  (antes: {base['p50_ms']:>7.2f} ms"
+            f"  {base['comandos_por_requisicao']:>5} SQL)"
+        )
+    return linha + (f"  {medida['erros']} erros" if medida["erros"] else "")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latência e SQL por escrita")
+    parser.add_argument("--escala", default="10k", help="Livros do banco gerado")
+    parser.add_argument("--banco", help="Banco já existente (em vez de --escala)")
+    parser.add_argument("--dados", default=DIRETORIO_DADOS, help="Bancos gerados")
+    parser.add_argument("--requisicoes", type=int, default=200, help="Por rota")
+    parser.add_argument("--aquecimento", type=int, default=10)
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--filtro", help="Só as rotas que contêm este texto")
+    parser.add_argument("--saida", help="Arquivo JSON com o resultado")
+    parser.add_argument("--comparar", help="JSON de uma execução anterior")
+    args = parser.parse_args()
+    # Uma requisição por vez: mede a latência de cada escrita
+    args.concorrencia = 1
+
+    banco = args.banco or banco_da_escala(args.escala, args)
+    with tempfile.TemporaryDirectory() as diretorio:
+        copia = os.path.join(diretorio, "benchmark.db")
+        shutil.copy(banco, copia)
+        os.environ["BIBLIOTECA_DB_PATH"] = copia
+        os.environ["PERFIL_SQL"] = "1"
+        os.environ["PERFIL_SQL_AMOSTRAGEM"] = "1"
+        rotas = asyncio.run(medir_escritas(args))
+
+    if args.saida:
+        with open(args.saida, "w") as arquivo:
+            json.dump(
+                {"requisicoes": args.requisicoes, "rotas": rotas},
+                arquivo,
+                indent=2,
+                ensure_ascii=False,
+            )
+
+    falhas = [
+        f"{rota}: {medida['erros']} erros"
+        for rota, medida in rotas.items()
+        if medida["erros"]
+    ]
+    if args.comparar:
+        with open(args.comparar) as arquivo:
+            anteriores = json.load(arquivo)["rotas"]
+        print(file=sys.stderr)
+        for rota, medida in rotas.items():
+            base = anteriores.get(rota)
+            print(_linha(rota, medida, base), file=sys.stderr)
+            if base and (
+                medida["comandos_por_requisicao"] > base["comandos_por_requisicao"]
+            ):
+                falhas.append(
+                    f"{rota}: {base['comandos_por_requisicao']}"
+                    f" -> {medida['comandos_por_requisicao']} comandos SQL"
+                )
+
+    for falha in falhas:
+        print(f"❌ {falha}", file=sys.stderr)
+    if falhas:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+## Escritas concorrentes com e sem o escritor único (ESCRITA_COORDENADA)
+#
+# Sobe a API no próprio processo (httpx + ASGITransport) sobre uma cópia do
+# banco e dispara, por --duracao segundos, --concorrencia clientes que só
+# escrevem: empréstimos (POST) e reposições de estoque (PATCH com delta)
+# contra poucos livros (--livros-quentes). Cada modo roda em um subprocesso,
+# porque app.database lê ESCRITA_COORDENADA na importação.
+#
+# Reporta, por modo, as escritas confirmadas por segundo, a taxa de falhas
+# "database is locked", p50/p99 e, com o escritor único, as transações
+# confirmadas por COMMIT:
+#
+#   python -m benchmarks.escritor_unico --concorrencia 200 --duracao 10
+#   python -m benchmarks.escritor_unico --modos coordenado --saida coord.json
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.estoque_concorrente import BANCO_ORIGEM
+
+MODOS = {"direto": "0", "coordenado": "1"}
+# Estoque inicial dos livros quentes: os empréstimos não devem esgotá-lo
+ESTOQUE_INICIAL = 1_000_000
+
+
+def preparar_banco(caminho, quantidade_livros):
+    """Livros quentes com estoque de sobra e usuários para os empréstimos"""
+    with sqlite3.connect(caminho) as conexao:
+        livros = [
+            id
+            for (id,) in conexao.execute(
+                "SELECT book_id FROM stock JOIN books ON books.id = stock.book_id"
+                " ORDER BY book_id LIMIT ?",
+                (quantidade_livros,),
+            )
+        ]
+        conexao.executemany(
+            "UPDATE stock SET quantity = ? WHERE book_id = ?",
+            [(ESTOQUE_INICIAL, livro) for livro in livros],
+        )
+        usuarios = [
+            id for (id,) in conexao.execute("SELECT id FROM borrowers LIMIT 100")
+        ]
+    conexao.close()
+    return livros, usuarios
+
+
+async def escrever_uma_vez(api, rng, livros, usuarios):
+    """Um empréstimo ou uma reposição de estoque; devolve o erro, ou None"""
+    livro = rng.choice(livros)
+    if rng.random() < 0.5:
+        metodo, url = "POST", "/api/emprestimos/"
+        corpo = {
+            "book_id": livro,
+            "borrower_id": rng.choice(usuarios),
+            "borrow_date": "2025-01-01",
+        }
+    else:
+        metodo, url, corpo = "PATCH", f"/api/stock/{livro}", {"delta": 1}
+    try:
+        resposta = await api.request(metodo, url, json=corpo)
+        return None if resposta.status_code < 400 else resposta.text
+    except Exception as e:
+        # Erros não tratados pelos handlers sobem pelo ASGITransport
+        return str(e)
+
+
+async def escrever(args):
+    # Importados aqui: o modo e o banco são lidos do ambiente na importação
+    from app.escrita import coordenador
+    from app.main import app
+
+    livros, usuarios = preparar_banco(
+        os.environ["BIBLIOTECA_DB_PATH"], args.livros_quentes
+    )
+    latencias = []
+    contagem = {"ok": 0, "travado": 0, "outros_erros": 0}
+    exemplos_erros = []
+
+    async def cliente(api, semente, fim):
+        rng = random.Random(semente)
+        while time.perf_counter() < fim:
+            inicio = time.perf_counter()
+            erro = await escrever_uma_vez(api, rng, livros, usuarios)
+            latencias.append(time.perf_counter() - inicio)
+            if erro is None:
+                contagem["ok"] += 1
+            elif "locked" in erro:
+                contagem["travado"] += 1
+            else:
+                contagem["outros_erros"] += 1
+                if len(exemplos_erros) < 5:
+                    exemplos_erros.append(erro[:200])
+
+    await app.router.startup()
+    try:
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=60
+        ) as api:
+            inicio = time.perf_counter()
+            fim = inicio + args.duracao
+            await asyncio.gather(
+                *(cliente(api, args.semente + i, fim) for i in range(args.concorrencia))
+            )
+            decorrido = time.perf_counter() - inicio
+        escritor = coordenador.estatisticas()
+    finally:
+        await app.router.shutdown()
+
+    total = sum(contagem.values())
+    quantis = statistics.quantiles(latencias, n=100)
+    return {
+        "escritas_por_s": round(contagem["ok"] / decorrido, 1),
+        **contagem,
+        "taxa_travado": round(contagem["travado"] / max(total, 1), 4),
+        "p50_ms": round(quantis[49] * 1000, 3),
+        "p99_ms": round(quantis[98] * 1000, 3),
+        **(
+            {"transacoes_por_grupo": escritor["transacoes_por_grupo"]}
+            if escritor["grupos"]
+            else {}
+        ),
+        **({"exemplos_erros": exemplos_erros} if exemplos_erros else {}),
+    }
+
+
+def medir_modo(modo, args):
+    """Mede um modo em um subprocesso, sobre uma cópia nova do banco"""
+    print(f"== {modo}", file=sys.stderr, flush=True)
+    with tempfile.TemporaryDirectory() as diretorio:
+        saida = os.path.join(diretorio, "resultado.json")
+        comando = [
+            sys.executable,
+            "-m",
+            "benchmarks.escritor_unico",
+            "--banco",
+            args.banco,
+            "--executar",
+            modo,
+            "--saida",
+            saida,
+            "--concorrencia",
+            str(args.concorrencia),
+            "--duracao",
+            str(args.duracao),
+            "--livros-quentes",
+            str(args.livros_quentes),
+            "--semente",
+            str(args.semente),
+        ]
+        ambiente = {**os.environ, "ESCRITA_COORDENADA": MODOS[modo]}
+        subprocess.run(comando, check=True, stdout=subprocess.DEVNULL, env=ambiente)
+        with open(saida) as arquivo:
+            return json.load(arquivo)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Escritas com e sem escritor único")
+    parser.add_argument("--modos", nargs="+", choices=MODOS, default=list(MODOS))
+    parser.add_argument("--concorrencia", type=int, default=200)
+    parser.add_argument("--duracao", type=float, default=10.0)
+    parser.add_argument("--livros-quentes", type=int, default=3)
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--banco", default=BANCO_ORIGEM, help="Banco copiado")
+    parser.add_argument("--saida", help="Arquivo JSON com o resultado")
+    # Uso interno: mede um modo no próprio processo (ver medir_modo)
+    parser.add_argument("--executar", choices=MODOS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.executar:
+        with tempfile.TemporaryDirectory() as diretorio:
+            copia = os.path.join(diretorio, "benchmark.db")
+            shutil.copy(args.banco, copia)
+            os.environ["BIBLIOTECA_DB_PATH"] = copia
+            resultado = asyncio.run(escrever(args))
+        with open(args.saida, "w") as arquivo:
+            json.dump(resultado, arquivo)
+        return
+
+    resultado = {
+        "concorrencia": args.concorrencia,
+        "duracao_s": args.duracao,
+        "modos": {modo: medir_modo(modo, args) for modo in args.modos},
+    }
+    print(json.dumps(resultado, indent=2, ensure_ascii=False))
+    if args.saida:
+        with open(args.saida, "w") as arquivo:
+            json.dump(resultado, arquivo, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
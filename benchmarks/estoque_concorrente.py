@@ -0,0 +1,369 @@
+## Teste de estresse: estoque de livros muito procurados sob concorrência
+#
+# Sobe a API com `uvicorn --workers N` sobre uma cópia do banco e dispara,
+# por --duracao segundos, empréstimos (POST), devoluções (PATCH) e reposições
+# de estoque contra poucos livros (--livros-quentes), com --concorrencia
+# clientes simultâneos. A reposição soma --reposicao unidades com
+# `PATCH /api/stock/{id}` (--reposicao-via delta) ou lê o estoque e grava a
+# quantidade lida + --reposicao com `PUT` condicionado à versão lida,
+# relendo e tentando de novo em caso de 409 (--reposicao-via put).
+#
+# No fim, com o servidor parado, confere para cada livro:
+#
+#   estoque final = estoque inicial + reposições confirmadas
+#                   - (empréstimos em aberto no fim - em aberto no início)
+#
+# e que nenhum estoque ficou negativo. Reporta vazão, latência e a taxa de
+# falhas por "database is locked" de cada operação; termina com código 1 se
+# o invariante não valer.
+#
+#   python -m benchmarks.estoque_concorrente --workers 4 --concorrencia 200
+#   python -m benchmarks.estoque_concorrente --pesos 1 1 0   # sem reposição
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import socket
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+BANCO_ORIGEM = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    "..",
+    "database",
+    "biblioteca_amostra.db",
+)
+RAIZ = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+OPERACOES = ("emprestimo", "devolucao", "reposicao")
+
+
+def _porta_livre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _em_aberto(conexao, livros):
+    marcadores = ",".join("?" * len(livros))
+    return dict(
+        conexao.execute(
+            f"SELECT book_id, COUNT(*) FROM borrowals"
+            f" WHERE return_date IS NULL AND book_id IN ({marcadores})"
+            f" GROUP BY book_id",
+            livros,
+        ).fetchall()
+    )
+
+
+def preparar_banco(caminho, quantidade_livros, estoque_inicial):
+    """Escolhe os livros quentes e fixa o estoque inicial deles"""
+    with sqlite3.connect(caminho) as conexao:
+        livros = [
+            id
+            for (id,) in conexao.execute(
+                "SELECT book_id FROM stock JOIN books ON books.id = stock.book_id"
+                " ORDER BY book_id LIMIT ?",
+                (quantidade_livros,),
+            )
+        ]
+        conexao.executemany(
+            "UPDATE stock SET quantity = ? WHERE book_id = ?",
+            [(estoque_inicial, livro) for livro in livros],
+        )
+        usuarios = [
+            id for (id,) in conexao.execute("SELECT id FROM borrowers LIMIT 100")
+        ]
+        em_aberto = _em_aberto(conexao, livros)
+    conexao.close()
+    return livros, usuarios, em_aberto
+
+
+def conferir(caminho, livros, estoque_inicial, em_aberto_inicio, repostos):
+    """Estoque final de cada livro comparado com o esperado"""
+    with sqlite3.connect(caminho) as conexao:
+        estoque = dict(
+            conexao.execute(
+                f"SELECT book_id, quantity FROM stock"
+                f" WHERE book_id IN ({','.join('?' * len(livros))})",
+                livros,
+            ).fetchall()
+        )
+        em_aberto = _em_aberto(conexao, livros)
+    conexao.close()
+
+    resultado = {}
+    for livro in livros:
+        novos = em_aberto.get(livro, 0) - em_aberto_inicio.get(livro, 0)
+        esperado = estoque_inicial + repostos[livro] - novos
+        resultado[livro] = {
+            "estoque_final": estoque[livro],
+            "esperado": esperado,
+            "divergencia": estoque[livro] - esperado,
+            "emprestimos_abertos": novos,
+            "repostos": repostos[livro],
+        }
+    return resultado
+
+
+class Carga:
+    """Clientes concorrentes e a contagem dos resultados de cada operação"""
+
+    def __init__(self, cliente, livros, usuarios, args):
+        self.cliente = cliente
+        self.livros = livros
+        self.usuarios = usuarios
+        self.pesos = args.pesos
+        self.reposicao = args.reposicao
+        self.reposicao_via = args.reposicao_via
+        self.conflitos_versao = 0
+        self.rng = random.Random(args.semente)
+        self.abertos = []  # (id do empréstimo, livro) criados pela carga
+        self.repostos = {livro: 0 for livro in livros}
+        self.latencias = {operacao: [] for operacao in OPERACOES}
+        self.resultados = {
+            operacao: {"ok": 0, "sem_estoque": 0, "travado": 0, "outros_erros": 0}
+            for operacao in OPERACOES
+        }
+        self.exemplos_erros = []
+
+    def _contar(self, operacao, resposta, inicio):
+        self.latencias[operacao].append(time.perf_counter() - inicio)
+        contagem = self.resultados[operacao]
+        if resposta is not None and resposta.status_code < 400:
+            contagem["ok"] += 1
+            return True
+        texto = resposta.text if resposta is not None else ""
+        if "locked" in texto:
+            contagem["travado"] += 1
+        elif "Estoque insuficiente" in texto:
+            contagem["sem_estoque"] += 1
+        else:
+            contagem["outros_erros"] += 1
+            if len(self.exemplos_erros) < 5:
+                self.exemplos_erros.append(f"{operacao}: {texto[:200]}")
+        return False
+
+    async def _requisitar(self, metodo, url, **argumentos):
+        try:
+            return await self.cliente.request(metodo, url, **argumentos)
+        except httpx.HTTPError:
+            return None
+
+    async def emprestar(self):
+        livro = self.rng.choice(self.livros)
+        inicio = time.perf_counter()
+        resposta = await self._requisitar(
+            "POST",
+            "/api/emprestimos/",
+            json={
+                "book_id": livro,
+                "borrower_id": self.rng.choice(self.usuarios),
+                "borrow_date": "2025-01-01",
+            },
+        )
+        if self._contar("emprestimo", resposta, inicio):
+            self.abertos.append((resposta.json()["id"], livro))
+
+    async def devolver(self):
+        if not self.abertos:
+            return await self.emprestar()
+        emprestimo, livro = self.abertos.pop(self.rng.randrange(len(self.abertos)))
+        inicio = time.perf_counter()
+        resposta = await self._requisitar(
+            "PATCH",
+            f"/api/emprestimos/{emprestimo}",
+            json={"return_date": "2025-01-10"},
+        )
+        if not self._contar("devolucao", resposta, inicio):
+            self.abertos.append((emprestimo, livro))
+
+    async def repor(self):
+        livro = self.rng.choice(self.livros)
+        inicio = time.perf_counter()
+        if self.reposicao_via == "delta":
+            resposta = await self._requisitar(
+                "PATCH", f"/api/stock/{livro}", json={"delta": self.reposicao}
+            )
+        else:
+            resposta = await self._requisitar("GET", f"/api/stock/livro/{livro}")
+            while resposta is not None and resposta.status_code in (200, 409):
+                atual = resposta.json()
+                atual = atual["detail"] if resposta.status_code == 409 else atual
+                resposta = await self._requisitar(
+                    "PUT",
+                    f"/api/stock/{livro}",
+                    json={
+                        "quantity": atual["quantity"] + self.reposicao,
+                        "version": atual["version"],
+                    },
+                )
+                if resposta is None or resposta.status_code != 409:
+                    break
+                self.conflitos_versao += 1
+        if self._contar("reposicao", resposta, inicio):
+            self.repostos[livro] += self.reposicao
+
+    async def executar(self, concorrencia, duracao):
+        acoes = (self.emprestar, self.devolver, self.repor)
+        fim = time.perf_counter() + duracao
+
+        async def cliente_simulado():
+            while time.perf_counter() < fim:
+                await self.rng.choices(acoes, self.pesos)[0]()
+
+        inicio = time.perf_counter()
+        await asyncio.gather(*(cliente_simulado() for _ in range(concorrencia)))
+        return time.perf_counter() - inicio
+
+    def relatorio(self, decorrido):
+        operacoes = {}
+        for operacao in OPERACOES:
+            contagem = self.resultados[operacao]
+            total = sum(contagem.values())
+            if not total:
+                continue
+            latencias = self.latencias[operacao]
+            quantis = (
+                statistics.quantiles(latencias, n=100)
+                if len(latencias) > 1
+                else latencias * 99
+            )
+            operacoes[operacao] = {
+                "total": total,
+                **contagem,
+                "taxa_travado": round(contagem["travado"] / total, 4),
+                "por_s": round(total / decorrido, 1),
+                "p50_ms": round(quantis[49] * 1000, 3),
+                "p99_ms": round(quantis[98] * 1000, 3),
+            }
+        total = sum(item["total"] for item in operacoes.values())
+        return {
+            "operacoes_por_s": round(total / decorrido, 1),
+            "taxa_travado": round(
+                sum(item["travado"] for item in operacoes.values()) / max(total, 1), 4
+            ),
+            "operacoes": operacoes,
+            "conflitos_versao": self.conflitos_versao,
+            **({"exemplos_erros": self.exemplos_erros} if self.exemplos_erros else {}),
+        }
+
+
+async def _aguardar_servidor(url, processo, limite_s=60):
+    async with httpx.AsyncClient(base_url=url) as cliente:
+        fim = time.perf_counter() + limite_s
+        while time.perf_counter() < fim:
+            if processo.poll() is not None:
+                raise SystemExit("O servidor terminou durante a inicialização")
+            try:
+                if (await cliente.get("/")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise SystemExit("O servidor não respondeu a tempo")
+
+
+async def medir(url, processo, livros, usuarios, args):
+    await _aguardar_servidor(url, processo)
+    limites = httpx.Limits(max_connections=args.concorrencia)
+    async with httpx.AsyncClient(base_url=url, limits=limites, timeout=60) as cliente:
+        carga = Carga(cliente, livros, usuarios, args)
+        decorrido = await carga.executar(args.concorrencia, args.duracao)
+    return carga, decorrido
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Estoque sob concorrência")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--concorrencia", type=int, default=200)
+    parser.add_argument("--duracao", type=float, default=20.0)
+    parser.add_argument("--livros-quentes", type=int, default=3)
+    parser.add_argument("--estoque-inicial", type=int, default=50)
+    parser.add_argument("--reposicao", type=int, default=5, help="Unidades por PUT")
+    parser.add_argument("--reposicao-via", choices=("delta", "put"), default="delta")
+    parser.add_argument(
+        "--pesos",
+        type=float,
+        nargs=3,
+        default=[5, 4, 1],
+        metavar=("EMPRESTIMO", "DEVOLUCAO", "REPOSICAO"),
+        help="Proporção de cada operação",
+    )
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--banco", default=BANCO_ORIGEM, help="Banco copiado")
+    parser.add_argument("--saida", help="Arquivo JSON com o resultado")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as diretorio:
+        copia = os.path.join(diretorio, "estresse.db")
+        shutil.copy(args.banco, copia)
+        livros, usuarios, em_aberto = preparar_banco(
+            copia, args.livros_quentes, args.estoque_inicial
+        )
+
+        porta = _porta_livre()
+        ambiente = {
+            **os.environ,
+            "BIBLIOTECA_DB_PATH": copia,
+            "BUSCA_APROXIMADA": "0",
+            "METRICAS_DIR": os.path.join(diretorio, "metricas"),
+        }
+        processo = subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "uvicorn",
+                "app.main:app",
+                "--port",
+                str(porta),
+                "--workers",
+                str(args.workers),
+                "--log-level",
+                "warning",
+            ],
+            cwd=RAIZ,
+            env=ambiente,
+        )
+        try:
+            carga, decorrido = asyncio.run(
+                medir(f"http://127.0.0.1:{porta}", processo, livros, usuarios, args)
+            )
+        finally:
+            processo.terminate()
+            processo.wait(timeout=60)
+
+        livros_conferidos = conferir(
+            copia, livros, args.estoque_inicial, em_aberto, carga.repostos
+        )
+
+    invariante_ok = all(
+        item["divergencia"] == 0 and item["estoque_final"] >= 0
+        for item in livros_conferidos.values()
+    )
+    resultado = {
+        "workers": args.workers,
+        "concorrencia": args.concorrencia,
+        "duracao_s": round(decorrido, 3),
+        **carga.relatorio(decorrido),
+        "invariante_ok": invariante_ok,
+        "livros": livros_conferidos,
+    }
+    print(json.dumps(resultado, indent=2))
+    if args.saida:
+        with open(args.saida, "w") as arquivo:
+            json.dump(resultado, arquivo, indent=2)
+    if not invariante_ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
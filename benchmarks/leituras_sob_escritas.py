@@ -0,0 +1,207 @@
+## Latência das leituras durante uma tempestade de escritas
+#
+# Sobe a API no próprio processo (httpx + ASGITransport) sobre uma cópia do
+# banco e mede, por --duracao segundos cada, duas fases:
+#
+# - so_leituras: --leitores clientes fazendo GETs que não passam pelo cache
+#   (estoque de um livro e empréstimo por ID), com --pausa-ms entre uma
+#   leitura e a próxima;
+# - com_escritas: os mesmos leitores e, junto, --escritores clientes que só
+#   escrevem, sem pausa (os empréstimos e reposições de
+#   benchmarks/escritor_unico.py, contra poucos livros quentes).
+#
+# As leituras vão para o pool só de leitura (app/database.py): com WAL, elas
+# não esperam o lock de escrita nem uma conexão presa por um escritor, então
+# o p99 das leituras deve mudar pouco entre as fases (o que sobra é a CPU
+# que as escritas tomam do processo). Cada modo de escrita roda em um
+# subprocesso, porque app.database lê ESCRITA_COORDENADA na importação:
+#
+#   python -m benchmarks.leituras_sob_escritas --escritores 200 --duracao 10
+#   python -m benchmarks.leituras_sob_escritas --modos direto --saida l.json
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.escritor_unico import MODOS, escrever_uma_vez, preparar_banco
+from benchmarks.estoque_concorrente import BANCO_ORIGEM
+
+
+def ids_de_emprestimos(caminho, quantidade=1000):
+    with sqlite3.connect(caminho) as conexao:
+        ids = [
+            id
+            for (id,) in conexao.execute(
+                "SELECT id FROM borrowals ORDER BY id LIMIT ?", (quantidade,)
+            )
+        ]
+    conexao.close()
+    return ids
+
+
+def _resumo(latencias, erros, decorrido):
+    quantis = statistics.quantiles(latencias, n=100)
+    return {
+        "por_s": round(len(latencias) / decorrido, 1),
+        "erros": erros,
+        "p50_ms": round(quantis[49] * 1000, 3),
+        "p99_ms": round(quantis[98] * 1000, 3),
+        "max_ms": round(max(latencias) * 1000, 3),
+    }
+
+
+async def medir_fases(args):
+    # Importado aqui: o modo e o banco são lidos do ambiente na importação
+    from app.main import app
+
+    caminho = os.environ["BIBLIOTECA_DB_PATH"]
+    livros, usuarios = preparar_banco(caminho, args.livros_quentes)
+    emprestimos = ids_de_emprestimos(caminho)
+
+    async def leitor(api, semente, fim, medidas):
+        rng = random.Random(semente)
+        while time.perf_counter() < fim:
+            if rng.random() < 0.5:
+                url = f"/api/stock/livro/{rng.choice(livros)}"
+            else:
+                url = f"/api/emprestimos/{rng.choice(emprestimos)}"
+            inicio = time.perf_counter()
+            try:
+                resposta = await api.get(url)
+                falhou = resposta.status_code >= 400
+            except Exception:
+                falhou = True
+            medidas["latencias"].append(time.perf_counter() - inicio)
+            medidas["erros"] += falhou
+            await asyncio.sleep(args.pausa_ms / 1000)
+
+    async def escritor(api, semente, fim, medidas):
+        rng = random.Random(semente)
+        while time.perf_counter() < fim:
+            inicio = time.perf_counter()
+            erro = await escrever_uma_vez(api, rng, livros, usuarios)
+            medidas["latencias"].append(time.perf_counter() - inicio)
+            medidas["erros"] += erro is not None
+
+    async def fase(api, escritores):
+        leituras = {"latencias": [], "erros": 0}
+        escritas = {"latencias": [], "erros": 0}
+        inicio = time.perf_counter()
+        fim = inicio + args.duracao
+        await asyncio.gather(
+            *(
+                leitor(api, args.semente + i, fim, leituras)
+                for i in range(args.leitores)
+            ),
+            *(
+                escritor(api, args.semente + args.leitores + i, fim, escritas)
+                for i in range(escritores)
+            ),
+        )
+        decorrido = time.perf_counter() - inicio
+        resultado = {
+            "leituras": _resumo(leituras["latencias"], leituras["erros"], decorrido)
+        }
+        if escritores:
+            resultado["escritas"] = _resumo(
+                escritas["latencias"], escritas["erros"], decorrido
+            )
+        return resultado
+
+    await app.router.startup()
+    try:
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=60
+        ) as api:
+            return {
+                "so_leituras": await fase(api, 0),
+                "com_escritas": await fase(api, args.escritores),
+            }
+    finally:
+        await app.router.shutdown()
+
+
+def medir_modo(modo, args):
+    """Mede um modo em um subprocesso, sobre uma cópia nova do banco"""
+    print(f"== {modo}", file=sys.stderr, flush=True)
+    with tempfile.TemporaryDirectory() as diretorio:
+        saida = os.path.join(diretorio, "resultado.json")
+        comando = [
+            sys.executable,
+            "-m",
+            "benchmarks.leituras_sob_escritas",
+            "--banco",
+            args.banco,
+            "--executar",
+            modo,
+            "--saida",
+            saida,
+            "--leitores",
+            str(args.leitores),
+            "--pausa-ms",
+            str(args.pausa_ms),
+            "--escritores",
+            str(args.escritores),
+            "--duracao",
+            str(args.duracao),
+            "--livros-quentes",
+            str(args.livros_quentes),
+            "--semente",
+            str(args.semente),
+        ]
+        ambiente = {**os.environ, "ESCRITA_COORDENADA": MODOS[modo]}
+        subprocess.run(comando, check=True, stdout=subprocess.DEVNULL, env=ambiente)
+        with open(saida) as arquivo:
+            return json.load(arquivo)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Leituras durante muitas escritas")
+    parser.add_argument("--modos", nargs="+", choices=MODOS, default=list(MODOS))
+    parser.add_argument("--leitores", type=int, default=10)
+    parser.add_argument("--pausa-ms", type=float, default=20.0)
+    parser.add_argument("--escritores", type=int, default=200)
+    parser.add_argument("--duracao", type=float, default=10.0)
+    parser.add_argument("--livros-quentes", type=int, default=3)
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--banco", default=BANCO_ORIGEM, help="Banco copiado")
+    parser.add_argument("--saida", help="Arquivo JSON com o resultado")
+    # Uso interno: mede um modo no próprio processo (ver medir_modo)
+    parser.add_argument("--executar", choices=MODOS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.executar:
+        with tempfile.TemporaryDirectory() as diretorio:
+            copia = os.path.join(diretorio, "benchmark.db")
+            shutil.copy(args.banco, copia)
+            os.environ["BIBLIOTECA_DB_PATH"] = copia
+            resultado = asyncio.run(medir_fases(args))
+        with open(args.saida, "w") as arquivo:
+            json.dump(resultado, arquivo)
+        return
+
+    resultado = {
+        "leitores": args.leitores,
+        "escritores": args.escritores,
+        "duracao_s": args.duracao,
+        "modos": {modo: medir_modo(modo, args) for modo in args.modos},
+    }
+    print(json.dumps(resultado, indent=2, ensure_ascii=False))
+    if args.saida:
+        with open(args.saida, "w") as arquivo:
+            json.dump(resultado, arquivo, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,757 @@
+## Benchmark de latência de todas as rotas da API, em bancos de vários tamanhos
+#
+# Para cada escala em --escalas, gera o banco com scripts/gerar_dados.py (ou
+# reaproveita o que já está em --dados) e mede cada rota dos routers com a
+# API no próprio processo (httpx + ASGITransport) sobre uma cópia dele:
+# p50/p95/p99 e req/s com --concorrencia clientes. Cada escala roda em um
+# subprocesso, porque app.database lê BIBLIOTECA_DB_PATH na importação.
+#
+# Toda rota precisa de um cenário em CENARIOS: uma rota nova sem cenário
+# interrompe o benchmark. Cenários de escrita que consomem o próprio recurso
+# (DELETE, PUT de empréstimo...) criam os registros antes da medição.
+#
+#   python -m benchmarks.rotas --escalas 10k 100k --saida base.json
+#   python -m benchmarks.rotas --escalas 10k 100k --comparar base.json
+#
+# Com --comparar, termina com código 1 se o p95 de alguma rota piorar ou o
+# req/s cair mais que --tolerancia em relação à execução anterior (e também
+# se alguma requisição medida falhar).
+
+import argparse
+import asyncio
+import gc
+import json
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+DIRETORIO_DADOS = os.path.join(tempfile.gettempdir(), "biblioteca_benchmarks")
+ERROS_REPORTADOS = 5
+
+# "MÉTODO /rota" -> (montar, preparar)
+#   montar(amostra, i, preparado) -> (url, argumentos do httpx)
+#   preparar(cliente, amostra, i) -> valor passado a montar (fora da medição)
+CENARIOS = {}
+
+
+def cenario(rota, preparar=None):
+    def registrar(montar):
+        CENARIOS[rota] = (montar, preparar)
+        return montar
+
+    return registrar
+
+
+class Amostra:
+    """Ids e registros existentes no banco, usados em rodízio pelos cenários"""
+
+    def __init__(self, caminho, semente, tamanho=1000):
+        rng = random.Random(semente)
+
+        def sortear(sql):
+            linhas = conexao.execute(sql).fetchall()
+            return rng.sample(linhas, min(tamanho, len(linhas)))
+
+        with sqlite3.connect(caminho) as conexao:
+            # Estoque alto: nenhum empréstimo do benchmark é recusado
+            conexao.execute("UPDATE stock SET quantity = 1000000")
+            self.livros = sortear(
+                "SELECT id, title, author_id, publication_year, genre_id, image"
+                " FROM books JOIN stock ON stock.book_id = books.id"
+            )
+            self.autores = sortear("SELECT id, name, country FROM authors")
+            self.usuarios = sortear("SELECT id, name, email, phone FROM borrowers")
+            self.generos = [id for (id,) in sortear("SELECT id FROM genres")]
+            self.emprestimos = [id for (id,) in sortear("SELECT id FROM borrowals")]
+            self.historico = [
+                id for (id,) in sortear("SELECT id FROM borrowal_history")
+            ]
+            self.leitores = [
+                id for (id,) in sortear("SELECT DISTINCT borrower_id FROM borrowals")
+            ]
+            self.nomes_autores = [
+                nome
+                for (nome,) in sortear(
+                    "SELECT name FROM authors"
+                    " WHERE id IN (SELECT author_id FROM books)"
+                )
+            ]
+            ultimo_log = conexao.execute("SELECT MAX(timestamp) FROM logs").fetchone()
+            ultimo_historico = conexao.execute(
+                "SELECT MAX(date) FROM borrowal_history"
+            ).fetchone()
+
+        self.palavras = sorted(
+            {
+                palavra
+                for _, titulo, *_ in self.livros
+                for palavra in titulo.split()
+                if len(palavra) >= 4
+            }
+        )
+        rng.shuffle(self.palavras)
+        self.dia_logs = (ultimo_log[0] or "2025-01-01")[:10]
+        self.dia_historico = (ultimo_historico[0] or "2025-01-01")[:10]
+
+    @staticmethod
+    def item(lista, i):
+        return lista[i % len(lista)]
+
+    def livro(self, i):
+        return self.item(self.livros, i)
+
+    def corpo_livro(self, i, titulo=None):
+        _, title, author_id, ano, genre_id, image = self.livro(i)
+        return {
+            "title": titulo or title,
+            "author_id": author_id,
+            "publication_year": ano,
+            "genre_id": genre_id,
+            "image": image or "",
+        }
+
+    def corpo_emprestimo(self, i):
+        return {
+            "book_id": self.livro(i)[0],
+            "borrower_id": self.item(self.usuarios, i)[0],
+            "borrow_date": "2025-01-01",
+        }
+
+
+def _criando(url, corpo, chave="id"):
+    """preparar que cria um registro por requisição e devolve a sua chave"""
+
+    async def preparar(cliente, a, i):
+        resposta = await cliente.post(url, json=corpo(a, i))
+        resposta.raise_for_status()
+        return resposta.json()[chave]
+
+    return preparar
+
+
+def _csv(cabecalho, linhas):
+    texto = "\n".join([cabecalho, *(",".join(map(str, linha)) for linha in linhas)])
+    return {"content": texto.encode(), "headers": {"content-type": "text/csv"}}
+
+
+LINHAS_IMPORTACAO = 100
+
+# Autores
+
+
+@cenario("GET /api/autores/")
+def _(a, i, _p):
+    return "/api/autores/", {"params": {"limit": 100}}
+
+
+@cenario("GET /api/autores/quantidade-de-livros")
+def _(a, i, _p):
+    # Sem resumo a resposta traz todos os livros do catálogo
+    return "/api/autores/quantidade-de-livros", {"params": {"resumo": True}}
+
+
+@cenario("GET /api/autores/{autor_id}/quantidade-de-livros")
+def _(a, i, _p):
+    return f"/api/autores/{a.item(a.autores, i)[0]}/quantidade-de-livros", {}
+
+
+@cenario("GET /api/autores/{autor_id}")
+def _(a, i, _p):
+    return f"/api/autores/{a.item(a.autores, i)[0]}", {}
+
+
+@cenario("POST /api/autores/importar")
+def _(a, i, _p):
+    linhas = [(f"Autor Importado {i}-{j}", "Brasil") for j in range(LINHAS_IMPORTACAO)]
+    return "/api/autores/importar", _csv("name,country", linhas)
+
+
+@cenario("POST /api/autores/")
+def _(a, i, _p):
+    return "/api/autores/", {"json": {"name": f"Autor Novo {i}", "country": "Brasil"}}
+
+
+@cenario("PUT /api/autores/{autor_id}")
+def _(a, i, _p):
+    id, nome, pais = a.item(a.autores, i)
+    return f"/api/autores/{id}", {"json": {"name": nome, "country": pais or ""}}
+
+
+@cenario("PATCH /api/autores/{autor_id}")
+def _(a, i, _p):
+    id, _, pais = a.item(a.autores, i)
+    return f"/api/autores/{id}", {"json": {"country": pais or ""}}
+
+
+@cenario(
+    "DELETE /api/autores/{autor_id}",
+    preparar=_criando(
+        "/api/autores/", lambda a, i: {"name": f"Autor Excluído {i}", "country": "-"}
+    ),
+)
+def _(a, i, autor_id):
+    return f"/api/autores/{autor_id}", {}
+
+
+# Livros
+
+
+@cenario("GET /api/livros/")
+def _(a, i, _p):
+    return "/api/livros/", {"params": {"limit": 100}}
+
+
+@cenario("GET /api/livros/search")
+def _(a, i, _p):
+    return "/api/livros/search", {"params": {"q": a.item(a.palavras, i)}}
+
+
+@cenario("GET /api/livros/busca-aproximada")
+def _(a, i, _p):
+    palavra = a.item(a.palavras, i)
+    # Um erro de digitação: a penúltima letra trocada
+    return "/api/livros/busca-aproximada", {
+        "params": {"q": palavra[:-2] + "x" + palavra[-1]}
+    }
+
+
+@cenario("GET /api/livros/{livro_id}")
+def _(a, i, _p):
+    return f"/api/livros/{a.livro(i)[0]}", {}
+
+
+@cenario("POST /api/livros/importar")
+def _(a, i, _p):
+    linhas = [
+        (f"Livro Importado {i}-{j}", autor, ano, genero, "")
+        for j in range(LINHAS_IMPORTACAO)
+        for _, _, autor, ano, genero, _ in [a.livro(i + j)]
+    ]
+    return "/api/livros/importar", _csv(
+        "title,author_id,publication_year,genre_id,image", linhas
+    )
+
+
+@cenario("POST /api/livros/")
+def _(a, i, _p):
+    return "/api/livros/", {"json": a.corpo_livro(i, f"Livro Novo {i}")}
+
+
+@cenario("PUT /api/livros/{livro_id}")
+def _(a, i, _p):
+    return f"/api/livros/{a.livro(i)[0]}", {"json": a.corpo_livro(i)}
+
+
+@cenario("PATCH /api/livros/{livro_id}")
+def _(a, i, _p):
+    id, _, _, ano, _, image = a.livro(i)
+    return f"/api/livros/{id}", {"json": {"publication_year": ano, "image": image}}
+
+
+@cenario(
+    "DELETE /api/livros/{livro_id}",
+    preparar=_criando(
+        "/api/livros/", lambda a, i: a.corpo_livro(i, f"Livro Excluído {i}")
+    ),
+)
+def _(a, i, livro_id):
+    return f"/api/livros/{livro_id}", {}
+
+
+@cenario("GET /api/livros/autor/id/{autor_id}")
+def _(a, i, _p):
+    return f"/api/livros/autor/id/{a.livro(i)[2]}", {}
+
+
+@cenario("GET /api/livros/autor/nome/{nome}")
+def _(a, i, _p):
+    return f"/api/livros/autor/nome/{a.item(a.nomes_autores, i)}", {}
+
+
+# Usuários
+
+
+@cenario("GET /api/usuarios/")
+def _(a, i, _p):
+    return "/api/usuarios/", {"params": {"limit": 100}}
+
+
+@cenario("GET /api/usuarios/{usuario_id}")
+def _(a, i, _p):
+    return f"/api/usuarios/{a.item(a.usuarios, i)[0]}", {}
+
+
+@cenario("POST /api/usuarios/importar")
+def _(a, i, _p):
+    linhas = [
+        (f"Usuário Importado {j}", f"importado.{i}.{j}@exemplo.com", "")
+        for j in range(LINHAS_IMPORTACAO)
+    ]
+    return "/api/usuarios/importar", _csv("name,email,phone", linhas)
+
+
+@cenario("POST /api/usuarios/")
+def _(a, i, _p):
+    return "/api/usuarios/", {
+        "json": {"name": f"Usuário Novo {i}", "email": f"novo.{i}@exemplo.com"}
+    }
+
+
+@cenario("PUT /api/usuarios/{usuario_id}")
+def _(a, i, _p):
+    id, nome, email, telefone = a.item(a.usuarios, i)
+    return f"/api/usuarios/{id}", {
+        "json": {"name": nome, "email": email, "phone": telefone}
+    }
+
+
+@cenario("PATCH /api/usuarios/{usuario_id}")
+def _(a, i, _p):
+    id, _, _, telefone = a.item(a.usuarios, i)
+    return f"/api/usuarios/{id}", {"json": {"phone": telefone}}
+
+
+@cenario(
+    "DELETE /api/usuarios/{usuario_id}",
+    preparar=_criando(
+        "/api/usuarios/",
+        lambda a, i: {"name": f"Usuário {i}", "email": f"excluido.{i}@exemplo.com"},
+    ),
+)
+def _(a, i, usuario_id):
+    return f"/api/usuarios/{usuario_id}", {}
+
+
+# Empréstimos
+
+
+@cenario("POST /api/emprestimos/")
+def _(a, i, _p):
+    return "/api/emprestimos/", {"json": a.corpo_emprestimo(i)}
+
+
+@cenario("POST /api/emprestimos/batch")
+def _(a, i, _p):
+    return "/api/emprestimos/batch", {
+        "json": {
+            "borrower_id": a.item(a.usuarios, i)[0],
+            "book_ids": [a.livro(4 * i + j)[0] for j in range(4)],
+            "borrow_date": "2025-01-01",
+        }
+    }
+
+
+@cenario("GET /api/emprestimos/")
+def _(a, i, _p):
+    return "/api/emprestimos/", {"params": {"limit": 100}}
+
+
+@cenario("GET /api/emprestimos/{emprestimo_id}")
+def _(a, i, _p):
+    return f"/api/emprestimos/{a.item(a.emprestimos, i)}", {}
+
+
+_criando_emprestimo = _criando("/api/emprestimos/", Amostra.corpo_emprestimo)
+
+
+@cenario("PUT /api/emprestimos/{emprestimo_id}", preparar=_criando_emprestimo)
+def _(a, i, emprestimo_id):
+    corpo = {**a.corpo_emprestimo(i), "return_date": "2025-01-20"}
+    return f"/api/emprestimos/{emprestimo_id}", {"json": corpo}
+
+
+@cenario("PATCH /api/emprestimos/{emprestimo_id}", preparar=_criando_emprestimo)
+def _(a, i, emprestimo_id):
+    return f"/api/emprestimos/{emprestimo_id}", {"json": {"return_date": "2025-01-20"}}
+
+
+@cenario("DELETE /api/emprestimos/{emprestimo_id}", preparar=_criando_emprestimo)
+def _(a, i, emprestimo_id):
+    return f"/api/emprestimos/{emprestimo_id}", {}
+
+
+@cenario("GET /api/emprestimos/por-usuario/{usuario_id}")
+def _(a, i, _p):
+    return f"/api/emprestimos/por-usuario/{a.item(a.leitores, i)}", {}
+
+
+# Gêneros
+
+
+@cenario("POST /api/generos/")
+def _(a, i, _p):
+    return "/api/generos/", {"json": {"name": f"Gênero Novo {i}"}}
+
+
+@cenario("GET /api/generos/")
+def _(a, i, _p):
+    return "/api/generos/", {}
+
+
+@cenario("GET /api/generos/{genero_id}")
+def _(a, i, _p):
+    return f"/api/generos/{a.item(a.generos, i)}", {}
+
+
+_criando_genero = _criando("/api/generos/", lambda a, i: {"name": f"Gênero {i}"})
+
+
+@cenario("PUT /api/generos/{genero_id}", preparar=_criando_genero)
+def _(a, i, genero_id):
+    return f"/api/generos/{genero_id}", {"json": {"name": f"Gênero Renomeado {i}"}}
+
+
+@cenario("DELETE /api/generos/{genero_id}", preparar=_criando_genero)
+def _(a, i, genero_id):
+    return f"/api/generos/{genero_id}", {}
+
+
+@cenario("GET /api/generos/{genero_id}/livros")
+def _(a, i, _p):
+    return f"/api/generos/{a.item(a.generos, i)}/livros", {}
+
+
+# Estoque
+
+
+@cenario("GET /api/stock/")
+def _(a, i, _p):
+    return "/api/stock/", {"params": {"limit": 100}}
+
+
+@cenario("GET /api/stock/livro/{book_id}")
+def _(a, i, _p):
+    return f"/api/stock/livro/{a.livro(i)[0]}", {}
+
+
+@cenario("POST /api/stock/")
+def _(a, i, _p):
+    # Upsert: os livros gerados já têm estoque, que é substituído
+    return "/api/stock/", {"json": {"book_id": a.livro(i)[0], "quantity": 1_000_000}}
+
+
+async def _versao_do_estoque(cliente, a, i):
+    """preparar que lê a versão atual do estoque do livro (exigida pelo PUT)"""
+    resposta = await cliente.get(f"/api/stock/livro/{a.livro(i)[0]}")
+    resposta.raise_for_status()
+    return resposta.json()["version"]
+
+
+@cenario("PUT /api/stock/{book_id}", preparar=_versao_do_estoque)
+def _(a, i, versao):
+    return f"/api/stock/{a.livro(i)[0]}", {
+        "json": {"quantity": 1_000_000, "version": versao}
+    }
+
+
+@cenario("PATCH /api/stock/")
+def _(a, i, _p):
+    itens = [
+        {"book_id": a.livro(20 * i + j)[0], "delta": 1 if i % 2 else -1}
+        for j in range(20)
+    ]
+    return "/api/stock/", {"json": {"itens": itens}}
+
+
+@cenario("PATCH /api/stock/{book_id}")
+def _(a, i, _p):
+    return f"/api/stock/{a.livro(i)[0]}", {"json": {"delta": 1 if i % 2 else -1}}
+
+
+# Histórico e logs
+
+
+@cenario("GET /api/borrowal-history/")
+def _(a, i, _p):
+    return "/api/borrowal-history/", {"params": {"limit": 100}}
+
+
+@cenario("GET /api/borrowal-history/export")
+def _(a, i, _p):
+    dia = a.dia_historico
+    return "/api/borrowal-history/export", {"params": {"from": dia, "to": dia}}
+
+
+@cenario("GET /api/borrowal-history/{history_id}")
+def _(a, i, _p):
+    return f"/api/borrowal-history/{a.item(a.historico, i)}", {}
+
+
+@cenario("GET /api/borrowal-history/book/{book_id}")
+def _(a, i, _p):
+    return f"/api/borrowal-history/book/{a.livro(i)[0]}", {}
+
+
+@cenario("GET /api/borrowal-history/user/{user_id}")
+def _(a, i, _p):
+    return f"/api/borrowal-history/user/{a.item(a.leitores, i)}", {}
+
+
+@cenario("GET /api/logs/")
+def _(a, i, _p):
+    return "/api/logs/", {"params": {"action": "RETURN", "limit": 100}}
+
+
+@cenario("GET /api/logs/export")
+def _(a, i, _p):
+    dia = a.dia_logs
+    return "/api/logs/export", {"params": {"from": dia, "to": f"{dia}T23:59:59"}}
+
+
+@cenario("GET /api/logs/resumo")
+def _(a, i, _p):
+    return "/api/logs/resumo", {"params": {"action": "BORROW"}}
+
+
+def rotas_da_api(app):
+    """ "MÉTODO /rota" de cada rota dos routers"""
+    return sorted(
+        f"{metodo} {rota.path}"
+        for rota in app.routes
+        if rota.path.startswith("/api/")
+        for metodo in rota.methods
+    )
+
+
+def _quantis(latencias):
+    quantis = statistics.quantiles(latencias, n=100) if len(latencias) > 1 else None
+    if quantis is None:
+        quantis = [latencias[0] if latencias else 0.0] * 99
+    return {
+        "p50_ms": round(quantis[49] * 1000, 3),
+        "p95_ms": round(quantis[94] * 1000, 3),
+        "p99_ms": round(quantis[98] * 1000, 3),
+    }
+
+
+async def medir_rota(cliente, rota, amostra, args):
+    metodo, _ = rota.split(" ", 1)
+    montar, preparar = CENARIOS[rota]
+    total = args.aquecimento + args.requisicoes
+
+    preparados = [
+        await preparar(cliente, amostra, i) if preparar else None for i in range(total)
+    ]
+    pedidos = [montar(amostra, i, preparados[i]) for i in range(total)]
+    for url, argumentos in pedidos[: args.aquecimento]:
+        await cliente.request(metodo, url, **argumentos)
+
+    latencias, erros = [], []
+    pendentes = iter(pedidos[args.aquecimento :])
+
+    async def cliente_simulado():
+        for url, argumentos in pendentes:
+            inicio = time.perf_counter()
+            resposta = await cliente.request(metodo, url, **argumentos)
+            latencias.append(time.perf_counter() - inicio)
+            if resposta.status_code >= 400:
+                erros.append(f"{resposta.status_code} {url}: {resposta.text[:200]}")
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(cliente_simulado() for _ in range(args.concorrencia)))
+    decorrido = time.perf_counter() - inicio
+
+    return {
+        **_quantis(latencias),
+        "req_por_s": round(len(latencias) / decorrido, 1),
+        "erros": len(erros),
+        **({"exemplos_erros": erros[:ERROS_REPORTADOS]} if erros else {}),
+    }
+
+
+async def medir_banco(args):
+    # Importado aqui: app.database lê BIBLIOTECA_DB_PATH na importação
+    from app.main import app
+
+    rotas = rotas_da_api(app)
+    sem_cenario = [rota for rota in rotas if rota not in CENARIOS]
+    if sem_cenario:
+        raise SystemExit(f"Rotas sem cenário em benchmarks/rotas.py: {sem_cenario}")
+    if args.filtro:
+        rotas = [rota for rota in rotas if args.filtro in rota]
+
+    amostra = Amostra(os.environ["BIBLIOTECA_DB_PATH"], args.semente)
+    resultado = {}
+    await app.router.startup()
+    try:
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=60
+        ) as cliente:
+            # Objetos da inicialização (índices em memória) fora das coletas
+            # do GC, para que as pausas não dependam da ordem das rotas
+            gc.collect()
+            gc.freeze()
+            for rota in rotas:
+                gc.collect()
+                resultado[rota] = await medir_rota(cliente, rota, amostra, args)
+                print(_linha(rota, resultado[rota]), file=sys.stderr, flush=True)
+    finally:
+        # Sem isso as threads do aiosqlite mantêm o processo vivo
+        await app.router.shutdown()
+    return resultado
+
+
+def _linha(rota, medida):
+    return (
+        f"{rota:<58} p50 {medida['p50_ms']:>9.2f}  p95 {medida['p95_ms']:>9.2f}"
+        f"  p99 {medida['p99_ms']:>9.2f} ms  {medida['req_por_s']:>8.1f} req/s"
+        + (f"  {medida['erros']} erros" if medida["erros"] else "")
+    )
+
+
+def banco_da_escala(escala, args):
+    """Banco gerado para a escala, criado em --dados na primeira vez"""
+    caminho = os.path.join(args.dados, f"biblioteca_{escala}_s{args.semente}.db")
+    if not os.path.exists(caminho):
+        os.makedirs(args.dados, exist_ok=True)
+        print(f"Gerando {caminho}...", file=sys.stderr, flush=True)
+        subprocess.run(
+            [
+                sys.executable,
+                "-m",
+                "scripts.gerar_dados",
+                "--livros",
+                escala,
+                "--semente",
+                str(args.semente),
+                "--saida",
+                caminho,
+            ],
+            check=True,
+            stdout=subprocess.DEVNULL,
+        )
+    return caminho
+
+
+def medir_escala(escala, args):
+    """Mede um banco em um subprocesso (um engine por processo)"""
+    print(f"== {escala}", file=sys.stderr, flush=True)
+    with tempfile.TemporaryDirectory() as diretorio:
+        saida = os.path.join(diretorio, "resultado.json")
+        comando = [
+            sys.executable,
+            "-m",
+            "benchmarks.rotas",
+            "--banco",
+            banco_da_escala(escala, args),
+            "--saida",
+            saida,
+            "--requisicoes",
+            str(args.requisicoes),
+            "--aquecimento",
+            str(args.aquecimento),
+            "--concorrencia",
+            str(args.concorrencia),
+            "--semente",
+            str(args.semente),
+        ]
+        if args.filtro:
+            comando += ["--filtro", args.filtro]
+        subprocess.run(comando, check=True, stdout=subprocess.DEVNULL)
+        with open(saida) as arquivo:
+            # Uma única escala, identificada pelo nome do arquivo
+            (rotas,) = json.load(arquivo)["escalas"].values()
+        return rotas
+
+
+def comparar(atual, anterior, tolerancia, folga_ms):
+    """Regressões de p95 e req/s acima da tolerância, por escala e rota"""
+    regressoes = []
+    for escala, rotas in atual.items():
+        for rota, medida in rotas.items():
+            base = anterior.get(escala, {}).get(rota)
+            if base is None:
+                continue
+            if (
+                medida["p95_ms"] > base["p95_ms"] * (1 + tolerancia)
+                and medida["p95_ms"] - base["p95_ms"] > folga_ms
+            ):
+                regressoes.append(
+                    f"[{escala}] {rota}: p95 {base['p95_ms']} -> {medida['p95_ms']} ms"
+                )
+            if medida["req_por_s"] < base["req_por_s"] / (1 + tolerancia):
+                regressoes.append(
+                    f"[{escala}] {rota}: req/s {base['req_por_s']}"
+                    f" -> {medida['req_por_s']}"
+                )
+    return regressoes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latência por rota da API")
+    parser.add_argument(
+        "--escalas", nargs="+", default=["10k"], help="Livros por banco (ex.: 10k 1m)"
+    )
+    parser.add_argument("--banco", help="Mede só este banco (no próprio processo)")
+    parser.add_argument("--dados", default=DIRETORIO_DADOS, help="Bancos gerados")
+    parser.add_argument("--requisicoes", type=int, default=200, help="Por rota")
+    parser.add_argument("--aquecimento", type=int, default=10)
+    parser.add_argument("--concorrencia", type=int, default=4)
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--filtro", help="Só as rotas que contêm este texto")
+    parser.add_argument("--saida", help="Arquivo JSON com o resultado")
+    parser.add_argument("--comparar", help="JSON de uma execução anterior")
+    parser.add_argument(
+        "--tolerancia",
+        type=float,
+        default=0.2,
+        help="Piora relativa aceita no p95 e no req/s (0.2 = 20%%)",
+    )
+    parser.add_argument(
+        "--folga-ms",
+        type=float,
+        default=1.0,
+        help="Piora absoluta do p95 ignorada (ruído em rotas muito rápidas)",
+    )
+    args = parser.parse_args()
+
+    if args.banco:
+        with tempfile.TemporaryDirectory() as diretorio:
+            copia = os.path.join(diretorio, "benchmark.db")
+            shutil.copy(args.banco, copia)
+            os.environ["BIBLIOTECA_DB_PATH"] = copia
+            escalas = {
+                os.path.splitext(os.path.basename(args.banco))[0]: asyncio.run(
+                    medir_banco(args)
+                )
+            }
+    else:
+        escalas = {escala: medir_escala(escala, args) for escala in args.escalas}
+
+    resultado = {
+        "requisicoes": args.requisicoes,
+        "concorrencia": args.concorrencia,
+        "semente": args.semente,
+        "escalas": escalas,
+    }
+    if args.saida:
+        with open(args.saida, "w") as arquivo:
+            json.dump(resultado, arquivo, indent=2, ensure_ascii=False)
+
+    falhas = [
+        f"[{escala}] {rota}: {medida['erros']} erros"
+        for escala, rotas in escalas.items()
+        for rota, medida in rotas.items()
+        if medida["erros"]
+    ]
+    if args.comparar:
+        with open(args.comparar) as arquivo:
+            anterior = json.load(arquivo)["escalas"]
+        falhas += comparar(escalas, anterior, args.tolerancia, args.folga_ms)
+
+    for falha in falhas:
+        print(f"❌ {falha}", file=sys.stderr)
+    if falhas:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+## Benchmark de vazão (requisições/s) contra uma instância da API em execução
+#
+# Mede req/s com concorrência fixa para comparar versões do código, por
+# exemplo antes e depois da camada assíncrona:
+#
+#   git checkout <commit-antigo> && uvicorn app.main:app --port 8000
+#   python -m benchmarks.vazao_http --url http://127.0.0.1:8000 --saida antes.json
+#
+#   git checkout <commit-novo> && uvicorn app.main:app --port 8000
+#   python -m benchmarks.vazao_http --url http://127.0.0.1:8000 \
+#       --saida depois.json --comparar antes.json
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import httpx
+
+ROTAS_PADRAO = [
+    "/api/livros/1",
+    "/api/autores/1",
+    "/api/usuarios/1",
+    "/api/generos/",
+    "/api/stock/livro/1",
+    "/api/emprestimos/1",
+    "/api/logs/",
+]
+
+
+async def _cliente(cliente, rotas, fim, latencias, erros, deslocamento):
+    i = deslocamento
+    while time.perf_counter() < fim:
+        rota = rotas[i % len(rotas)]
+        i += 1
+        inicio = time.perf_counter()
+        try:
+            resposta = await cliente.get(rota)
+            if resposta.status_code >= 500:
+                erros.append(rota)
+        except httpx.HTTPError:
+            erros.append(rota)
+            continue
+        latencias.append(time.perf_counter() - inicio)
+
+
+async def medir(url, rotas, concorrencia, duracao, aquecimento):
+    limites = httpx.Limits(max_connections=concorrencia)
+    async with httpx.AsyncClient(base_url=url, limits=limites, timeout=30) as cliente:
+        # Aquecimento: conexões abertas e caches do SQLite carregados
+        fim = time.perf_counter() + aquecimento
+        await asyncio.gather(
+            *(_cliente(cliente, rotas, fim, [], [], i) for i in range(concorrencia))
+        )
+
+        latencias, erros = [], []
+        inicio = time.perf_counter()
+        fim = inicio + duracao
+        await asyncio.gather(
+            *(
+                _cliente(cliente, rotas, fim, latencias, erros, i)
+                for i in range(concorrencia)
+            )
+        )
+        decorrido = time.perf_counter() - inicio
+
+    latencias.sort()
+    quantis = statistics.quantiles(latencias, n=100) if len(latencias) > 1 else [0] * 99
+    return {
+        "url": url,
+        "concorrencia": concorrencia,
+        "duracao_s": round(decorrido, 3),
+        "requisicoes": len(latencias),
+        "erros": len(erros),
+        "req_por_s": round(len(latencias) / decorrido, 1),
+        "p50_ms": round(quantis[49] * 1000, 3),
+        "p99_ms": round(quantis[98] * 1000, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Vazão HTTP da Biblioteca API")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--concorrencia", type=int, default=64)
+    parser.add_argument("--duracao", type=float, default=15.0)
+    parser.add_argument("--aquecimento", type=float, default=2.0)
+    parser.add_argument("--rota", action="append", dest="rotas")
+    parser.add_argument("--saida", help="Arquivo JSON com o resultado")
+    parser.add_argument("--comparar", help="JSON de uma execução anterior")
+    args = parser.parse_args()
+
+    resultado = asyncio.run(
+        medir(
+            args.url,
+            args.rotas or ROTAS_PADRAO,
+            args.concorrencia,
+            args.duracao,
+            args.aquecimento,
+        )
+    )
+    print(json.dumps(resultado, indent=2))
+
+    if args.saida:
+        with open(args.saida, "w") as arquivo:
+            json.dump(resultado, arquivo, indent=2)
+
+    if args.comparar:
+        with open(args.comparar) as arquivo:
+            anterior = json.load(arquivo)
+        ganho = resultado["req_por_s"] / anterior["req_por_s"]
+        print(
+            f"req/s: {anterior['req_por_s']} -> {resultado['req_por_s']} "
+            f"({ganho:.2f}x) com concorrência {args.concorrencia}"
+        )
+
+
+if __name__ == "__main__":
+    main()
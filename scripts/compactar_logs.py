@@ -0,0 +1,38 @@
+## Compacta os logs antigos em totais por dia e ação (log_daily_summary)
+#
+#   python -m scripts.compactar_logs --dias 90
+#   BIBLIOTECA_DB_PATH=/caminho/outro.db python -m scripts.compactar_logs --dias 30 --lote 2000
+#
+# Pode rodar com a API no ar: cada lote é uma transação curta (ver
+# app/retencao_logs.py). Com LOG_RETENCAO_DIAS definida, a própria API
+# faz isso periodicamente.
+
+import argparse
+import asyncio
+import json
+
+from app.database import fechar_banco, logger, preparar_banco
+from app.retencao_logs import LOG_RETENCAO_LOTE, compactar_logs
+
+
+async def main(args):
+    await preparar_banco()
+    try:
+        relatorio = await compactar_logs(args.dias, args.lote)
+    finally:
+        await fechar_banco()
+
+    logger.info(
+        f"🧹 {relatorio['apagadas']} logs anteriores a {relatorio['limite']} "
+        f"compactados em {relatorio['lotes']} lotes ({relatorio['duracao_s']}s)"
+    )
+    print(json.dumps(relatorio, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Retenção de logs")
+    parser.add_argument(
+        "--dias", type=int, required=True, help="Dias de logs mantidos por inteiro"
+    )
+    parser.add_argument("--lote", type=int, default=LOG_RETENCAO_LOTE)
+    asyncio.run(main(parser.parse_args()))
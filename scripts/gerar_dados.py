@@ -0,0 +1,492 @@
+## Gera um banco sintético, com o mesmo esquema e triggers, em escala
+#
+#   python -m scripts.gerar_dados --livros 10k --saida /tmp/biblioteca_10k.db
+#   python -m scripts.gerar_dados --livros 1m --semente 7 --saida /tmp/b1m.db
+#   python -m scripts.gerar_dados --livros 10m --emprestimos 5m --saida /tmp/b10m.db
+#
+# O esquema vem de database/sqlite_script.txt mais as migrações da API, e as
+# linhas de exemplo do script são mantidas (autores, gêneros, livros e
+# usuários; os empréstimos de exemplo são descartados). Os dados gerados
+# dependem só da semente e dos parâmetros, para que benchmarks possam ser
+# repetidos sobre o mesmo banco.
+#
+# Empréstimos e devoluções são simulados dia a dia: a procura por livros e
+# por usuários segue uma lei de potência (poucos títulos concentram a maior
+# parte dos empréstimos), cada livro tem um número de exemplares e só é
+# emprestado se houver um disponível, e a duração segue uma lognormal em
+# torno de duas semanas, com atrasos e alguns livros nunca devolvidos. O
+# histórico, os logs e o estoque final são gravados como os triggers os
+# gravariam, então o banco fica consistente.
+#
+# A carga usa INSERTs em lote com os triggers e índices removidos; no fim os
+# índices e as tabelas derivadas (total por autor, índice de busca) são
+# reconstruídos e os triggers recriados.
+
+import argparse
+import heapq
+import json
+import math
+import os
+import random
+import time
+import unicodedata
+from array import array
+from datetime import date, timedelta
+
+from sqlalchemy import create_engine
+
+from app.busca import reconstruir_indice_busca
+from app.database import DATABASE_DIR, logger
+from app.migracoes import aplicar_migracoes
+
+SCRIPT_ESQUEMA = os.path.join(DATABASE_DIR, "sqlite_script.txt")
+TAMANHO_LOTE = 100_000
+DATA_CADASTRO = "2020-01-01 00:00:00"
+
+PRENOMES = (
+    "Ana Beatriz Bruno Camila Carlos Cecília Daniel Débora Eduardo Elisa "
+    "Fábio Fernanda Gabriel Giovana Gustavo Helena Henrique Igor Isabela "
+    "João Júlia Laura Leonardo Letícia Lucas Luísa Marcelo Mariana Mateus "
+    "Miguel Natália Otávio Paula Pedro Rafael Renata Ricardo Rita Rodrigo "
+    "Sara Sérgio Sofia Tiago Valéria Vinícius Yara Alice Arthur Bernardo "
+    "Clara Davi Heitor Lívia Lorena Manuela Nicolas Olívia Samuel Teresa"
+).split()
+SOBRENOMES = (
+    "Almeida Alves Andrade Araújo Barbosa Barros Batista Cardoso Carvalho "
+    "Castro Cavalcanti Correia Costa Cunha Dias Duarte Farias Ferreira "
+    "Freitas Gomes Lima Lopes Machado Martins Melo Mendes Monteiro Moraes "
+    "Moreira Nascimento Nogueira Oliveira Pereira Pinto Ramos Reis Ribeiro "
+    "Rocha Rodrigues Santos Silva Soares Sousa Teixeira Vieira Xavier "
+    "Azevedo Brandão Campos Fonseca Guimarães Leite Macedo Pacheco Queiroz "
+    "Rezende Sampaio Tavares Vasconcelos"
+).split()
+PAISES = (
+    "Brasil Brasil Brasil Portugal Angola Moçambique Argentina Chile "
+    "Colômbia México Espanha França Itália Alemanha Irlanda Japão Nigéria"
+).split() + ["Estados Unidos", "Reino Unido", "Cabo Verde"]
+GENEROS = (
+    "Aventura",
+    "Biografia",
+    "Conto",
+    "Crônica",
+    "Distopia",
+    "Drama",
+    "Ensaio",
+    "Fábula",
+    "Filosofia",
+    "História",
+    "Humor",
+    "Infantil",
+    "Juvenil",
+    "Poesia",
+    "Policial",
+    "Suspense",
+    "Teatro",
+    "Thriller",
+    "Romance Histórico",
+    "Autoajuda",
+)
+SUBSTANTIVOS = (
+    "Amor Casa Cidade Noite Mar Rio Sombra Guerra Jardim Menino Menina "
+    "Memória Viagem Segredo Ilha Estrela Cavaleiro Relógio Espelho Carta "
+    "Montanha Floresta Deserto Sertão Inverno Verão Silêncio Tempo Sonho "
+    "Caminho Porta Janela Lua Sol Vento Chuva Fogo Pedra Livro Castelo "
+    "Navio Trem Estrada Ponte Torre Rainha Rei Príncipe Feiticeira Lobo "
+    "Coração Destino Herança Promessa Labirinto Abismo Farol Oráculo"
+).split()
+ADJETIVOS = (
+    "Perdido Esquecido Secreto Eterno Último Primeiro Escuro Dourado "
+    "Silencioso Proibido Distante Antigo Invisível Selvagem Quebrado "
+    "Infinito Sagrado Estranho Vazio Vermelho Azul Branco Negro Oculto "
+    "Impossível Breve Longo Imperfeito Inquieto Sereno"
+).split()
+LUGARES = (
+    "Lisboa Recife Salvador Manaus Belém Olinda Paraty Porto Coimbra Luanda "
+    "Maputo Santiago Sevilha Veneza Praga"
+).split() + ["Ouro Preto", "Buenos Aires"]
+
+# Fator de procura por dia da semana (segunda = 0)
+PROCURA_SEMANAL = (1.1, 1.1, 1.05, 1.05, 1.0, 0.45, 0.25)
+
+
+def quantidade(texto: str) -> int:
+    """Aceita 10000, 10k, 1m, 10M"""
+    texto = texto.strip().lower().replace("_", "")
+    multiplicador = {"k": 1_000, "m": 1_000_000}.get(texto[-1:], 1)
+    if multiplicador > 1:
+        texto = texto[:-1]
+    return int(float(texto) * multiplicador)
+
+
+def _ascii(texto):
+    return (
+        unicodedata.normalize("NFKD", texto).encode("ascii", "ignore").decode().lower()
+    )
+
+
+def _titulo(rng):
+    modelo = rng.random()
+    substantivo = rng.choice(SUBSTANTIVOS)
+    if modelo < 0.35:
+        titulo = f"{substantivo} {rng.choice(ADJETIVOS)}"
+    elif modelo < 0.6:
+        titulo = f"{substantivo} de {rng.choice(SUBSTANTIVOS)}"
+    elif modelo < 0.8:
+        titulo = f"{substantivo} em {rng.choice(LUGARES)}"
+    else:
+        titulo = f"{substantivo} {rng.choice(ADJETIVOS)} de {rng.choice(LUGARES)}"
+    if rng.random() < 0.1:
+        titulo += f", Volume {rng.randint(2, 7)}"
+    return titulo
+
+
+def _nome(rng):
+    return f"{rng.choice(PRENOMES)} {rng.choice(SOBRENOMES)} {rng.choice(SOBRENOMES)}"
+
+
+def _horario(dia, evento, eventos):
+    """Timestamp do evento: horários crescentes das 8h às 20h, na ordem do dia"""
+    segundos = 8 * 3600 + evento * 12 * 3600 // (eventos + 1)
+    return f"{dia.isoformat()} {segundos // 3600:02d}:{segundos // 60 % 60:02d}:{segundos % 60:02d}"
+
+
+def _passo_permutacao(total):
+    """Passo coprimo com `total`: i -> i * passo % total embaralha os índices"""
+    passo = max(int(total * 0.6180339887), 1)
+    while math.gcd(passo, total) != 1:
+        passo += 1
+    return passo
+
+
+class Gerador:
+    def __init__(self, conexao, args):
+        self.conexao = conexao
+        self.args = args
+        self.rng = random.Random(args.semente)
+        self.contagem = {}
+
+    def inserir(self, tabela, colunas, linhas):
+        if not linhas:
+            return
+        marcadores = ", ".join("?" * len(colunas))
+        self.conexao.exec_driver_sql(
+            f"INSERT INTO {tabela} ({', '.join(colunas)}) VALUES ({marcadores})",
+            linhas,
+        )
+        self.contagem[tabela] = self.contagem.get(tabela, 0) + len(linhas)
+        linhas.clear()
+
+    def _maior_id(self, tabela):
+        return self.conexao.exec_driver_sql(
+            f"SELECT COALESCE(MAX(id), 0) FROM {tabela}"
+        ).scalar()
+
+    def catalogo(self):
+        rng, args = self.rng, self.args
+
+        existentes = {
+            nome for (nome,) in self.conexao.exec_driver_sql("SELECT name FROM genres")
+        }
+        self.inserir(
+            "genres", ("name",), [(nome,) for nome in GENEROS if nome not in existentes]
+        )
+        generos = self._maior_id("genres")
+
+        linhas = []
+        for _ in range(args.autores):
+            linhas.append((_nome(rng), rng.choice(PAISES), DATA_CADASTRO))
+            if len(linhas) >= TAMANHO_LOTE:
+                self.inserir("authors", ("name", "country", "created_at"), linhas)
+        self.inserir("authors", ("name", "country", "created_at"), linhas)
+        autores = self._maior_id("authors")
+
+        colunas = ("title", "author_id", "genre_id", "publication_year")
+        for _ in range(args.livros):
+            # Autores mais prolíficos: índice com viés para o começo
+            autor = 1 + int(autores * rng.random() ** 1.5)
+            ano = min(int(rng.triangular(1850, 2025, 2015)), 2025)
+            linhas.append((_titulo(rng), autor, rng.randint(1, generos), ano))
+            if len(linhas) >= TAMANHO_LOTE:
+                self.inserir("books", colunas, linhas)
+        self.inserir("books", colunas, linhas)
+
+        colunas = ("name", "email", "phone", "created_at")
+        inicio = self._maior_id("borrowers") + 1
+        for id in range(inicio, inicio + args.usuarios):
+            nome = _nome(rng)
+            prenome, sobrenome = _ascii(nome).split()[::2]
+            linhas.append(
+                (
+                    nome,
+                    f"{prenome}.{sobrenome}.{id}@exemplo.com",
+                    f"+55 {rng.randint(11, 99)} 9{rng.randint(1000, 9999)}-"
+                    f"{rng.randint(1000, 9999)}",
+                    DATA_CADASTRO,
+                )
+            )
+            if len(linhas) >= TAMANHO_LOTE:
+                self.inserir("borrowers", colunas, linhas)
+        self.inserir("borrowers", colunas, linhas)
+
+    def emprestimos(self):
+        """Simula os empréstimos dia a dia e grava estoque, histórico e logs"""
+        rng, args = self.rng, self.args
+        livros = self._maior_id("books")
+        usuarios = self._maior_id("borrowers")
+        passo_livros = _passo_permutacao(livros)
+        passo_usuarios = _passo_permutacao(usuarios)
+
+        # Exemplares por livro: os mais procurados (posição baixa na
+        # popularidade) têm mais cópias
+        disponiveis = array("i", bytes(4 * livros))
+        for posicao in range(livros):
+            copias = 1 + rng.randrange(3)
+            if posicao < livros * 0.01:
+                copias += 6
+            elif posicao < livros * 0.1:
+                copias += 2
+            disponiveis[posicao * passo_livros % livros] = copias
+
+        inicio = args.ate - timedelta(days=args.dias - 1)
+        pesos = [
+            PROCURA_SEMANAL[(inicio + timedelta(d)).weekday()] for d in range(args.dias)
+        ]
+        por_dia = args.emprestimos / sum(pesos)
+
+        emprestimos, historico, logs = [], [], []
+        # (dia da devolução, livro, usuário, dias de atraso)
+        devolucoes = []
+        acumulado = 0.0
+        recusados = 0
+        em_aberto = 0
+
+        for d in range(args.dias):
+            dia = inicio + timedelta(days=d)
+            ordinal = dia.toordinal()
+            acumulado += por_dia * pesos[d]
+            novos = int(acumulado)
+            acumulado -= novos
+
+            devolvidos = []
+            while devolucoes and devolucoes[0][0] <= ordinal:
+                devolvidos.append(heapq.heappop(devolucoes))
+
+            eventos = len(devolvidos) + novos
+
+            for i, (_, livro, usuario, atraso) in enumerate(devolvidos):
+                disponiveis[livro - 1] += 1
+                historico.append((livro, usuario, "returned", dia.isoformat()))
+                logs.append(
+                    (
+                        "RETURN",
+                        f"Livro ID {livro} | Usuário ID {usuario} | Atraso: {atraso} dias",
+                        _horario(dia, i, eventos),
+                    )
+                )
+
+            for i in range(len(devolvidos), eventos):
+                for _ in range(5):
+                    posicao = int(livros * rng.random() ** args.assimetria)
+                    indice = posicao * passo_livros % livros
+                    if disponiveis[indice] > 0:
+                        break
+                else:
+                    recusados += 1
+                    continue
+                disponiveis[indice] -= 1
+                livro = indice + 1
+                usuario = (
+                    1 + int(usuarios * rng.random() ** 2) * passo_usuarios % usuarios
+                )
+
+                duracao = min(max(int(rng.lognormvariate(math.log(14), 0.6)), 1), 180)
+                devolucao = dia + timedelta(days=duracao)
+                perdido = rng.random() < args.perdidos
+                if perdido or devolucao > args.ate:
+                    devolucao = None
+                    em_aberto += 1
+                else:
+                    heapq.heappush(
+                        devolucoes,
+                        (devolucao.toordinal(), livro, usuario, max(duracao - 30, 0)),
+                    )
+
+                emprestimos.append(
+                    (
+                        livro,
+                        usuario,
+                        dia.isoformat(),
+                        devolucao.isoformat() if devolucao else None,
+                    )
+                )
+                historico.append((livro, usuario, "borrowed", dia.isoformat()))
+                logs.append(
+                    (
+                        "BORROW",
+                        f"Livro ID {livro} | Usuário ID {usuario} | Devolução: Pendente",
+                        _horario(dia, i, eventos),
+                    )
+                )
+
+            if len(logs) >= TAMANHO_LOTE:
+                self._gravar_eventos(emprestimos, historico, logs)
+        self._gravar_eventos(emprestimos, historico, logs)
+
+        # Estoque: exemplares ainda disponíveis no fim da simulação
+        linhas = []
+        for indice, copias in enumerate(disponiveis):
+            linhas.append((indice + 1, copias))
+            if len(linhas) >= TAMANHO_LOTE:
+                self.inserir("stock", ("book_id", "quantity"), linhas)
+        self.inserir("stock", ("book_id", "quantity"), linhas)
+        self.contagem["emprestimos_recusados"] = recusados
+        self.contagem["emprestimos_em_aberto"] = em_aberto
+
+    def _gravar_eventos(self, emprestimos, historico, logs):
+        self.inserir(
+            "borrowals",
+            ("book_id", "borrower_id", "borrow_date", "return_date"),
+            emprestimos,
+        )
+        self.inserir(
+            "borrowal_history", ("book_id", "borrower_id", "action", "date"), historico
+        )
+        self.inserir("logs", ("action", "description", "timestamp"), logs)
+
+
+def gerar(args):
+    if os.path.exists(args.saida):
+        if not args.substituir:
+            raise SystemExit(f"{args.saida} já existe (use --substituir)")
+        for sufixo in ("", "-wal", "-shm"):
+            if os.path.exists(args.saida + sufixo):
+                os.remove(args.saida + sufixo)
+
+    engine = create_engine(f"sqlite:///{args.saida}")
+    try:
+        with open(SCRIPT_ESQUEMA, encoding="utf-8") as arquivo:
+            script = arquivo.read()
+        with engine.connect() as conexao:
+            conexao.connection.driver_connection.executescript(script)
+        with engine.begin() as conexao:
+            aplicar_migracoes(conexao)
+
+        with engine.connect() as conexao:
+            # Banco novo: sem journal nem fsync durante a carga
+            conexao.exec_driver_sql("PRAGMA journal_mode=OFF")
+            conexao.exec_driver_sql("PRAGMA synchronous=OFF")
+            conexao.exec_driver_sql("PRAGMA cache_size=-200000")
+            conexao.commit()
+
+            with conexao.begin():
+                # Triggers e índices explícitos saem durante a carga (os
+                # índices são recriados de uma vez, ordenando cada um só uma vez)
+                objetos = conexao.exec_driver_sql(
+                    "SELECT type, name, sql FROM sqlite_master"
+                    " WHERE type IN ('trigger', 'index') AND sql IS NOT NULL"
+                ).all()
+                for tipo, nome, _ in objetos:
+                    conexao.exec_driver_sql(f"DROP {tipo.upper()} {nome}")
+
+                # Descarta os empréstimos de exemplo (e o que os triggers
+                # gravaram com o horário atual) para que o resultado só
+                # dependa da semente
+                for tabela in (
+                    "borrowals",
+                    "borrowal_history",
+                    "logs",
+                    "cache_changes",
+                ):
+                    conexao.exec_driver_sql(f"DELETE FROM {tabela}")
+                conexao.exec_driver_sql(
+                    "DELETE FROM sqlite_sequence"
+                    " WHERE name IN ('borrowals', 'borrowal_history', 'logs')"
+                )
+                conexao.exec_driver_sql("DELETE FROM stock")
+                for tabela in ("authors", "borrowers"):
+                    conexao.exec_driver_sql(
+                        f"UPDATE {tabela} SET created_at = ?", (DATA_CADASTRO,)
+                    )
+                conexao.exec_driver_sql(
+                    "UPDATE table_versions SET version = ? WHERE table_name = '_epoch'",
+                    (args.semente,),
+                )
+
+                gerador = Gerador(conexao, args)
+                inicio = time.perf_counter()
+                gerador.catalogo()
+                logger.info(
+                    f"📚 Catálogo gerado em {time.perf_counter() - inicio:.1f}s"
+                )
+                inicio = time.perf_counter()
+                gerador.emprestimos()
+                logger.info(
+                    f"🔁 Empréstimos gerados em {time.perf_counter() - inicio:.1f}s"
+                )
+
+                # Índices, tabelas derivadas e triggers
+                for tipo, _, sql in objetos:
+                    if tipo == "index":
+                        conexao.exec_driver_sql(sql)
+                conexao.exec_driver_sql(
+                    "INSERT OR REPLACE INTO author_book_counts (author_id, total)"
+                    " SELECT author_id, COUNT(*) FROM books GROUP BY author_id"
+                )
+                reconstruir_indice_busca(conexao)
+                for tipo, _, sql in objetos:
+                    if tipo == "trigger":
+                        conexao.exec_driver_sql(sql)
+
+            conexao.exec_driver_sql("ANALYZE")
+            conexao.exec_driver_sql("PRAGMA journal_mode=WAL")
+    finally:
+        engine.dispose()
+    return gerador.contagem
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gerador de banco sintético")
+    parser.add_argument("--livros", type=quantidade, default=quantidade("10k"))
+    parser.add_argument("--autores", type=quantidade, help="Padrão: livros / 25")
+    parser.add_argument("--usuarios", type=quantidade, help="Padrão: livros / 10")
+    parser.add_argument("--emprestimos", type=quantidade, help="Padrão: 2 por livro")
+    parser.add_argument("--dias", type=int, default=730, help="Período simulado")
+    parser.add_argument(
+        "--ate",
+        type=date.fromisoformat,
+        default=date(2025, 6, 30),
+        help="Último dia simulado (fixo, para que o resultado seja reproduzível)",
+    )
+    parser.add_argument(
+        "--assimetria",
+        type=float,
+        default=3.0,
+        help="Expoente da procura por livros (1 = uniforme; maior = mais concentrada)",
+    )
+    parser.add_argument(
+        "--perdidos", type=float, default=0.02, help="Fração nunca devolvida"
+    )
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--saida", required=True, help="Arquivo do banco gerado")
+    parser.add_argument("--substituir", action="store_true")
+    args = parser.parse_args()
+
+    args.autores = args.autores or max(args.livros // 25, 10)
+    args.usuarios = args.usuarios or max(args.livros // 10, 10)
+    if args.emprestimos is None:
+        args.emprestimos = 2 * args.livros
+
+    inicio = time.perf_counter()
+    contagem = gerar(args)
+    relatorio = {
+        "saida": args.saida,
+        "semente": args.semente,
+        "linhas": contagem,
+        "duracao_s": round(time.perf_counter() - inicio, 1),
+        "tamanho_mb": round(os.path.getsize(args.saida) / 2**20, 1),
+    }
+    print(json.dumps(relatorio, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
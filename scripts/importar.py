@@ -0,0 +1,68 @@
+## Importa livros, autores ou usuários de um arquivo CSV ou NDJSON
+#
+#   python -m scripts.importar livros catalogo.csv
+#   python -m scripts.importar autores autores.ndjson --lote 5000
+#   BIBLIOTECA_DB_PATH=/caminho/outro.db python -m scripts.importar usuarios u.csv
+#
+# O formato é deduzido da extensão (.csv, .ndjson, .jsonl) ou de --formato.
+# O relatório (linhas, inseridas, erros por linha, linhas/s) é impresso em
+# JSON; --erros grava a lista completa de erros em outro arquivo.
+
+import argparse
+import asyncio
+import json
+import os
+
+from app.database import SessionEscrita, fechar_banco, logger, preparar_banco
+from app.importacao import ENTIDADES, TAMANHO_LOTE, importar
+
+TAMANHO_BLOCO = 1 << 20
+
+
+async def _ler(caminho):
+    with open(caminho, "rb") as arquivo:
+        while bloco := arquivo.read(TAMANHO_BLOCO):
+            yield bloco
+
+
+async def main(args):
+    await preparar_banco()
+    try:
+        async with SessionEscrita() as db:
+            relatorio = await importar(
+                db, args.entidade, _ler(args.arquivo), args.formato, args.lote
+            )
+    finally:
+        await fechar_banco()
+
+    logger.info(
+        f"📥 {relatorio['inseridas']} de {relatorio['linhas']} linhas importadas "
+        f"em {relatorio['duracao_s']}s ({relatorio['linhas_por_s']} linhas/s), "
+        f"{relatorio['com_erro']} com erro"
+    )
+    if args.erros:
+        with open(args.erros, "w") as arquivo:
+            json.dump(relatorio["erros"], arquivo, indent=2, ensure_ascii=False)
+    print(
+        json.dumps(
+            {**relatorio, "erros": relatorio["erros"][:20]},
+            indent=2,
+            ensure_ascii=False,
+        )
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Importação em massa")
+    parser.add_argument("entidade", choices=sorted(ENTIDADES))
+    parser.add_argument("arquivo")
+    parser.add_argument("--formato", choices=("csv", "ndjson"))
+    parser.add_argument("--lote", type=int, default=TAMANHO_LOTE)
+    parser.add_argument("--erros", help="Arquivo JSON para a lista de erros")
+    args = parser.parse_args()
+
+    if args.formato is None:
+        extensao = os.path.splitext(args.arquivo)[1].lower()
+        args.formato = "csv" if extensao == ".csv" else "ndjson"
+
+    asyncio.run(main(args))
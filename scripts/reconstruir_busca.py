@@ -0,0 +1,28 @@
+## Reconstrói o índice de busca textual (books_fts) de um banco existente
+#
+#   python -m scripts.reconstruir_busca
+#   BIBLIOTECA_DB_PATH=/caminho/outro.db python -m scripts.reconstruir_busca
+
+import asyncio
+import time
+
+from app.busca import reconstruir_indice_busca
+from app.database import engine_escrita, fechar_banco, logger, preparar_banco
+
+
+async def main():
+    # Garante que books_fts e seus triggers existam antes de reconstruir
+    await preparar_banco()
+
+    inicio = time.perf_counter()
+    async with engine_escrita.begin() as conn:
+        total = await conn.run_sync(reconstruir_indice_busca)
+    logger.info(
+        f"🔎 Índice de busca reconstruído: {total} livros "
+        f"em {time.perf_counter() - inicio:.2f}s"
+    )
+    await fechar_banco()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())